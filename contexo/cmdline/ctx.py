@@ -18,6 +18,8 @@ import os
 import os.path
 import shutil
 import string
+import sys
+import time
 from argparse import ArgumentParser
 import argparse
 from contexo import ctx_rspec
@@ -135,6 +137,54 @@ def getAccessPolicy( args ):
     return ap
 
 
+#------------------------------------------------------------------------------
+# Returns the object cache configured in the Contexo config file.
+#------------------------------------------------------------------------------
+def getObjectCache():
+    from contexo.ctx_objcache import CTXObjectCache, DEFAULT_SIZE_MB
+
+    cacheSize = cfgFile.getObjectCacheSize()
+    if cacheSize == None:
+        cacheSize = DEFAULT_SIZE_MB
+
+    return CTXObjectCache( cfgFile.getObjectCacheDir(), cacheSize )
+
+#------------------------------------------------------------------------------
+# Applies the build options shared by the build commands to the session and
+# the dependency manager. Object cache keys must be equal for equal sources in
+# different views, so the object cache requires content based dependency
+# checksums.
+#------------------------------------------------------------------------------
+def setupBuildSession( args, session, depmgr ):
+    session.setJobCount( args.jobs )
+    depmgr.setJobCount( args.jobs )
+    session.setBatchMode( args.batch )
+    session.setMinimalIncludePaths( args.min_incpaths )
+    session.setPrecompiledHeaders( args.pch )
+    session.setUnityBuild( args.unity, args.unity_size )
+
+    checksumMethod = cfgFile.getChecksumMethod()
+    if args.object_cache and checksumMethod not in ['MD5', 'HYBRID']:
+        checksumMethod = 'HYBRID'
+
+    if checksumMethod != None:
+        depmgr.setChecksumMethod( checksumMethod )
+
+    if args.object_cache:
+        session.setObjectCache( getObjectCache() )
+
+#------------------------------------------------------------------------------
+def closeObjectCache( session ):
+    if session.getObjectCache() != None:
+        session.getObjectCache().close()
+
+#------------------------------------------------------------------------------
+def reportIncludePathSavings( session ):
+    objects, before, after = session.getIncludePathSavings()
+    if objects != 0:
+        infoMessage("Include paths of %d object(s): %d -> %d commandline characters (%d%% shorter)"\
+                      %(objects, before, after, 100 * (before - after) / max(before, 1)), 1)
+
 #------------------------------------------------------------------------------
 # Creates and returns a list of CTXCodeModule objects from the provided list
 # of code module names. Unit tests are only enables for main modules (not for
@@ -151,7 +201,11 @@ def create_components( comp_filenames, component_paths ):
     return components
 
 #------------------------------------------------------------------------------
-def build_libraries( ctx_modules, lib_name, output_path, build_dir, session ):
+# Queues the libraries on the given build scheduler. Without a scheduler the
+# libraries are built before returning.
+#------------------------------------------------------------------------------
+def build_libraries( ctx_modules, lib_name, output_path, build_dir, session, scheduler = None ):
+    from contexo import ctx_base
 
     #
     # Build either one library of all modules, or one library for each module.
@@ -167,23 +221,17 @@ def build_libraries( ctx_modules, lib_name, output_path, build_dir, session ):
         for mod in ctx_modules:
             libs[mod.getName()] = [mod,]
 
+    run_scheduler = scheduler == None
+    if run_scheduler:
+        scheduler = ctx_base.CTXBuildScheduler( session )
+
     all_objects = list()
     for lib, mods in libs.iteritems():
-        ctx_log.ctxlogBeginLibrary( lib )
+        all_objects += scheduler.addLibrary( lib, mods, output_path, build_dir )
 
-        obj_list = list()
-        for mod in mods:
-            mod_objs = mod.buildStaticObjects( session, build_dir )
-            obj_list +=  mod_objs
+    if run_scheduler:
+        scheduler.run()
 
-        if len(obj_list) > 0:
-            session.buildStaticLibrary( obj_list, lib, output_path )
-        else:
-            warningMessage("No object files to create library '%s'"%(lib))
-
-        all_objects+= obj_list
-
-        ctx_log.ctxlogEndLibrary()
     return all_objects
 
 #------------------------------------------------------------------------------
@@ -220,7 +268,7 @@ def export_headers( depmgr, headers, headerDir ):
             warningMessage("Unable to locate header '%s' for export"%(header))
 
 #------------------------------------------------------------------------------
-def buildmodules( depmgr, session, modules, args, output_path, build_dir,  libraryName = None ):
+def buildmodules( depmgr, session, modules, args, output_path, build_dir,  libraryName = None, scheduler = None ):
     from contexo import ctx_base
     from contexo import ctx_envswitch
 
@@ -233,9 +281,47 @@ def buildmodules( depmgr, session, modules, args, output_path, build_dir,  libra
     ctx_modules = depmgr.createCodeModules( modules, args.tests, force=args.force )
     ctx_modules.extend ( depmgr.createCodeModules( dep_modules, force=args.force ) )
 
-    objs = build_libraries( ctx_modules, libraryName, output_path, build_dir, session )
+    objs = build_libraries( ctx_modules, libraryName, output_path, build_dir, session, scheduler )
     return objs
 
+#------------------------------------------------------------------------------
+# Counterpart of buildmodules for 'ctx build --plan'. The rebuild plan of
+# every object is added to 'plan' instead of building it.
+#------------------------------------------------------------------------------
+def planmodules( depmgr, session, modules, args, build_dir, plan ):
+    t0 = time.time()
+    depmgr.updateDependencyHash()
+
+    all_modules = depmgr.getCodeModulesWithDependencies() if args.deps else modules
+    all_modules.sort ()
+    dep_modules = set(all_modules) - set(modules)
+
+    ctx_modules = depmgr.createCodeModules( modules, args.tests, force=args.force )
+    ctx_modules.extend ( depmgr.createCodeModules( dep_modules, force=args.force ) )
+    plan['timing']['depscan'] += time.time() - t0
+
+    t0 = time.time()
+    for mod in ctx_modules:
+        plan['objects'].extend( mod.planStaticObjects( session, build_dir ) )
+    plan['timing']['checksum'] += time.time() - t0
+
+#------------------------------------------------------------------------------
+def print_plan( plan, planFormat ):
+    rebuilt = [ obj for obj in plan['objects'] if obj['rebuild'] ]
+    plan['total']   = len(plan['objects'])
+    plan['rebuild'] = len(rebuilt)
+
+    if planFormat == 'json':
+        import json
+        print json.dumps( plan, indent=1, sort_keys=True )
+        return
+
+    print "%d of %d object(s) would be rebuilt"%( len(rebuilt), len(plan['objects']) )
+    for obj in rebuilt:
+        print "  %s: %s"%( obj['object'], "; ".join(obj['reasons']) )
+    print "Dependency scan: %.3f s"%plan['timing']['depscan']
+    print "Checksumming:    %.3f s"%plan['timing']['checksum']
+
 #------------------------------------------------------------------------------
 def cmd_info(args):
     from contexo.ctx_depmgr import CTXDepMgr
@@ -307,8 +393,7 @@ def cmd_buildmod(args):
     session = ctx_base.CTXBuildSession( bc )
 
     session.setDependencyManager( depmgr )
-
-
+    setupBuildSession( args, session, depmgr )
 
     # Register build configuration in log handler
     ctx_log.ctxlogSetBuildConfig( bc.getTitle(),
@@ -320,6 +405,8 @@ def cmd_buildmod(args):
     output_path = os.path.join( args.output, args.libdir )
 
     buildmodules( depmgr, session, modules, args, output_path, bc.getTitle(),  libraryName = args.lib)
+    closeObjectCache( session )
+    reportIncludePathSavings( session )
 
     header_path = os.path.join(args.output, args.headerdir )
     export_public_module_headers( depmgr, modules, header_path )
@@ -361,6 +448,8 @@ def cmd_buildcomp(args):
     depmgr      = CTXDepMgr ( cview.getItemPaths('modules') ,  args.tolerate_missing_headers)
     session     = ctx_base.CTXBuildSession( bc )
     session.setDependencyManager( depmgr )
+    setupBuildSession( args, session, depmgr )
+    scheduler   = ctx_base.CTXBuildScheduler( session )
 
     # Register build configuration in log handler
     ctx_log.ctxlogSetBuildConfig( bc.getTitle(),
@@ -390,7 +479,7 @@ def cmd_buildcomp(args):
 
             args.lib = library
             infoMessage('args: %s'%args,  6)
-            buildmodules( depmgr, session,  modules,  args, lib_dir, session.bc.getTitle(),  libraryName = args.lib)
+            buildmodules( depmgr, session,  modules,  args, lib_dir, session.bc.getTitle(),  libraryName = args.lib, scheduler = scheduler )
 
             depmgr.emptyCodeModules()
 
@@ -398,6 +487,10 @@ def cmd_buildcomp(args):
 
         ctx_log.ctxlogEndComponent()
 
+    scheduler.run()
+    closeObjectCache( session )
+    reportIncludePathSavings( session )
+
     # Write log if requested
     if args.logfile != None:
         logfilepath = os.path.join( args.output, args.logfile )
@@ -426,6 +519,9 @@ def cmd_build(args):
         envLayout = EnvironmentLayout( cfgFile,  args.env )
         oldEnv    = switchEnvironment( envLayout, True )
 
+    if args.logfile != None:
+        ctx_log.ctxlogStart()
+
     absIncDirs = map(os.path.abspath,  args.incdirs)
 
     # Prepare all
@@ -437,6 +533,9 @@ def cmd_build(args):
     depmgr  = CTXDepMgr ( cview.getItemPaths('modules'),  args.tolerate_missing_headers, absIncDirs )
     session = ctx_base.CTXBuildSession( bc )
     session.setDependencyManager( depmgr )
+    setupBuildSession( args, session, depmgr )
+    scheduler = ctx_base.CTXBuildScheduler( session )
+    plan = { 'objects': list(), 'timing': { 'depscan': 0.0, 'checksum': 0.0 } }
 
     items = expand_list_files( cview, args.items )
 
@@ -477,22 +576,41 @@ def cmd_build(args):
                 depmgr.addCodeModules( modules, args.tests )
                 args.library_name = library
                 infoMessage('args: %s'%args,  6)
-                objs += buildmodules( depmgr, session,  modules,  args, bin_dir, session.bc.getTitle(),  args.library_name)
+                if args.plan:
+                    planmodules( depmgr, session, modules, args, session.bc.getTitle(), plan )
+                    depmgr.emptyCodeModules()
+                    continue
+                objs += buildmodules( depmgr, session,  modules,  args, bin_dir, session.bc.getTitle(),  args.library_name, scheduler )
 
                 if (args.all_headers):
                     header_path = os.path.join(args.output, args.headerdir )
                     export_public_module_headers( depmgr, modules, header_path )
 
                 depmgr.emptyCodeModules()
-            export_headers( depmgr, comp.publicHeaders, header_dir )
+            if not args.plan:
+                export_headers( depmgr, comp.publicHeaders, header_dir )
             ctx_log.ctxlogEndComponent()
 
     #Process modules
     else:
         infoMessage("building modules",  6)
         depmgr.addCodeModules( items, args.tests )
-        objs += buildmodules( depmgr, session, items, args, outputPath, bc.getTitle(),  libraryName=args.library_name)
-        export_public_module_headers( depmgr, items, header_dir )
+        if args.plan:
+            planmodules( depmgr, session, items, args, bc.getTitle(), plan )
+        else:
+            objs += buildmodules( depmgr, session, items, args, outputPath, bc.getTitle(),  libraryName=args.library_name, scheduler=scheduler)
+            export_public_module_headers( depmgr, items, header_dir )
+
+    if args.plan:
+        print_plan( plan, args.plan_format )
+        if args.env != None:
+            switchEnvironment( oldEnv, False )
+        return
+
+    # Wait for all libraries before linking.
+    scheduler.run()
+    closeObjectCache( session )
+    reportIncludePathSavings( session )
 
     if args.executable_name:
             session.linkExecutable(objs, bin_dir, args.executable_name)
@@ -512,6 +630,30 @@ def cmd_build(args):
         switchEnvironment( oldEnv, False )
 
 
+#------------------------------------------------------------------------------
+# Loads the export plugin 'name' for in-process use, looking in the plugins
+# of the Contexo installation first and then in the user plugins directory.
+#------------------------------------------------------------------------------
+def load_export_plugin( name ):
+    import imp
+    import contexo.plugins.export
+
+    if name.endswith( '.py' ):
+        name = name[:-3]
+
+    pluginDirs = [ os.path.dirname( os.path.abspath(contexo.plugins.export.__file__) ),
+                   os.path.join( ctx_common.getUserCfgDir(), 'plugins' ) ]
+
+    for pluginDir in pluginDirs:
+        pluginPath = os.path.join( pluginDir, name + '.py' )
+        if os.path.isfile( pluginPath ):
+            plugin = imp.load_source( 'ctx_export_plugin_' + name, pluginPath )
+            if not hasattr( plugin, 'export' ):
+                userErrorExit("Export plugin '%s' has no in-process entry point 'export( package, argv )'"%(pluginPath))
+            return plugin
+
+    userErrorExit("Unable to locate export plugin '%s' in %s"%(name, pluginDirs))
+
 #------------------------------------------------------------------------------
 def cmd_export(args):
     from contexo import ctx_cmod
@@ -570,11 +712,23 @@ def cmd_export(args):
 
     depmgr.updateDependencyHash()
 
-    # Dispatch export data to handler (through pipe)
     package = CTXExportData()
     package.setExportData( module_map, components, args.tests, session, depmgr,
                            cview, envLayout, args )
-    package.dispatch()
+
+    if args.plugin != None:
+        # Run the plugins in this process, all sharing the export data
+        import shlex
+        for pluginCmdline in args.plugin:
+            argv = shlex.split( pluginCmdline, posix = sys.platform != 'win32' )
+            if len(argv) == 0:
+                userErrorExit("Empty --plugin option")
+            plugin = load_export_plugin( argv[0] )
+            infoMessage("Running export plugin '%s'"%(argv[0]), 1)
+            plugin.export( package, argv[1:] )
+    else:
+        # Dispatch export data to handler (through pipe)
+        package.dispatch( slim = args.slim )
 
     # Restore environment
     if args.env != None:
@@ -709,6 +863,43 @@ def cmd_view(args):
         cview = ctx_view.CTXView ()
         cview.printView()
 
+#------------------------------------------------------------------------------
+def cmd_cache_stats(args):
+    cache = getObjectCache()
+    entries = cache.listEntries()
+    stats = cache.loadStats()
+
+    totalSize = 0
+    for mtime, size, path in entries:
+        totalSize += size
+
+    lookups = stats['hits'] + stats['misses']
+    hitRate = 0.0
+    if lookups != 0:
+        hitRate = 100.0 * stats['hits'] / lookups
+
+    print "Object cache: %s"%cache.cacheDir
+    print "  objects:  %d"%len(entries)
+    print "  size:     %.1f MB (limit %.1f MB)"%( totalSize / 1048576.0, cache.maxSize / 1048576.0 )
+    print "  hits:     %d"%stats['hits']
+    print "  misses:   %d"%stats['misses']
+    print "  hit rate: %.1f%%"%hitRate
+    print "  stored:   %d"%stats['stored']
+
+#------------------------------------------------------------------------------
+def cmd_cache_prune(args):
+    cache = getObjectCache()
+
+    maxSize = None
+    if args.size != None:
+        maxSize = args.size * 1024 * 1024
+
+    removed, freed = cache.prune( maxSize )
+    if args.reset_stats:
+        cache.resetStats()
+
+    print "Removed %d object(s), %.1f MB"%( removed, freed / 1048576.0 )
+
 #------------------------------------------------------------------------------
 def cmd_prop(args):
 
@@ -780,7 +971,14 @@ standard_description = dict({\
 '--repo-validation': "Validates all repositories before processing. This usually increases duration but ensures correct repository structure. Repository validation can also be done by running 'ctx view validate' as a separate step.",\
 '--no-remote-repo-access': "If specified, the system never tries to process items directly from an RSpec repository's remote location (href) even if so is possible. Normally, if a repository is accessible through regular file access, the system always tries to use it from its remote location.",\
 '--force':"Forces building all source files", \
-'--tolerate-missing-headers':"print a message about missing headers and go on, relying on the pre processor to resolve the problem"})
+'--jobs':"Number of processes to run in parallel, for compilation as well as for the dependency scan. Defaults to 1 (sequential build).",\
+'--min-incpaths':"Pass each source only the include paths its includes need, as found by the dependency scan, in their original order. Paths outside the dependency search paths are always kept. The dependency scan only follows quoted includes: a source including a file with a <system> include found in the view keeps all its include paths. Changing this option rebuilds all objects.",\
+'--pch':"Precompile the headers included by most sources of each module, using the PCHCOM/PCHCXXCOM, PCHSUFFIX and PCHUSE options of the CDEF, and use the precompiled header for the sources including all of them. Sources must not depend on macros defined before these headers are included. With --unity the headers are picked from the sources a unity source includes, and it uses the precompiled header if all of them do.",\
+'--unity':"Compile the sources of each module through generated unity sources including them, instead of one by one. Sources listed in the module file contexo/unity_exclude are compiled on their own.",\
+'--unity-size':"With --unity, the number of sources per unity source. Defaults to 0, one unity source per module and language.",\
+'--batch':"Compile the outdated sources of a module that share build parameters in one compiler invocation, using the BATCHCCCOM/BATCHCXXCOM commandlines of the CDEF (at most BATCH_MAXSOURCES sources each), run in the object directory unless they name the TARGETDIR. Sources are compiled one by one if the CDEF has no batch commandline.",\
+'--tolerate-missing-headers':"print a message about missing headers and go on, relying on the pre processor to resolve the problem",\
+'--object-cache':"Reuse object files from, and add built object files to, the user's object cache. Implies the HYBRID (content based) dependency checksum method unless CTX_CHECKSUM_METHOD is MD5."})
 
 
 # info parser
@@ -808,6 +1006,13 @@ parser_build.add_argument('-lf', '--logfile', default=None, help=standard_descri
 parser_build.add_argument('-rv', '--repo-validation', action='store_true', help=standard_description['--repo-validation'])
 parser_build.add_argument('-nra', '--no-remote-repo-access', action='store_true', help=standard_description['--no-remote-repo-access'])
 parser_build.add_argument('-f', '--force', action='store_true', help=standard_description['--force'])
+parser_build.add_argument('-j', '--jobs', type=int, default=1, help=standard_description['--jobs'])
+parser_build.add_argument('--batch', action='store_true', help=standard_description['--batch'])
+parser_build.add_argument('--min-incpaths', action='store_true', help=standard_description['--min-incpaths'])
+parser_build.add_argument('--pch', action='store_true', help=standard_description['--pch'])
+parser_build.add_argument('--unity', action='store_true', help=standard_description['--unity'])
+parser_build.add_argument('--unity-size', type=int, default=0, metavar='N', help=standard_description['--unity-size'])
+parser_build.add_argument('--object-cache', action='store_true', help=standard_description['--object-cache'])
 parser_build.add_argument('--tolerate-missing-headers',  action='store_true',  help = standard_description['--tolerate-missing-headers'])
 
 
@@ -827,6 +1032,13 @@ parser_build.add_argument('-lf', '--logfile', default=None, help=standard_descri
 parser_build.add_argument('-rv', '--repo-validation', action='store_true', help=standard_description['--repo-validation'])
 parser_build.add_argument('-nra', '--no-remote-repo-access', action='store_true', help=standard_description['--no-remote-repo-access'])
 parser_build.add_argument('-f', '--force', action='store_true', help=standard_description['--force'])
+parser_build.add_argument('-j', '--jobs', type=int, default=1, help=standard_description['--jobs'])
+parser_build.add_argument('--batch', action='store_true', help=standard_description['--batch'])
+parser_build.add_argument('--min-incpaths', action='store_true', help=standard_description['--min-incpaths'])
+parser_build.add_argument('--pch', action='store_true', help=standard_description['--pch'])
+parser_build.add_argument('--unity', action='store_true', help=standard_description['--unity'])
+parser_build.add_argument('--unity-size', type=int, default=0, metavar='N', help=standard_description['--unity-size'])
+parser_build.add_argument('--object-cache', action='store_true', help=standard_description['--object-cache'])
 parser_build.add_argument('--tolerate-missing-headers',  action='store_true',  help = standard_description['--tolerate-missing-headers'])
 
 
@@ -846,6 +1058,13 @@ parser_build.add_argument('-lf', '--logfile', default=None, help=standard_descri
 parser_build.add_argument('-rv', '--repo-validation', action='store_true', help=standard_description['--repo-validation'])
 parser_build.add_argument('-nra', '--no-remote-repo-access', action='store_true', help=standard_description['--no-remote-repo-access'])
 parser_build.add_argument('-f', '--force', action='store_true', help=standard_description['--force'])
+parser_build.add_argument('-j', '--jobs', type=int, default=1, help=standard_description['--jobs'])
+parser_build.add_argument('--batch', action='store_true', help=standard_description['--batch'])
+parser_build.add_argument('--min-incpaths', action='store_true', help=standard_description['--min-incpaths'])
+parser_build.add_argument('--pch', action='store_true', help=standard_description['--pch'])
+parser_build.add_argument('--unity', action='store_true', help=standard_description['--unity'])
+parser_build.add_argument('--unity-size', type=int, default=0, metavar='N', help=standard_description['--unity-size'])
+parser_build.add_argument('--object-cache', action='store_true', help=standard_description['--object-cache'])
 parser_build.add_argument('--tolerate-missing-headers',  action='store_true',  help = standard_description['--tolerate-missing-headers'])
 parser_build.add_argument('--all-headers', action='store_true', help = "export all public headers")
 parser_build.add_argument('-lib', '--library-name', help="(modules) build a single library, with the given name")
@@ -853,6 +1072,8 @@ parser_build.add_argument('-I',  '--incdirs', nargs='*',  default = [],  help =
 parser_build.add_argument('-exe', '--executable-name',  help = 'link the elements into a single executable')
 parser_build.add_argument('-L',  '--libdirs', nargs='*',  default = [],  help = "(linking) directories to search for libs")
 parser_build.add_argument('-l',  '--libs', nargs='*',  default = [],  help = "(linking) libraries to link in")
+parser_build.add_argument('--plan', action='store_true', help="don't build, list the objects that would be rebuilt and why")
+parser_build.add_argument('--plan-format', choices=['text', 'json'], default='text', help="output format of --plan")
 
 
 # clean parser
@@ -900,6 +1121,12 @@ for both ctx and the plugin:
 
 ctx export --help | msvc --help
 
+Plugins can also run within Contexo, which saves starting a second
+interpreter and transferring the data. Several plugins can share the
+same export this way:
+
+ctx export my.comp -bc my.bc --plugin "msvc -o out_folder" --plugin "andkmk @args.txt"
+
 ---------------------------------------------------------------------
 """
 
@@ -916,6 +1143,8 @@ parser_export.add_argument('-t', '--tests', action='store_true', help=standard_d
 parser_export.add_argument('-rv', '--repo-validation', action='store_true', help=standard_description['--repo-validation'])
 parser_export.add_argument('-nra', '--no-remote-repo-access', action='store_true', help=standard_description['--no-remote-repo-access'])
 parser_export.add_argument('--tolerate-missing-headers',  action='store_true',  help = standard_description['--tolerate-missing-headers'])
+parser_export.add_argument('--slim', action='store_true', help="Leave the dependency manager out of the dispatched export data, the DEPMGR item and the build session's reference to it are received as None. The bundled plugins don't need it, third party plugins may. Has no effect with --plugin.")
+parser_export.add_argument('--plugin', action='append', default=None, metavar='"PLUGIN [ARGS]"', help="Run the export plugin PLUGIN (e.g. msvc) within Contexo instead of dispatching the export data to stdout. The plugin arguments follow the name in the same quoted string. May be given several times to run several plugins on the same export.")
 
 #
 #
@@ -935,8 +1164,21 @@ parser_view_validate.set_defaults(func=cmd_validateview)
 parser_view_validate.add_argument('view', nargs='?', default=os.getcwd(), help="Relative or absolute path to a view directory. If omitted, current working directory is used.")
 parser_view_validate.add_argument('-nra', '--no-remote-repo-access', action='store_true', help="Repositories which can be remotely accessed are still invalidated if not present in view.")
 
+parser_cache = subparsers.add_parser( 'cache', help="Object cache operations" )
+cache_subparsers = parser_cache.add_subparsers()
+
+parser_cache_stats = cache_subparsers.add_parser('stats', help="Show object cache size and hit statistics")
+parser_cache_stats.set_defaults(func=cmd_cache_stats)
+
+parser_cache_prune = cache_subparsers.add_parser('prune', help="Evict least recently used objects from the object cache")
+parser_cache_prune.set_defaults(func=cmd_cache_prune)
+parser_cache_prune.add_argument('-s', '--size', type=int, default=None, help="Size in MB to shrink the cache to. Defaults to CTX_OBJECT_CACHE_SIZE from the config file. Use 0 to empty the cache.")
+parser_cache_prune.add_argument('--reset-stats', action='store_true', help="Reset the hit statistics as well.")
+
 ###############################################################################
 
-# Parse cmdline
-argsa=parser.parse_args()
-argsa.func(argsa)
+# Parse cmdline. The guard keeps worker processes started by multiprocessing
+# on Windows, which import this module, from running the command again.
+if __name__ == '__main__':
+    argsa=parser.parse_args()
+    argsa.func(argsa)
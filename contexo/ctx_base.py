@@ -12,7 +12,9 @@
 ###############################################################################
 
 import os
+import re
 import sys
+import copy
 import string
 import shutil
 import config
@@ -20,8 +22,20 @@ from platform.ctx_platform import *
 from ctx_common import *
 from ctx_log import *
 import ctx_depmgr
+from ctx_jobs import CTXJob, CTXJobPool
 import hashlib
 import time
+import atexit
+import tempfile
+import threading
+
+# Most sources passed to one compiler invocation in batch mode, unless the CDEF
+# sets BATCH_MAXSOURCES.
+DEFAULT_BATCH_MAXSOURCES = 32
+
+# A header goes into the precompiled header of a module if more than half of
+# the module sources, and at least this many, include it directly.
+PCH_MIN_SOURCES = 2
 
 #------------------------------------------------------------------------------
 # \class {CTXBuildParams}
@@ -73,8 +87,34 @@ class CTXBuildParams:
 
         return md.hexdigest()
 
+commandFileDir      = None
+commandFileDirLock  = threading.Lock()
+
+#:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+# Returns the private directory command files are written to. It is created
+# on first use and removed with its contents when the process exits.
+#
+def getCommandFileDir():
+    global commandFileDir
+
+    commandFileDirLock.acquire()
+    try:
+        if commandFileDir == None:
+            commandFileDir = tempfile.mkdtemp( prefix = 'ctxcmd' )
+            atexit.register( shutil.rmtree, commandFileDir, True )
+    finally:
+        commandFileDirLock.release()
+
+    return commandFileDir
+
 #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
-def prepareCommandFile( commandline,  commandfileName ):
+# Moves everything after the '%@' marker of a commandline into a command
+# file. Each call writes a file of its own, so concurrent tools and builds
+# never share one. Returns the new commandline and the path of the command
+# file, or the unchanged commandline and None if there is no marker. The
+# caller removes the file with removeCommandFile() after running the tool.
+#
+def prepareCommandFile( commandline ):
 
     marker = '%@'
 
@@ -82,34 +122,34 @@ def prepareCommandFile( commandline,  commandfileName ):
 
     if ix == -1:
         # No commandfile specified.
-        return commandline
+        return (commandline, None)
     elif commandline.find( marker, ix + len(marker) ) != -1:
         # Multiple (nested) commandfiles is currently not supported.
-        userErrorExit("Multiple '%s' symbols in ARCOM field is currently not supported.\n    File: %s"%(marker, self.cdefPath))
-
-    #cmdfilename = time.strftime("%y%H%M%S.txt", time.localtime())
-    cmdfilename = commandfileName
+        userErrorExit("Multiple '%s' symbols in commandline mask is currently not supported.\n    Commandline: %s"%(marker, commandline))
 
     # Extract the contents for the commandfile from commandline (everything superceeding the %@ symbol)
     sep = "\"\n\"" # CURRENTLY A HACK FOR IAR!
     cmdfile_contents = '"' + sep.join (commandline[ix+2:].split()) + sep;
     cmdfile_contents = cmdfile_contents.rstrip('"') # Remove the trailing quote
 
+    # write commandfile
+    fd, cmdfilename = tempfile.mkstemp( suffix = '.txt', prefix = 'cmd', dir = getCommandFileDir() )
+    cmdfile = os.fdopen( fd, 'w' )
+    cmdfile.write(cmdfile_contents)
+    cmdfile.close()
+
     # Exclude the contents we extracted from the commandline.
     commandline = commandline[0:ix+len(marker)]
 
     # Replace the %@ symbol with the commandfile's name
     commandline = commandline.replace( marker, cmdfilename )
 
-    # write commandfile
-    cmdfile = open( cmdfilename, 'w' )
-    #cmdfile_contents = os.path.normpath(cmdfile_contents.replace('"',""))#<-new code
-    cmdfile.write(cmdfile_contents)
-    cmdfile.close()
-
-    return commandline
-
+    return (commandline, cmdfilename)
 
+#:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+def removeCommandFile( cmdfilename ):
+    if cmdfilename != None and os.path.exists( cmdfilename ):
+        os.remove( cmdfilename )
 
 #------------------------------------------------------------------------------
 class CTXStaticObject:
@@ -119,6 +159,28 @@ class CTXStaticObject:
         self.filepath          = str
         self.buildParams       = CTXBuildParams()
         self.commandline       = str
+        self.checksum          = str()
+        self.checksumDetails   = list()
+        self.needRebuild       = False
+        self.cacheKey          = None
+
+#------------------------------------------------------------------------------
+# \class {CTXPrecompiledHeader}
+#
+# A generated header including the headers shared by most sources of a code
+# module, and its precompiled form. Only the sources in 'sources' use it,
+# through the 'useFlags' added to their compiler flags.
+#------------------------------------------------------------------------------
+class CTXPrecompiledHeader:
+    def __init__(self):
+        self.header            = str  # path of the generated header
+        self.headers           = list() # absolute paths of the included headers
+        self.filepath          = str  # path of the precompiled header
+        self.sources           = set()
+        self.buildParams       = CTXBuildParams()
+        self.commandline       = str
+        self.useFlags          = str
+        self.checksum          = str()
 
 #------------------------------------------------------------------------------
 class CTXCompiler:
@@ -131,7 +193,6 @@ class CTXCompiler:
         self.cdefTitle = str()
         self.cdefDesc  = str()
         self.usingCommandfile = False
-        self.stdCommandfileName = 'ctxcmdfile7363616c61646f.txt'
         self.validatedTools = list()
         #
 
@@ -158,7 +219,7 @@ class CTXCompiler:
 
         self.cdef = cdef_config.get_section( 'setup' )
 
-        cdefKeys = "LDCOM LD LDDIR LDLIB LDDIRPREFIX LDDIRSUFFIX LDLIBPREFIX CCCOM CXXCOM AR ARCOM ARCOM_METHOD CC CXX ECHO_SOURCES CFILESUFFIX CXXFILESUFFIX OBJSUFFIX CPPDEFPREFIX CPPDEFSUFFIX INCPREFIX INCSUFFIX LIBPREFIX LIBSUFFIX RANLIB".split()
+        cdefKeys = "LDCOM LD LDDIR LDLIB LDDIRPREFIX LDDIRSUFFIX LDLIBPREFIX CCCOM CXXCOM AR ARCOM ARCOM_METHOD CC CXX ECHO_SOURCES CFILESUFFIX CXXFILESUFFIX OBJSUFFIX CPPDEFPREFIX CPPDEFSUFFIX INCPREFIX INCSUFFIX LIBPREFIX LIBSUFFIX RANLIB BATCHCCCOM BATCHCXXCOM BATCH_MAXSOURCES PCHCOM PCHCXXCOM PCHSUFFIX PCHUSE ARCOM_UPDATE".split()
         for key in cdefKeys:
             if self.cdef.has_key(key) and type(self.cdef[key]) is str:
                 # strip quotation. Note that we only strip the outer quotations.
@@ -183,6 +244,10 @@ class CTXCompiler:
         if option not in self.cdef:
             self.cdef[option] = False
 
+        option = 'BATCH_MAXSOURCES'
+        if option not in self.cdef:
+            self.cdef[option] = DEFAULT_BATCH_MAXSOURCES
+
         #
         # Assert presence of mandatory options
         #
@@ -213,6 +278,14 @@ class CTXCompiler:
         if self.cdef['ARCOM'].find( '%AR' ) == -1:
             warningMessage("CDEF field 'AR' not found in field 'ARCOM'")
 
+        if self.cdef.has_key( 'ARCOM_UPDATE' ) and self.cdef['ARCOM_UPDATE'].find( '%AR' ) == -1:
+            warningMessage("CDEF field 'AR' not found in field 'ARCOM_UPDATE'")
+
+        try:
+            self.cdef['BATCH_MAXSOURCES'] = int( self.cdef['BATCH_MAXSOURCES'] )
+        except ValueError:
+            userErrorExit("Invalid value '%s' for CDEF option 'BATCH_MAXSOURCES'"%(self.cdef['BATCH_MAXSOURCES']))
+
 
     #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
     def validateTool( self, cdefItem ):
@@ -287,6 +360,130 @@ class CTXCompiler:
         if cplusplus: cmdline = self.cdef['CXXCOM']
         else:         cmdline = self.cdef['CCCOM']
 
+        cmdline = self.expandCompileMask( cmdline, cplusplus, [sourceFile], buildParams, outputDir, objFilename )
+
+        return cmdline
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Tells if the CDEF can compile several sources of the given language in
+    # one compiler invocation.
+    #
+    def supportsBatchCompile( self, cplusplus ):
+        key = 'BATCHCXXCOM' if cplusplus else 'BATCHCCCOM'
+        return self.cdef.has_key( key ) and len(self.cdef[key]) != 0
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Tells if the batch commandline of the given language must be run in the
+    # object directory. That is the case for compilers without an output
+    # directory option, which write the objects to the working directory: the
+    # mask then has no %TARGETDIR.
+    #
+    def batchCompilesInTargetDir( self, cplusplus ):
+        key = 'BATCHCXXCOM' if cplusplus else 'BATCHCCCOM'
+        return self.cdef[key].find( '%TARGETDIR' ) == -1
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Returns the commandline compiling all 'sourceFiles' into 'outputDir' in
+    # one invocation, and the command file to remove after running it (see
+    # prepareCommandFile). The sources must share build parameters and
+    # language, and their object files must be named by makeObjFileName().
+    # If the commandline is run in the object directory, relative include
+    # paths are made absolute.
+    #
+    def makeBatchObjectCommandline( self, sourceFiles, buildParams, outputDir ):
+
+        cplusplus = self.isCPPSource( sourceFiles[0] )
+
+        if cplusplus: cmdline = self.cdef['BATCHCXXCOM']
+        else:         cmdline = self.cdef['BATCHCCCOM']
+
+        if self.batchCompilesInTargetDir( cplusplus ):
+            buildParams = copy.copy( buildParams )
+            buildParams.incPaths = map( os.path.abspath, buildParams.incPaths )
+            buildParams.cflags = self.makeIncludeFlagsAbsolute( buildParams.cflags )
+            sourceFiles = map( os.path.abspath, sourceFiles )
+
+        cmdline = self.expandCompileMask( cmdline, cplusplus, sourceFiles, buildParams, outputDir, "" )
+
+        return prepareCommandFile( cmdline )
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Makes the relative paths of the include options (INCPREFIX) in 'cflags'
+    # absolute, for commandlines run in another working directory.
+    #
+    def makeIncludeFlagsAbsolute( self, cflags ):
+        prefix = self.cdef['INCPREFIX'].rstrip( '"' )
+        if len(prefix) == 0:
+            return cflags
+
+        def makeAbsolute( match ):
+            if match.group(1) != None:
+                return '%s"%s"'%( prefix, os.path.abspath( match.group(1) ) )
+            return prefix + os.path.abspath( match.group(2) )
+
+        pattern = re.compile( r'%s(?:"([^"]*)"|([^"\s]+))'%( re.escape(prefix) ) )
+        return pattern.sub( makeAbsolute, cflags )
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Compiles several sources in one compiler invocation, see
+    # makeBatchObjectCommandline(). Returns the compiler exit code.
+    #
+    def batchStaticObjects( self, sourceFiles, buildParams, outputDir ):
+        cplusplus = self.isCPPSource( sourceFiles[0] )
+        cwd = None
+        if self.batchCompilesInTargetDir( cplusplus ):
+            cwd = outputDir
+
+        commandline, cmdfile = self.makeBatchObjectCommandline( sourceFiles, buildParams, outputDir )
+        ret = executeCommandline( commandline, cwd )
+        removeCommandFile( cmdfile )
+        return ret
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Tells if the CDEF can precompile headers of the given language.
+    #
+    def supportsPrecompiledHeaders( self, cplusplus ):
+        key = 'PCHCXXCOM' if cplusplus else 'PCHCOM'
+        for option in [key, 'PCHSUFFIX', 'PCHUSE']:
+            if not self.cdef.has_key( option ) or len(self.cdef[option]) == 0:
+                return False
+        return True
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def makePrecompiledHeaderFileName( self, headerFile ):
+        return headerFile + self.cdef['PCHSUFFIX']
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def makePrecompiledHeaderCommandline( self, headerFile, cplusplus, buildParams ):
+
+        if cplusplus: cmdline = self.cdef['PCHCXXCOM']
+        else:         cmdline = self.cdef['PCHCOM']
+
+        pchFile = self.makePrecompiledHeaderFileName( headerFile )
+        cmdline = self.expandCompileMask( cmdline, cplusplus, [headerFile], buildParams, os.path.dirname(pchFile), os.path.basename(pchFile) )
+
+        return cmdline
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Returns the compiler flags making a source use a precompiled header.
+    #
+    def makePrecompiledHeaderUseFlags( self, headerFile ):
+        flags = self.cdef['PCHUSE']
+        flags = flags.replace( '%PCHHEADER', headerFile )
+        flags = flags.replace( '%PCHFILE'  , self.makePrecompiledHeaderFileName( headerFile ) )
+        return flags
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def makeIncludePathsCommandline( self, incPaths ):
+        incpaths_cmdline = str()
+        for incpath in incPaths:
+            incpath_dec = " %s%s%s"%( self.cdef['INCPREFIX'], incpath, self.cdef['INCSUFFIX'] )
+            incpaths_cmdline += incpath_dec
+        return incpaths_cmdline
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def expandCompileMask( self, cmdline, cplusplus, sourceFiles, buildParams, outputDir, objFilename ):
+
         #
         # Prepare preproessor definitions
         #
@@ -311,18 +508,16 @@ class CTXCompiler:
         # Prepare include paths
         #
 
-        incpaths_cmdline = str()
-        buildParams.incPaths #TODO: wathe??
-        for incpath in buildParams.incPaths:
-            incpath_dec = " %s%s%s"%( self.cdef['INCPREFIX'], incpath, self.cdef['INCSUFFIX'] )
-            incpaths_cmdline += incpath_dec
+        incpaths_cmdline = self.makeIncludePathsCommandline( buildParams.incPaths )
 
 
         #
         # Prepare sourcefile spec
         #
 
-        srcfile_cmdline = " %s"%( sourceFile )
+        srcfile_cmdline = str()
+        for sourceFile in sourceFiles:
+            srcfile_cmdline += " %s"%( sourceFile )
 
 
         #
@@ -371,26 +566,36 @@ class CTXCompiler:
         return obj
 
     #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
-    def staticObject( self, sourceFile, buildParams, outputDir, objFileTitle = None ):
+    def prepareStaticObject( self, sourceFile, buildParams, outputDir, objFileTitle = None ):
         if not os.path.exists( sourceFile ):
             userErrorExit("Sourcefile not found: %s"%sourceFile)
 
+        objFileName = self.makeObjFileName( sourceFile, objFileTitle )
+        commandline = self.makeStaticObjectCommandline( sourceFile, buildParams, outputDir, objFileName )
+
+        obj = self.wrapStaticObject( sourceFile, objFileName, outputDir, buildParams, commandline )
+
+        return obj
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def echoSource( self, sourceFile ):
         if self.cdef['ECHO_SOURCES'] == True:
             print os.path.basename( sourceFile )
 
-        objFileName = self.makeObjFileName( sourceFile, objFileTitle )
-        commandline = self.makeStaticObjectCommandline( sourceFile, buildParams, outputDir, objFileName )
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def staticObject( self, sourceFile, buildParams, outputDir, objFileTitle = None ):
+        obj = self.prepareStaticObject( sourceFile, buildParams, outputDir, objFileTitle )
 
-        ret = executeCommandline( commandline )
-        if ret != 0:
-            userErrorExit("\nFailed to create static object '%s'\nCompiler return code: %d"%(objFileName, ret))
+        self.echoSource( sourceFile )
 
-        obj = self.wrapStaticObject( sourceFile, objFileName, outputDir, buildParams, commandline )
+        ret = executeCommandline( obj.commandline )
+        if ret != 0:
+            userErrorExit("\nFailed to create static object '%s'\nCompiler return code: %d"%(obj.filename, ret))
 
         return obj
 
     #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
-    def makeStaticLibraryCommandline( self, objectFiles, libTitle, outputDir ):
+    def makeStaticLibraryCommandline( self, objectFiles, libTitle, outputDir, mask = None ):
 
         # Prepare object files
         objfiles_cmdline = str()
@@ -400,10 +605,11 @@ class CTXCompiler:
             objfiles_cmdline += " %s"%objPath
 
         # Prepare library
-        lib_cmdline = "%s%s%s"%( self.cdef['LIBPREFIX'], libTitle, self.cdef['LIBSUFFIX'] )
-        lib_cmdline = os.path.normpath(os.path.join( outputDir, lib_cmdline ))
+        lib_cmdline = os.path.normpath( self.makeStaticLibraryPath( libTitle, outputDir ) )
 
-        cmdline = self.cdef['ARCOM']
+        cmdline = mask
+        if cmdline == None:
+            cmdline = self.cdef['ARCOM']
 
         cmdline = cmdline.replace( '%AR'     , self.cdef['AR'] )
         cmdline = cmdline.replace( '%TARGET' , lib_cmdline )
@@ -411,29 +617,61 @@ class CTXCompiler:
 
         self.validateTool( 'AR' )
 
-        cmdline = prepareCommandFile( cmdline,  self.stdCommandfileName )
+        return prepareCommandFile( cmdline )
 
-        return cmdline
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def makeStaticLibraryPath( self, libraryTitle, outputDir ):
+        libName = "%s%s%s"%( self.cdef['LIBPREFIX'], libraryTitle, self.cdef['LIBSUFFIX'] )
+        return os.path.join( outputDir, libName )
 
     #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
-    def staticLibrary( self, objectFiles, libraryTitle, outputDir ):
+    # Tells if the CDEF can replace members of an existing library, through
+    # the ARCOM_UPDATE commandline mask.
+    #
+    def supportsLibraryUpdate( self ):
+        return self.cdef.has_key( 'ARCOM_UPDATE' ) and len(self.cdef['ARCOM_UPDATE']) != 0
 
-        libName = "%s%s%s"%( self.cdef['LIBPREFIX'], libraryTitle, self.cdef['LIBSUFFIX'] )
-        libPath = os.path.join( outputDir, libName )
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Returns a checksum of the CDEF options used to create libraries.
+    #
+    def makeStaticLibraryToolChecksum( self ):
+        return mergeChecksums( [ str(self.cdef.get(key, '')) for key in ['AR', 'ARCOM', 'ARCOM_METHOD', 'ARCOM_UPDATE', 'RANLIB'] ] )
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Creates a static library of 'objectFiles', replacing any existing one.
+    # With 'update' set, the objects are instead added to or replaced in the
+    # existing library using ARCOM_UPDATE (see supportsLibraryUpdate).
+    #
+    def staticLibrary( self, objectFiles, libraryTitle, outputDir, update = False ):
 
-        if self.cdef['ARCOM_METHOD'].upper() == 'APPEND':
+        libPath = self.makeStaticLibraryPath( libraryTitle, outputDir )
+
+        if update:
+            commandline, cmdfile = self.makeStaticLibraryCommandline( objectFiles, libraryTitle, outputDir, self.cdef['ARCOM_UPDATE'] )
+            ret = executeCommandline( commandline )
+            removeCommandFile( cmdfile )
+            if ret != 0:
+                userErrorExit("\nFailed to update static library '%s'\nar command line:\n%s\nar return code: %d"%(libPath, commandline,  ret))
+
+        elif self.cdef['ARCOM_METHOD'].upper() == 'APPEND':
             if os.path.exists( libPath ):
                 os.remove( libPath )
 
             for objectFile in objectFiles:
-                commandline = self.makeStaticLibraryCommandline( [objectFile,], libraryTitle, outputDir )
+                commandline, cmdfile = self.makeStaticLibraryCommandline( [objectFile,], libraryTitle, outputDir )
                 ret = executeCommandline( commandline )
+                removeCommandFile( cmdfile )
                 if ret != 0:
                     userErrorExit("\nFailed to append '%s' to static library '%s'\nar return code: %d"%(objectFile.filename, libPath, ret))
 
         elif self.cdef['ARCOM_METHOD'].upper() == 'REPLACE':
-            commandline = self.makeStaticLibraryCommandline( objectFiles, libraryTitle, outputDir )
+            # Members of objects no longer built must not linger in the library.
+            if os.path.exists( libPath ):
+                os.remove( libPath )
+
+            commandline, cmdfile = self.makeStaticLibraryCommandline( objectFiles, libraryTitle, outputDir )
             ret = executeCommandline( commandline )
+            removeCommandFile( cmdfile )
             if ret != 0:
                 userErrorExit("\nFailed to create static library '%s'\nar command line:\n%s\nar return code: %d"%(libPath, commandline,  ret))
         else:
@@ -448,9 +686,6 @@ class CTXCompiler:
             # Returnvalue is ignored since RANLIB by "de facto" always returns 0.
             executeCommandline( commandline )
 
-        if os.path.exists( self.stdCommandfileName ):
-            os.remove( self.stdCommandfileName )
-
         return ret
 
 #------------------------------------------------------------------------------
@@ -470,6 +705,15 @@ class CTXBuildSession:
         self.buildParams    = CTXBuildParams()
         self.preloadModules = list()
         self.depMgr         = None #ctx_depmgr.CTXDepMgr()
+        self.jobCount       = 1
+        self.objectCache    = None
+        self.batchMode      = False
+        self.minimalIncludePaths = False
+        self.precompiledHeaders  = False
+        self.unityBuild          = False
+        self.unitySize           = 0 # sources per unity source, 0 for one per module
+        self.includePathLists    = dict() # { tuple( paths ) : list( paths ) } shared by equal objects
+        self.includePathStats    = [0, 0, 0] # objects, include path characters before and after minimizing
         #self.sysVars        = getSystemConfig()
         #self.msgSender      = 'CTXBuildSession'
 
@@ -497,9 +741,108 @@ class CTXBuildSession:
     def getDependencyManager(self):
         return self.depMgr
 
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def setJobCount( self, jobCount ):
+        if jobCount < 1:
+            userErrorExit("Invalid job count: %d"%(jobCount))
+        self.jobCount = jobCount
+
+    def getJobCount( self ):
+        return self.jobCount
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def setBatchMode( self, batchMode ):
+        self.batchMode = batchMode
+
+    def getBatchMode( self ):
+        return self.batchMode
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def setPrecompiledHeaders( self, precompiledHeaders ):
+        self.precompiledHeaders = precompiledHeaders
+
+    def getPrecompiledHeaders( self ):
+        return self.precompiledHeaders
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def setUnityBuild( self, unityBuild, unitySize = 0 ):
+        if unitySize < 0:
+            userErrorExit("Invalid unity size: %d"%(unitySize))
+        self.unityBuild = unityBuild
+        self.unitySize  = unitySize
+
+    def getUnityBuild( self ):
+        return self.unityBuild
+
+    def getUnitySize( self ):
+        return self.unitySize
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def setMinimalIncludePaths( self, minimalIncludePaths ):
+        self.minimalIncludePaths = minimalIncludePaths
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Returns the number of objects whose include paths were minimized, and
+    # the commandline length of their include paths before and after.
+    #
+    def getIncludePathSavings( self ):
+        return tuple( self.includePathStats )
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Reduces the joined include paths of a source to those its includes
+    # need, keeping their order. Paths outside the dependency search paths
+    # are kept, as they may serve <system> includes the dependency manager
+    # doesn't follow. All paths are kept if a file the source includes has a
+    # <system> include found in the search paths. Equal lists are shared by
+    # all objects using them, and must not be modified.
+    #
+    def minimizeIncludePaths( self, srcFile, incPaths ):
+        required = self.depMgr.getMinimalIncludePaths( srcFile )
+        if required == None:
+            required = set()
+            searched = set()
+        else:
+            required = set( map(os.path.normpath, required) )
+            searched = set( map(os.path.normpath, self.depMgr.getDependSearchPaths()) )
+
+        minimal = list()
+        seen    = set()
+        for path in incPaths:
+            normPath = os.path.normpath( path )
+            if normPath in seen:
+                continue
+            seen.add( normPath )
+            if normPath in required or normPath not in searched:
+                minimal.append( normPath )
+
+        minimal = self.includePathLists.setdefault( tuple(minimal), minimal )
+
+        self.includePathStats[0] += 1
+        self.includePathStats[1] += len( self.compiler.makeIncludePathsCommandline(incPaths) )
+        self.includePathStats[2] += len( self.compiler.makeIncludePathsCommandline(minimal) )
+
+        return minimal
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def setObjectCache( self, objectCache ):
+        self.objectCache = objectCache
+
+    def getObjectCache( self ):
+        return self.objectCache
+
     #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
     def makeStaticObjectChecksum( self, sourceFile, buildParamsChecksum ):
+        return self.makeStaticObjectChecksumDetails( sourceFile, buildParamsChecksum )[0]
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Returns the object checksum along with the checksums it was merged
+    # from, as a list of ('params', checksum) and ('file', checksum, path)
+    # records. The records are stored next to the checksum so that the reason
+    # of a rebuild can be told later.
+    #
+    def makeStaticObjectChecksumDetails( self, sourceFile, buildParamsChecksum ):
         checksumList = list()
+        details      = list()
 
         includeFiles = self.depMgr.getDependencies( sourceFile )
 
@@ -508,9 +851,11 @@ class CTXBuildSession:
 
             checksum = self.depMgr.getDependenciesChecksum( incFile )
             checksumList.append( checksum )
+            details.append( ('file', checksum, incFile) )
 
         checksumList.append( buildParamsChecksum )
-        return mergeChecksums( checksumList )
+        details.append( ('params', buildParamsChecksum) )
+        return (mergeChecksums( checksumList ), details)
 
     #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
     def makeChecksumPath( self, objectFilename ):
@@ -518,12 +863,15 @@ class CTXBuildSession:
         return checksumPath
 
     #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # The object checksum is the first line of the checksum file, the
+    # remaining lines (if any) are the details it was made from.
+    #
     def readStaticObjectChecksum( self, objectFilename ):
         oldChecksum = str()
         checksumPath = self.makeChecksumPath( objectFilename )
         if os.path.exists(checksumPath) and os.path.isfile(checksumPath):
             f = open( checksumPath, "r" )
-            oldChecksum = f.read()
+            oldChecksum = f.readline().rstrip( "\r\n" )
             f.close()
             found = True
         else:
@@ -532,10 +880,39 @@ class CTXBuildSession:
         return oldChecksum
 
     #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
-    def writeStaticObjectChecksum( self, objectFilename, checksum ):
+    # Returns (checksum, details) from the checksum file of an object, with
+    # details in the format of makeStaticObjectChecksumDetails(). Returns None
+    # if there is no checksum file.
+    #
+    def readStaticObjectChecksumDetails( self, objectFilename ):
+        checksumPath = self.makeChecksumPath( objectFilename )
+        if not os.path.isfile( checksumPath ):
+            return None
+
+        f = open( checksumPath, "r" )
+        lines = f.read().splitlines()
+        f.close()
+
+        if len(lines) == 0:
+            return None
+
+        details = list()
+        for line in lines[1:]:
+            fields = line.split( ' ', 2 )
+            if fields[0] == 'file' and len(fields) == 3:
+                details.append( tuple(fields) )
+            elif fields[0] == 'params' and len(fields) == 2:
+                details.append( tuple(fields) )
+
+        return (lines[0], details)
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def writeStaticObjectChecksum( self, objectFilename, checksum, details = None ):
         checksumPath = self.makeChecksumPath( objectFilename )
         f = open( checksumPath, "w" )
-        oldChecksum = f.write(checksum)
+        f.write(checksum)
+        for record in assureList( details ):
+            f.write( "\n" + " ".join(record) )
         f.close()
 
     def linkExecutable(self,  objects,  outputDir,   exeFilename):
@@ -580,17 +957,62 @@ class CTXBuildSession:
         cmdline = cmdline.replace( '%TARGET'      ,   exefile_cmdline     )
 
         tool = 'LD' #'CXX' if cplusplus else 'CC'
+
+        linkChecksum = self.makeLinkChecksum( objects, cmdline )
+        if os.path.exists( exefile_cmdline ):
+            if self.readStaticObjectChecksum( exefile_cmdline ) == linkChecksum:
+                infoMessage("Reusing '%s', no link input changed"%(exeFilename), 1)
+                ctxlogAddExecutable( exefile_cmdline, False, "up to date" )
+                return
+            reason = "inputs changed"
+        else:
+            reason = "new executable"
+
+        checksumPath = self.makeChecksumPath( exefile_cmdline )
+        if os.path.exists( checksumPath ):
+            os.remove( checksumPath )
+
         infoMessage('from ' + os.getcwd() + ' executing: ' + cmdline,  6)
-        linkCommandFileName = 'linkCmdFileName096848hf434qas.file'
-        cmdline = prepareCommandFile( cmdline,  linkCommandFileName )
+        cmdline, cmdfile = prepareCommandFile( cmdline )
         ret = executeCommandline( cmdline )
+        removeCommandFile( cmdfile )
         if ret != 0:
             userErrorExit("\nFailed to link: '%s'\nCompiler return code: %d"%(cmdline, ret))
-        if os.path.exists(linkCommandFileName):
-            os.remove(linkCommandFileName)
         #self.validateTool( 'LD' )
 
-        pass
+        self.writeStaticObjectChecksum( exefile_cmdline, linkChecksum )
+        ctxlogAddExecutable( exefile_cmdline, True, reason )
+
+    #
+    # Returns the checksum of everything an executable is linked from: the
+    # link commandline (which names the objects, library dirs and libraries),
+    # the link flags, the checksum, size and modification time of each
+    # object, and the size and modification time of each library found in
+    # the library dirs. Libraries only found in the linker's default
+    # directories are not covered.
+    #
+    def makeLinkChecksum( self, objects, commandline ):
+        checksumList = [ commandline, self.buildParams.ldFlags ]
+
+        for obj in objects:
+            objPath = os.path.join( obj.filepath, obj.filename )
+            checksumList.append( obj.checksum )
+            if os.path.exists( objPath ):
+                st = os.stat( objPath )
+                checksumList.append( "%d %d"%(st.st_size, st.st_mtime) )
+
+        for ldDir in self.buildParams.ldDirs:
+            if not os.path.isdir( ldDir ):
+                continue
+            names = listDirCached( ldDir )
+            for lib in self.buildParams.ldLibs:
+                for name in names:
+                    root = name.split( '.' )[0]
+                    if root == lib or root == 'lib' + lib:
+                        st = os.stat( os.path.join(ldDir, name) )
+                        checksumList.append( "%s %d %d"%(name, st.st_size, st.st_mtime) )
+
+        return mergeChecksums( checksumList )
 
 
 #    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
@@ -647,29 +1069,158 @@ class CTXBuildSession:
 #        return objectFileList
 
     #
-    # Builds a source file and returns a CTXStaticObject.
+    # Selects the headers for the precompiled header of a code module and
+    # computes its checksum, without touching the disk. Only sources of the
+    # language most sources are written in take part. The unity sources among
+    # 'srcFiles' are given by 'members', as { unity source : [source, ...] }:
+    # the headers are picked from the sources they include, and a unity source
+    # uses the precompiled header if all of these do. Returns a
+    # CTXPrecompiledHeader, or None if the CDEF can't precompile headers or no
+    # header is shared by enough sources.
     #
-    def buildStaticObject( self, srcFile, outputDir, buildParams = None, forceRebuild = False ):
-        objFileTitle = None
+    def resolvePrecompiledHeader( self, title, srcFiles, outputDir, buildParams = None, members = None ):
+        srcFiles = assureList( srcFiles )
+        if members == None:
+            members = dict()
+
+        cplusplus = [ self.compiler.isCPPSource(src) for src in srcFiles ].count( True ) * 2 > len(srcFiles)
+        if not self.compiler.supportsPrecompiledHeaders( cplusplus ):
+            return None
+
+        sources = list()
+        for src in srcFiles:
+            if self.compiler.isCPPSource(src) == cplusplus:
+                sources.extend( members.get( src, [src] ) )
+
+        counts    = dict() # { header : number of sources including it }
+        positions = dict() # { header : sum of its positions in the include lists }
+        for src in sources:
+            seen = set()
+            for pos, (name, path) in enumerate( self.depMgr.getDirectIncludes(src) ):
+                if path in seen or path in srcFiles or path in sources:
+                    continue
+                seen.add( path )
+                counts[path]    = counts.get( path, 0 ) + 1
+                positions[path] = positions.get( path, 0 ) + pos
+
+        headers = [ path for path, count in counts.iteritems() if count * 2 > len(sources) and count >= PCH_MIN_SOURCES ]
+        if len(headers) == 0:
+            return None
+
+        # Keep the usual include order, as far as the sources agree on one.
+        headers.sort( key = lambda path: (float(positions[path]) / counts[path], path) )
+
+        pch = CTXPrecompiledHeader()
+        pch.header   = os.path.join( outputDir, "%s_pch.h"%(title) )
+        pch.headers  = headers
+        pch.filepath = self.compiler.makePrecompiledHeaderFileName( pch.header )
+
+        # A source can only use the precompiled header if it includes all of
+        # its headers anyway.
+        for src in srcFiles:
+            if self.compiler.isCPPSource(src) != cplusplus:
+                continue
+            if all( set( headers ).issubset( self.depMgr.getDependencies(member) ) for member in members.get( src, [src] ) ):
+                pch.sources.add( src )
+
+        pch.buildParams.incPaths.extend( self.depMgr.getIncludePaths( headers ) )
+        pch.buildParams.add( self.buildParams )
+        if buildParams != None:
+            pch.buildParams.add( buildParams )
+
+        pch.commandline = self.compiler.makePrecompiledHeaderCommandline( pch.header, cplusplus, pch.buildParams )
+        pch.useFlags    = self.compiler.makePrecompiledHeaderUseFlags( pch.header )
+
+        checksumList = [ pch.buildParams.makeChecksum(), pch.commandline ]
+        for header in headers:
+            checksumList.append( header )
+            for incFile in sorted( self.depMgr.getDependencies(header) ):
+                checksumList.append( self.depMgr.getDependenciesChecksum(incFile) )
+        pch.checksum = mergeChecksums( checksumList )
+
+        return pch
 
+    #
+    # Resolves the precompiled header of a code module (see
+    # resolvePrecompiledHeader) and precompiles it if it is outdated. A header
+    # failing to precompile is reported, and the module is built without it.
+    #
+    def preparePrecompiledHeader( self, title, srcFiles, outputDir, buildParams = None, forceRebuild = False, members = None ):
+        pch = self.resolvePrecompiledHeader( title, srcFiles, outputDir, buildParams, members )
+        if pch == None or len(pch.sources) == 0:
+            return None
+
+        if forceRebuild == False and os.path.exists( pch.filepath ):
+            if self.readStaticObjectChecksum( pch.filepath ) == pch.checksum:
+                infoMessage("Reusing '%s'"%(os.path.basename(pch.filepath)), 3)
+                return pch
+
+        if not os.path.isdir( outputDir ):
+            os.makedirs( outputDir )
+
+        checksumPath = self.makeChecksumPath( pch.filepath )
+        if os.path.exists( checksumPath ):
+            os.remove( checksumPath )
+
+        f = open( pch.header, "w" )
+        f.write( "/* Generated by Contexo, precompiled into %s */\n"%(os.path.basename(pch.filepath)) )
+        for header in pch.headers:
+            f.write( '#include "%s"\n'%(header.replace('\\', '/')) )
+        f.close()
+
+        self.compiler.echoSource( pch.header )
+        ret = executeCommandline( pch.commandline )
+        if ret != 0:
+            warningMessage("Failed to precompile '%s', compiler return code: %d. Building without it."%(os.path.basename(pch.header), ret))
+            return None
+
+        self.writeStaticObjectChecksum( pch.filepath, pch.checksum )
+        return pch
+
+    #
+    # Joins the build parameters of a source file and computes its object
+    # checksum. Returns (buildParams, checksum, checksumDetails, objectFilename).
+    # A source using the precompiled header 'pch' gets its flags, and its
+    # object checksum covers the checksum of the precompiled header.
+    #
+    def resolveStaticObject( self, srcFile, buildParams = None, pch = None ):
         joinedBuildParams = CTXBuildParams()
         joinedBuildParams.incPaths.extend( self.depMgr.getIncludePaths( [srcFile] ) )
 
         joinedBuildParams.add( self.buildParams )
         if buildParams != None:
             joinedBuildParams.add( buildParams )
+
+        if self.minimalIncludePaths:
+            joinedBuildParams.incPaths = self.minimizeIncludePaths( srcFile, joinedBuildParams.incPaths )
         infoMessage("Joined include paths: %s"%(", ".join(joinedBuildParams.incPaths)), 7)
 
-        buildParamsChecksum = joinedBuildParams.makeChecksum()
+        if pch != None and srcFile in pch.sources:
+            joinedBuildParams.cflags = "%s %s"%( joinedBuildParams.cflags, pch.useFlags )
 
-        needRebuild     = True
+        buildParamsChecksum = joinedBuildParams.makeChecksum()
+        if pch != None and srcFile in pch.sources:
+            buildParamsChecksum = mergeChecksums( [buildParamsChecksum, pch.checksum] )
 
         assert( os.path.isabs(srcFile) )
-        srcFile1 = srcFile #self.depMgr.getFullPathname( srcFile )
 
-        objChecksum     = self.makeStaticObjectChecksum( srcFile1, buildParamsChecksum )
-        objectFilename  = self.compiler.makeObjFileName( srcFile1, objFileTitle )
+        objChecksum, details = self.makeStaticObjectChecksumDetails( srcFile, buildParamsChecksum )
+        objectFilename       = self.compiler.makeObjFileName( srcFile, None )
+
+        return (joinedBuildParams, objChecksum, details, objectFilename)
+
+    #
+    # Resolves the build parameters and checksum of a source file and returns
+    # a CTXStaticObject, without running the compiler. 'needRebuild' tells if
+    # the object has to be compiled using 'commandline'.
+    #
+    def prepareStaticObject( self, srcFile, outputDir, buildParams = None, forceRebuild = False, pch = None ):
+        objFileTitle = None
 
+        joinedBuildParams, objChecksum, details, objectFilename = self.resolveStaticObject( srcFile, buildParams, pch )
+
+        needRebuild     = True
+        srcFile1 = srcFile #self.depMgr.getFullPathname( srcFile )
 
         if forceRebuild == False:
             objectFilePath  = os.path.join( outputDir, objectFilename )
@@ -681,19 +1232,458 @@ class CTXBuildSession:
                 infoMessage("Object '%s' invalidated by checksum.\nNew: %s\nOld: %s"\
                               %(objectFilename, objChecksum, oldChecksum), 4)
 
+        cacheKey = None
+        if needRebuild and self.objectCache != None:
+            objectFilePath = os.path.join( outputDir, objectFilename )
+            cacheKey = self.objectCache.makeKey( objChecksum, objectFilename, self.compiler.cdef )
+            if self.objectCache.fetch( cacheKey, objectFilePath ):
+                self.writeStaticObjectChecksum( objectFilePath, objChecksum, details )
+                needRebuild = False
+                infoMessage("Fetched '%s' from object cache"%(objectFilename), 3)
+
         if needRebuild:
-            obj = self.compiler.staticObject( srcFile1, joinedBuildParams, outputDir, objFileTitle )
-            self.writeStaticObjectChecksum( os.path.join(obj.filepath,obj.filename), objChecksum )
+            obj = self.compiler.prepareStaticObject( srcFile1, joinedBuildParams, outputDir, objFileTitle )
         else:
             obj = self.compiler.wrapStaticObject( srcFile1, objectFilename, outputDir, buildParams, "n/a" )
 
+        obj.checksum        = objChecksum
+        obj.checksumDetails = details
+        obj.needRebuild     = needRebuild
+        obj.cacheKey        = cacheKey
         return obj
 
+    #
+    # Tells whether the object of a source file is outdated, and why, without
+    # touching the output directory. Returns a dictionary with the keys
+    # 'source', 'object', 'rebuild' and 'reasons' (a list of strings).
+    #
+    def planStaticObject( self, srcFile, outputDir, buildParams = None, forceRebuild = False, pch = None ):
+        joinedBuildParams, objChecksum, details, objectFilename = self.resolveStaticObject( srcFile, buildParams, pch )
+        objectFilePath = os.path.join( outputDir, objectFilename )
+
+        plan = { 'source': srcFile, 'object': objectFilePath, 'rebuild': True, 'reasons': list() }
+
+        old = self.readStaticObjectChecksumDetails( objectFilePath )
+        if forceRebuild:
+            plan['reasons'].append( "forced" )
+        elif old == None:
+            plan['reasons'].append( "new object" )
+        elif old[0] == objChecksum:
+            plan['rebuild'] = False
+        else:
+            plan['reasons'] = self.explainChecksumChange( srcFile, old[1], details )
+
+        return plan
+
+    #
+    # Compares the checksum details of an object with the current ones and
+    # returns the differences as readable reasons.
+    #
+    def explainChecksumChange( self, srcFile, oldDetails, newDetails ):
+        if len(oldDetails) == 0:
+            return ["checksum changed (no details recorded)"]
+
+        def split( details ):
+            params = None
+            files  = dict()
+            for record in details:
+                if record[0] == 'params':
+                    params = record[1]
+                else:
+                    files[record[2]] = record[1]
+            return (params, files)
+
+        oldParams, oldFiles = split( oldDetails )
+        newParams, newFiles = split( newDetails )
+
+        reasons = list()
+        if oldParams != newParams:
+            reasons.append( "flags changed" )
+
+        for path in sorted( set(oldFiles.keys()) | set(newFiles.keys()) ):
+            what = "header %s"%path
+            if path == srcFile:
+                what = "source"
+
+            if path not in oldFiles:
+                reasons.append( "%s added"%what )
+            elif path not in newFiles:
+                reasons.append( "%s removed"%what )
+            elif oldFiles[path] != newFiles[path]:
+                reasons.append( "%s changed"%what )
+
+        if len(reasons) == 0:
+            reasons.append( "checksum changed" )
+
+        return reasons
 
+    #
+    # Records the outcome of compiling a prepared object. The checksum file is
+    # only written for objects that were built successfully, so a failed or
+    # interrupted build never leaves a stale object looking up to date.
+    #
+    def finishStaticObject( self, obj, ret ):
+        if ret != 0:
+            errorMessage("Failed to create static object '%s'\nCompiler return code: %d"%(obj.filename, ret))
+            return False
+
+        objectFilePath = os.path.join( obj.filepath, obj.filename )
+        self.writeStaticObjectChecksum( objectFilePath, obj.checksum, obj.checksumDetails )
+
+        if self.objectCache != None and obj.cacheKey != None:
+            self.objectCache.store( obj.cacheKey, objectFilePath )
+
+        return True
+
+    #
+    # Splits the outdated objects among 'objects' into compile batches, each
+    # a list of objects compiled by one compiler invocation. In batch mode
+    # objects with the same output directory, language and build parameters
+    # share a batch, up to BATCH_MAXSOURCES of them and never two with the
+    # same object filename. Otherwise, or if the CDEF lacks a batch
+    # commandline for the language, every object is a batch of its own.
+    #
+    def makeCompileBatches( self, objects ):
+        batches = list()
+        groups  = dict()
+        maxSources = max( 1, self.compiler.cdef['BATCH_MAXSOURCES'] )
+
+        for obj in objects:
+            if not obj.needRebuild:
+                continue
+
+            cplusplus = self.compiler.isCPPSource( obj.source )
+            if not self.batchMode or not self.compiler.supportsBatchCompile( cplusplus ):
+                batches.append( [obj] )
+                continue
+
+            key = (obj.filepath, cplusplus, obj.buildParams.makeChecksum())
+            batch = groups.get( key )
+            if batch == None or len(batch) == maxSources or obj.filename in [o.filename for o in batch]:
+                batch = list()
+                groups[key] = batch
+                batches.append( batch )
+            batch.append( obj )
+
+        return batches
+
+    #
+    # Compiles a batch made by makeCompileBatches() and returns the compiler
+    # exit code. Old objects and checksum files are removed first, so an
+    # object whose compilation fails is never taken as up to date if its
+    # source is later restored, and finishCompileBatch() can tell if the
+    # compiler wrote all objects of a multi-source batch.
+    #
+    def compileBatch( self, batch ):
+        for obj in batch:
+            self.removeStaticObject( obj )
+
+        if len(batch) == 1:
+            return executeCommandline( batch[0].commandline )
+
+        return self.compiler.batchStaticObjects( [obj.source for obj in batch], batch[0].buildParams, batch[0].filepath )
+
+    #
+    # Removes the object and its checksum file before the object is compiled.
+    # The object may have been fetched from the object cache by an earlier
+    # build, as a hard link to the cache entry. Compilers that truncate their
+    # output instead of replacing it would otherwise write through the link
+    # and corrupt the cache entry.
+    #
+    def removeStaticObject( self, obj ):
+        objectFilePath = os.path.join( obj.filepath, obj.filename )
+        for path in [ self.makeChecksumPath(objectFilePath), objectFilePath ]:
+            if os.path.exists( path ):
+                os.remove( path )
+
+    #
+    # Records the outcome of compileBatch(). Returns False if the batch failed.
+    #
+    def finishCompileBatch( self, batch, ret ):
+        if len(batch) == 1:
+            return self.finishStaticObject( batch[0], ret )
+
+        if ret != 0:
+            errorMessage("Failed to create static objects %s\nCompiler return code: %d"%(", ".join([obj.filename for obj in batch]), ret))
+            return False
+
+        missing = [ obj.filename for obj in batch if not os.path.exists(os.path.join(obj.filepath, obj.filename)) ]
+        if len(missing) != 0:
+            errorMessage("Batch compilation did not create %s, check the batch commandline of the CDEF"%(", ".join(missing)))
+            return False
+
+        for obj in batch:
+            self.finishStaticObject( obj, ret )
+
+        return True
+
+    #
+    # Builds a source file and returns a CTXStaticObject.
+    #
+    def buildStaticObject( self, srcFile, outputDir, buildParams = None, forceRebuild = False ):
+        obj = self.prepareStaticObject( srcFile, outputDir, buildParams, forceRebuild )
+
+        if obj.needRebuild:
+            self.compiler.echoSource( obj.source )
+            self.removeStaticObject( obj )
+            ret = executeCommandline( obj.commandline )
+            if not self.finishStaticObject( obj, ret ):
+                ctxExit( 1 )
+
+        return obj
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def prepareStaticObjects( self, srcFiles, outputDir, buildParams = None, forceRebuild = False, pch = None ):
+        objects = list()
+        for srcFile in assureList( srcFiles ):
+            objects.append( self.prepareStaticObject( srcFile, outputDir, buildParams, forceRebuild, pch ) )
+        return objects
+
+    #
+    # Compiles the outdated objects among a list of prepared objects, using up
+    # to 'jobCount' compiler processes at a time. After the first failure no
+    # more compilers are started; the running ones are waited for and every
+    # failed object is reported before the build is aborted.
+    #
+    def compileStaticObjects( self, objects ):
+        outdated = self.makeCompileBatches( objects )
+
+        if self.jobCount == 1 or len(outdated) < 2:
+            for batch in outdated:
+                for obj in batch:
+                    self.compiler.echoSource( obj.source )
+                ret = self.compileBatch( batch )
+                if not self.finishCompileBatch( batch, ret ):
+                    ctxExit( 1 )
+            return
+
+        pool = CTXJobPool( min(self.jobCount, len(outdated)) )
+        failures = 0
+        while pool.pendingJobs() > 0 or (len(outdated) > 0 and failures == 0):
+
+            while len(outdated) > 0 and failures == 0 and pool.pendingJobs() < pool.jobCount:
+                batch = outdated.pop( 0 )
+                for obj in batch:
+                    self.compiler.echoSource( obj.source )
+                pool.submit( CTXJob( self.compileBatch, (batch,), batch ) )
+
+            job = pool.waitForJob()
+            if job.error != None:
+                raise job.error
+
+            if not self.finishCompileBatch( job.tag, job.result ):
+                failures += 1
+
+        pool.shutdown()
+
+        if failures != 0:
+            userErrorExit("%d static object(s) failed to compile"%(failures))
+
+    #
+    # Builds a list of source files and returns a list of CTXStaticObject, in
+    # the same order as the sources.
+    #
+    def buildStaticObjects( self, srcFiles, outputDir, buildParams = None, forceRebuild = False ):
+        objects = self.prepareStaticObjects( srcFiles, outputDir, buildParams, forceRebuild )
+        self.compileStaticObjects( objects )
+        return objects
 
     #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # The checksum file of a library starts with the library checksum,
+    # followed by a 'tools <checksum>' line and a 'member <checksum> <path>'
+    # line per object. Returns (checksum, toolsChecksum, { path : checksum })
+    # or None if there is no checksum file.
+    #
+    def readStaticLibraryChecksum( self, libPath ):
+        checksumPath = self.makeChecksumPath( libPath )
+        if not os.path.isfile( checksumPath ):
+            return None
+
+        f = open( checksumPath, "r" )
+        lines = f.read().splitlines()
+        f.close()
+
+        if len(lines) == 0:
+            return None
+
+        toolsChecksum = None
+        members       = dict()
+        for line in lines[1:]:
+            fields = line.split( ' ', 2 )
+            if fields[0] == 'tools' and len(fields) == 2:
+                toolsChecksum = fields[1]
+            elif fields[0] == 'member' and len(fields) == 3:
+                members[fields[2]] = fields[1]
+
+        return (lines[0], toolsChecksum, members)
+
+    #
+    # Creates or updates a static library. The library is left alone if its
+    # checksum file shows that it holds the current version of every object.
+    # Otherwise, if the CDEF can update libraries and no member has to be
+    # removed, only the objects that changed are passed to the archiver, and
+    # the library is created from scratch in any other case.
+    #
     def buildStaticLibrary( self, objectFiles, libraryTitle, outputDir ):
-        ret = self.compiler.staticLibrary( objectFiles, libraryTitle, outputDir )
+        libPath       = self.compiler.makeStaticLibraryPath( libraryTitle, outputDir )
+        toolsChecksum = self.compiler.makeStaticLibraryToolChecksum()
+
+        records      = [ ('tools', toolsChecksum) ]
+        checksumList = [ toolsChecksum ]
+        for obj in objectFiles:
+            objPath = os.path.normpath( os.path.join(obj.filepath, obj.filename) )
+            records.append( ('member', obj.checksum, objPath) )
+            checksumList.append( obj.checksum + objPath )
+        libChecksum = mergeChecksums( checksumList )
+
+        old = None
+        if os.path.exists( libPath ):
+            old = self.readStaticLibraryChecksum( libPath )
+
+        if old != None and old[0] == libChecksum:
+            infoMessage("Reusing '%s'"%(os.path.basename(libPath)), 3)
+            return 0
+
+        checksumPath = self.makeChecksumPath( libPath )
+        if os.path.exists( checksumPath ):
+            os.remove( checksumPath )
+
+        changed = None
+        if old != None and old[1] == toolsChecksum and self.compiler.supportsLibraryUpdate():
+            oldChecksum, oldTools, oldMembers = old
+            paths = set( [ record[2] for record in records[1:] ] )
+            if set( oldMembers.keys() ).issubset( paths ):
+                changed = [ obj for obj in objectFiles if oldMembers.get( os.path.normpath(os.path.join(obj.filepath, obj.filename)) ) != obj.checksum ]
+
+        if changed == None:
+            ret = self.compiler.staticLibrary( objectFiles, libraryTitle, outputDir )
+        elif len(changed) != 0:
+            infoMessage("Updating %d of %d member(s) of '%s'"%(len(changed), len(objectFiles), os.path.basename(libPath)), 2)
+            ret = self.compiler.staticLibrary( changed, libraryTitle, outputDir, True )
+        else:
+            ret = 0
+
+        self.writeStaticObjectChecksum( libPath, libChecksum, records )
         return ret
 
     #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+
+
+#------------------------------------------------------------------------------
+# \class {CTXScheduledLibrary}
+#
+# Book keeping of a library handled by CTXBuildScheduler.
+#------------------------------------------------------------------------------
+class CTXScheduledLibrary:
+    def __init__( self, title, objects, outputDir ):
+        self.title          = title
+        self.objects        = objects
+        self.outputDir      = outputDir
+        self.pendingObjects = len( [obj for obj in objects if obj.needRebuild] )
+        self.archived       = False
+
+#------------------------------------------------------------------------------
+# \class {CTXBuildScheduler}
+#
+# Builds any number of libraries through one shared job pool. Objects are
+# prepared in the calling thread as libraries are added, while the compilers
+# of previously added libraries keep running. A library is archived as soon
+# as its last object is compiled, without waiting for other libraries, and
+# run() returns when every library is archived so that linking can start.
+#------------------------------------------------------------------------------
+class CTXBuildScheduler:
+
+    COMPILE = 0
+    ARCHIVE = 1
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def __init__( self, session ):
+        self.session    = session
+        self.pool       = CTXJobPool( session.getJobCount() )
+        self.readyJobs  = list()
+        self.libraries  = list()
+        self.failures   = 0
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Prepares the objects of the given code modules and queues their
+    # compilation. Returns the list of CTXStaticObject of the library.
+    #
+    def addLibrary( self, libraryTitle, codeModules, outputDir, buildDir = None ):
+        ctxlogBeginLibrary( libraryTitle )
+
+        objects = list()
+        batches = list()
+        for mod in assureList( codeModules ):
+            modObjects = mod.prepareStaticObjects( self.session, buildDir )
+            objects += modObjects
+            batches += self.session.makeCompileBatches( modObjects )
+
+        ctxlogEndLibrary()
+
+        if len(objects) == 0:
+            warningMessage("No object files to create library '%s'"%(libraryTitle))
+            return objects
+
+        library = CTXScheduledLibrary( libraryTitle, objects, outputDir )
+        self.libraries.append( library )
+
+        for batch in batches:
+            self.readyJobs.append( CTXJob( self.session.compileBatch, (batch,), (self.COMPILE, batch, library) ) )
+
+        self.__scheduleArchive( library )
+        self.__process( False )
+
+        return objects
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Waits for all queued jobs. Exits the build if any job failed.
+    #
+    def run( self ):
+        self.__process( True )
+        self.pool.shutdown()
+
+        if self.failures != 0:
+            userErrorExit("Build failed, %d job(s) reported errors"%(self.failures))
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def __scheduleArchive( self, library ):
+        if library.pendingObjects == 0 and not library.archived:
+            library.archived = True
+            # Archives unblock linking, let them go before waiting compiles.
+            job = CTXJob( self.session.buildStaticLibrary, (library.objects, library.title, library.outputDir), (self.ARCHIVE, None, library) )
+            self.readyJobs.insert( 0, job )
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def __dispatch( self ):
+        while len(self.readyJobs) > 0 and self.failures == 0 and self.pool.pendingJobs() < self.pool.jobCount:
+            job = self.readyJobs.pop( 0 )
+            kind, batch, library = job.tag
+            if kind == self.COMPILE:
+                for obj in batch:
+                    self.session.compiler.echoSource( obj.source )
+            self.pool.submit( job )
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def __process( self, block ):
+        while True:
+            self.__dispatch()
+
+            job = self.pool.waitForJob( block )
+            if job == None:
+                return
+
+            kind, batch, library = job.tag
+
+            if job.error != None:
+                # userErrorExit has already reported archive failures.
+                if kind == self.ARCHIVE and isinstance( job.error, SystemExit ):
+                    self.failures += 1
+                    continue
+                raise job.error
+
+            if kind == self.COMPILE:
+                if self.session.finishCompileBatch( batch, job.result ):
+                    library.pendingObjects -= len(batch)
+                    self.__scheduleArchive( library )
+                else:
+                    self.failures += 1
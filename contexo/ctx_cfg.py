@@ -81,6 +81,25 @@ class CFGFile:
     def getVerboseLevel ( self ):
         return self.cfgFile.get_item ('default', 'CTX_VERBOSE_LEVEL')
 
+    # Optional keys, absent from older config files.
+    def getOptionalItem ( self, item, default = None ):
+        return self.cfgFile.get_section('default').get( item, default )
+
+    def getObjectCacheDir ( self ):
+        cacheDir = self.getOptionalItem( 'CTX_OBJECT_CACHE_DIR' )
+        if cacheDir == None:
+            return None
+        return os.path.expanduser( cacheDir )
+
+    def getObjectCacheSize ( self ):
+        return self.getOptionalItem( 'CTX_OBJECT_CACHE_SIZE' )
+
+    def getChecksumMethod ( self ):
+        method = self.getOptionalItem( 'CTX_CHECKSUM_METHOD' )
+        if method == None:
+            return None
+        return method.upper()
+
     def setDefaultBConf ( self, bconfFile ):
         self.cfgFile.add_item ('default', 'CTX_DEFAULT_BCONF', bconfFile )
 
@@ -32,6 +32,7 @@ test_dirname        = 'test'
 dep_filename        = 'depends'
 xdep_filename       = 'xdepends'
 srclist_filename    = 'sourcefiles'
+unity_exclude_filename = 'unity_exclude'
 
 criteriaDirs = ['contexo','doc','inc', 'src', 'test']
 
@@ -62,11 +63,12 @@ def resolveModuleLocation( modName, pathlist ):
 #------------------------------------------------------------------------------
 def isContexoCodeModule( path ):
 
-    if not os.path.exists(path):
+    if not os.path.isdir(path):
         return False
 
+    subdirs = listSubdirsCached( path )
     for d in criteriaDirs:
-        if not os.path.isdir( os.path.join( path, d) ):
+        if d not in subdirs:
             return False
 
     return True
@@ -89,12 +91,10 @@ def getSourcesFromDir( self, srcDir ):
     source_extensions = [ '.c', '.cpp']
 
     # Collect all source files.
-    dirlist = os.listdir( srcDir )
-    for file in dirlist:
-        if os.path.isfile( os.path.join(srcDir, file) ):
-            root, ext = os.path.splitext( file )
-            if source_extensions.count( ext ) != 0:
-                srcList.append(file)
+    for file in listFilesCached( srcDir ):
+        root, ext = os.path.splitext( file )
+        if source_extensions.count( ext ) != 0:
+            srcList.append(file)
     return srcList
 
 
@@ -185,12 +185,10 @@ class CTXRawCodeModule:
             #testHeaders = list( )
             ctxAssert( os.path.exists(testHdrDir), 'Directory %s was assumed to exist'%(testHdrDir) )
             # Collect all source files.
-            dirlist = os.listdir( testHdrDir )
-            for file in dirlist:
-                if os.path.isfile( os.path.join(testHdrDir, file) ):
-                    root, ext = os.path.splitext( file )
-                    if header_extensions.count( ext ) != 0:
-                        self.testHeaders.append(file)
+            for file in listFilesCached( testHdrDir ):
+                root, ext = os.path.splitext( file )
+                if header_extensions.count( ext ) != 0:
+                    self.testHeaders.append(file)
         return self.testHeaders
 
     def getTestHeaderAbsolutePaths(self):
@@ -207,12 +205,10 @@ class CTXRawCodeModule:
             privHdrDir = self.getPrivHeaderDir()
             ctxAssert( os.path.exists(privHdrDir), 'Directory was assumed to exist' )
             # Collect all source files.
-            dirlist = os.listdir( privHdrDir )
-            for file in dirlist:
-                if os.path.isfile( os.path.join(privHdrDir, file) ):
-                    root, ext = os.path.splitext( file )
-                    if header_extensions.count( ext ) != 0:
-                        self.privHeaders.append(file)
+            for file in listFilesCached( privHdrDir ):
+                root, ext = os.path.splitext( file )
+                if header_extensions.count( ext ) != 0:
+                    self.privHeaders.append(file)
         return self.privHeaders
 
     def getPrivHeaderAbsolutePaths(self):
@@ -229,12 +225,10 @@ class CTXRawCodeModule:
             pubHdrDir = self.getPubHeaderDir()
             ctxAssert( os.path.exists(pubHdrDir), 'Directory %s was assumed to exist'%(pubHdrDir) )
             # Collect all source files.
-            dirlist = os.listdir( pubHdrDir )
-            for file in dirlist:
-                if os.path.isfile( os.path.join(pubHdrDir, file) ):
-                    root, ext = os.path.splitext( file )
-                    if header_extensions.count( ext ) != 0:
-                        self.pubHeaders.append(file)
+            for file in listFilesCached( pubHdrDir ):
+                root, ext = os.path.splitext( file )
+                if header_extensions.count( ext ) != 0:
+                    self.pubHeaders.append(file)
         return self.pubHeaders
 
     def getPubHeaderAbsolutePaths(self):
@@ -265,6 +259,15 @@ class CTXRawCodeModule:
     def hasExternalDependencies( self ):
         xdepends_file = os.path.join( self.getContexoDir(), 'xdepends' )
         return os.path.exists( xdepends_file )
+    #::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Returns the names of the sources listed in contexo/unity_exclude, which
+    # are always compiled on their own in unity builds.
+    #
+    def getUnityExcludedSources( self ):
+        exclude_filepath = os.path.join( self.getContexoDir(), unity_exclude_filename )
+        if not os.path.exists( exclude_filepath ):
+            return list()
+        return [ os.path.basename( name ) for name in readLstFile( exclude_filepath ) ]
 
 #------------------------------------------------------------------------------
 #
@@ -347,12 +350,10 @@ class CTXCodeModule( CTXRawCodeModule ):
         self.rebuildAll = True
 
     #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
-    def buildStaticObjects( self, session, buildDir = None ):
-        #LOG
-        ctx_log.ctxlogBeginCodeModule( self.getName() )
-
-        infoMessage("Building module '%s'"%(self.getName()), 2)
-
+    # Returns the build parameters of the module objects. Modules with
+    # external dependencies are always rebuilt.
+    #
+    def getStaticObjectBuildParams( self ):
         buildParams = ctx_base.CTXBuildParams()
         buildParams.add( self.buildParams )
 
@@ -362,28 +363,129 @@ class CTXCodeModule( CTXRawCodeModule ):
             self.forceRebuild()
             buildParams.incPaths.extend( xdepends )
 
-        #
-        # Handle output directory settings
-        #
+        return buildParams
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def getStaticObjectSources( self ):
+        srcFiles = self.getSourceAbsolutePaths()
+        if self.buildUnitTests:
+            srcFiles.extend( self.getTestSourceAbsolutePaths() )
+
+        return [ os.path.normpath( src ) for src in srcFiles ]
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Groups the module sources among 'srcFiles' into unity sources in
+    # 'outputDir', each including up to 'unitySize' sources of the same
+    # language (all of them if 'unitySize' is 0). Sources listed in
+    # contexo/unity_exclude, unit test sources and sources that would end up
+    # alone in a unit are kept. Returns the resulting source list, the
+    # contents of each unity source, as { path : contents }, and the sources
+    # it includes, as { path : [source, ...] }. Nothing is written to disk.
+    #
+    def planUnitySources( self, session, srcFiles, outputDir, unitySize ):
+        excluded   = self.getUnityExcludedSources()
+        modSources = set( os.path.normpath(src) for src in self.getSourceAbsolutePaths() )
+
+        groups    = { False: list(), True: list() }
+        unitFiles = list()
+        units     = dict()
+        members   = dict()
+        for src in srcFiles:
+            if src in modSources and os.path.basename( src ) not in excluded:
+                groups[ session.compiler.isCPPSource(src) ].append( src )
+            else:
+                unitFiles.append( src )
+
+        for cplusplus in [False, True]:
+            sources = sorted( groups[cplusplus] )
+            size    = unitySize
+            if size <= 0:
+                size = max( 1, len(sources) )
+
+            suffix = session.compiler.cdef['CXXFILESUFFIX'] if cplusplus else session.compiler.cdef['CFILESUFFIX']
+            tag    = "_cpp" if cplusplus else ""
+            if len(suffix) == 0:
+                unitFiles.extend( sources )
+                continue
+
+            for i in range( 0, len(sources), size ):
+                chunk = sources[i:i+size]
+                if len(chunk) == 1:
+                    unitFiles.extend( chunk )
+                    continue
+
+                unitName = "%s_unity%s%d%s"%( self.getName(), tag, i / size, suffix )
+                unitPath = os.path.join( outputDir, unitName )
+
+                contents = "/* Generated by Contexo, unity source of module '%s' */\n"%( self.getName() )
+                for src in chunk:
+                    contents += '#include "%s"\n'%( src.replace('\\', '/') )
+
+                units[unitPath]   = contents
+                members[unitPath] = chunk
+                unitFiles.append( unitPath )
+
+        return (unitFiles, units, members)
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Replaces the module sources among 'srcFiles' with the unity sources
+    # planned by planUnitySources() and writes them. Unity sources are only
+    # written when their contents change, so their objects are reused as long
+    # as the included sources are. Returns the resulting source list and the
+    # sources included by each unity source.
+    #
+    def makeUnitySources( self, session, srcFiles, outputDir, unitySize ):
+        unitFiles, units, members = self.planUnitySources( session, srcFiles, outputDir, unitySize )
+
+        if len(units) != 0 and not os.path.exists( outputDir ):
+            os.makedirs( outputDir )
+
+        for unitPath, contents in units.iteritems():
+            writeFileIfChanged( unitPath, contents )
+
+        return (unitFiles, members)
 
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def getStaticObjectDir( self, buildDir = None ):
         outputDir = self.getOutputDir()
         if buildDir != None:
             outputDir = os.path.join( outputDir, buildDir )
-            if not os.path.exists( outputDir ):
-                os.makedirs( outputDir )
+        return os.path.normpath( outputDir )
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Resolves checksums and commandlines for the objects of this module
+    # without compiling them. Outdated objects have 'needRebuild' set.
+    #
+    def prepareStaticObjects( self, session, buildDir = None ):
+        #LOG
+        ctx_log.ctxlogBeginCodeModule( self.getName() )
+
+        infoMessage("Building module '%s'"%(self.getName()), 2)
+
+        buildParams = self.getStaticObjectBuildParams()
+
+        #
+        # Handle output directory settings
+        #
+
+        outputDir = self.getStaticObjectDir( buildDir )
+        if buildDir != None and not os.path.exists( outputDir ):
+            os.makedirs( outputDir )
 
         #
         # Build sources for this module.
         #
 
-        srcFiles = self.getSourceAbsolutePaths()
-        if self.buildUnitTests:
-            srcFiles.extend( self.getTestSourceAbsolutePaths() )
+        srcFiles = self.getStaticObjectSources()
+        members  = dict()
+        if session.getUnityBuild():
+            srcFiles, members = self.makeUnitySources( session, srcFiles, outputDir, session.getUnitySize() )
 
-        objlist = []
-        for src in srcFiles:
-            obj = session.buildStaticObject( os.path.normpath( src ), os.path.normpath( outputDir ), buildParams, self.rebuildAll )
-            objlist.append( obj )
+        pch = None
+        if session.getPrecompiledHeaders():
+            pch = session.preparePrecompiledHeader( self.getName(), srcFiles, outputDir, buildParams, self.rebuildAll, members )
+
+        objlist = session.prepareStaticObjects( srcFiles, outputDir, buildParams, self.rebuildAll, pch )
 
         #LOG
         for obj in objlist:
@@ -394,6 +496,52 @@ class CTXCodeModule( CTXRawCodeModule ):
 
         return objlist
 
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Returns the rebuild plan (see CTXBuildSession.planStaticObject) of each
+    # object of this module. Nothing is written to disk: the objects of unity
+    # sources that are missing or would be rewritten are planned for rebuild
+    # without being resolved.
+    #
+    def planStaticObjects( self, session, buildDir = None ):
+        buildParams = self.getStaticObjectBuildParams()
+        outputDir   = self.getStaticObjectDir( buildDir )
+        srcFiles    = self.getStaticObjectSources()
+
+        staleUnits = dict() # { unity source : reason of its rebuild }
+        members    = dict()
+        if session.getUnityBuild():
+            srcFiles, units, members = self.planUnitySources( session, srcFiles, outputDir, session.getUnitySize() )
+            for unitPath, contents in units.iteritems():
+                if not os.path.isfile( unitPath ):
+                    staleUnits[unitPath] = "unity source added"
+                else:
+                    f = open( unitPath, "r" )
+                    if f.read() != contents:
+                        staleUnits[unitPath] = "unity source changed"
+                    f.close()
+
+        pch = None
+        if session.getPrecompiledHeaders():
+            pch = session.resolvePrecompiledHeader( self.getName(), srcFiles, outputDir, buildParams, members )
+
+        plans = list()
+        for srcFile in srcFiles:
+            if srcFile in staleUnits:
+                objectFilePath = os.path.join( outputDir, session.compiler.makeObjFileName(srcFile) )
+                plan = { 'source': srcFile, 'object': objectFilePath, 'rebuild': True, 'reasons': [ staleUnits[srcFile] ] }
+            else:
+                plan = session.planStaticObject( srcFile, outputDir, buildParams, self.rebuildAll, pch )
+            plan['module'] = self.getName()
+            plans.append( plan )
+
+        return plans
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def buildStaticObjects( self, session, buildDir = None ):
+        objlist = self.prepareStaticObjects( session, buildDir )
+        session.compileStaticObjects( objlist )
+        return objlist
+
     #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
     def clean( self, buildDir = None ):
         imDirs = list()
@@ -164,6 +164,99 @@ def getVerboseLevel():
     global globalVerboseLevel
     return globalVerboseLevel
 
+#------------------------------------------------------------------------------
+#
+#   Directory listing cache
+#
+#   Listings are kept for the rest of the process and reused as long as the
+#   modification time of the directory is unchanged, which is what changes
+#   when entries are added, removed or renamed. Checking a cached listing
+#   costs one stat of the directory instead of a listing and a stat per
+#   entry. The scandir module is used when available, it tells files from
+#   directories without stat calls on most platforms.
+#
+#------------------------------------------------------------------------------
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+dirListingCache     = dict() # { dirPath : (mtime, names, files, subdirs) }
+
+def getDirListing( dirPath ):
+    global dirListingCache
+
+    mtime = os.stat( dirPath ).st_mtime
+    listing = dirListingCache.get( dirPath )
+    if listing != None and listing[0] == mtime:
+        return listing
+
+    names   = list()
+    files   = list()
+    subdirs = list()
+    if scandir != None:
+        for entry in scandir( dirPath ):
+            names.append( entry.name )
+            if entry.is_file():
+                files.append( entry.name )
+            elif entry.is_dir():
+                subdirs.append( entry.name )
+    else:
+        for name in os.listdir( dirPath ):
+            names.append( name )
+            entryPath = os.path.join( dirPath, name )
+            if os.path.isfile( entryPath ):
+                files.append( name )
+            elif os.path.isdir( entryPath ):
+                subdirs.append( name )
+
+    listing = (mtime, names, files, subdirs)
+    dirListingCache[dirPath] = listing
+    return listing
+
+#------------------------------------------------------------------------------
+# Cached equivalent of os.listdir(). Raises OSError like os.listdir() if the
+# directory can't be listed. The returned list must not be modified.
+#------------------------------------------------------------------------------
+def listDirCached( dirPath ):
+    return getDirListing( dirPath )[1]
+
+#------------------------------------------------------------------------------
+# Returns the names of the regular files (or links to them) in a directory.
+#------------------------------------------------------------------------------
+def listFilesCached( dirPath ):
+    return getDirListing( dirPath )[2]
+
+#------------------------------------------------------------------------------
+# Returns the names of the subdirectories (or links to them) of a directory.
+#------------------------------------------------------------------------------
+def listSubdirsCached( dirPath ):
+    return getDirListing( dirPath )[3]
+
+#------------------------------------------------------------------------------
+# Writes 'contents' to 'filePath' unless the file already holds the same
+# contents, so that tools watching the file don't see a change. 'mode' is the
+# mode to write the file with, the existing file is read with the matching
+# read mode. Returns True if the file was written.
+#------------------------------------------------------------------------------
+def writeFileIfChanged( filePath, contents, mode = 'w' ):
+    import hashlib
+
+    if os.path.isfile( filePath ):
+        f = open( filePath, mode.replace('w', 'r') )
+        existing = f.read()
+        f.close()
+        if hashlib.md5( existing ).digest() == hashlib.md5( contents ).digest():
+            return False
+
+    f = open( filePath, mode )
+    f.write( contents )
+    f.close()
+    return True
+
 #------------------------------------------------------------------------------
 def assureList( var ):
     if type(var) != list:
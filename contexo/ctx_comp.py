@@ -254,11 +254,8 @@ class COMPFile:
                 self.moduleCache.append( cm )
 
                 # map module name to its root directory
-                pubHeaders = os.listdir( cm.getRootPath() )
-                for header in pubHeaders:
-                    pubHeaderPath = os.path.join( cm.getRootPath(), header )
-                    if os.path.isfile( pubHeaderPath ):
-                        publicHeaderMap[header] = pubHeaderPath
+                for header in listFilesCached( cm.getRootPath() ):
+                    publicHeaderMap[header] = os.path.join( cm.getRootPath(), header )
 
             #LOG
             ctx_log.ctxlogEndLibrary()
@@ -0,0 +1,290 @@
+###############################################################################
+#                                                                             #
+#   ctx_depdb.py                                                              #
+#   Component of Contexo Core - (c) Scalado AB 2010                           #
+#                                                                             #
+#   License GPL v2. See LICENSE.txt.                                          #
+#   ------------                                                              #
+#                                                                             #
+#   Persistent dependency database used by the dependency manager. Entries    #
+#   are read from disk on first access and only modified entries are written  #
+#   back, so the cost of a build no longer grows with the size of the store.  #
+#   A reverse index maps each included name to the files including it, and   #
+#   the code modules whose files were scanned are recorded by root path.      #
+#                                                                             #
+###############################################################################
+
+import os
+import time
+import cPickle
+from ctx_common import *
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+# Entries of files that no longer exist are removed at most this often.
+COMPACT_INTERVAL    = 24 * 60 * 60
+
+# Position of the include list in an entry, used for the reverse index.
+INC_FILELIST        = 0
+
+# Upper limit of the database size sqlite may map into memory.
+MMAP_SIZE           = 256 * 1024 * 1024
+
+#------------------------------------------------------------------------------
+def isDependencyDBSupported():
+    return sqlite3 != None
+
+#------------------------------------------------------------------------------
+# \class {CTXDependencyDB}
+#
+# Dictionary-like store mapping absolute file paths to the dependency entries
+# of CTXDepMgr, backed by an sqlite database. Looked up entries are kept in
+# memory for the rest of the session. Entry values are stored pickled, the
+# layout of an entry is up to the dependency manager except for the include
+# list, which must be its first item.
+#
+# The database connection is not part of the pickled state, an unpickled
+# store reopens the database on demand.
+#------------------------------------------------------------------------------
+class CTXDependencyDB:
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def __init__( self, dbPath ):
+        self.dbPath     = dbPath
+        self.entries    = dict()    # { path: entry } read or written this session
+        self.missing    = set()     # paths known not to be in the database
+        self.dirty      = set()     # paths to write back on commit()
+        self.dirtyIncs  = dict()    # { header: set of dirty paths including it }
+        self.modules    = None      # { module root path: module name }, read on demand
+        self.dirtyMods  = dict()    # { module root path: module name } to write back on commit()
+        self.conn       = None
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def __getstate__( self ):
+        state = self.__dict__.copy()
+        state['conn'] = None
+        return state
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def __connect( self ):
+        if self.conn != None:
+            return self.conn
+
+        self.conn = sqlite3.connect( self.dbPath )
+        self.conn.text_factory = str
+
+        for pragma in ["PRAGMA mmap_size = %d"%MMAP_SIZE, "PRAGMA synchronous = NORMAL"]:
+            try:
+                self.conn.execute( pragma )
+            except sqlite3.DatabaseError:
+                # Not supported by older sqlite versions.
+                pass
+
+        self.conn.execute( "CREATE TABLE IF NOT EXISTS deps (path TEXT PRIMARY KEY, entry BLOB)" )
+        self.conn.execute( "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)" )
+        self.conn.execute( "CREATE TABLE IF NOT EXISTS incs (header TEXT, path TEXT)" )
+        self.conn.execute( "CREATE INDEX IF NOT EXISTS incs_header ON incs (header)" )
+        self.conn.execute( "CREATE INDEX IF NOT EXISTS incs_path ON incs (path)" )
+        self.conn.execute( "CREATE TABLE IF NOT EXISTS modules (path TEXT PRIMARY KEY, name TEXT)" )
+        self.conn.commit()
+
+        if self.conn.execute( "SELECT value FROM meta WHERE key = 'indexed'" ).fetchone() == None:
+            self.__rebuildIndex()
+
+        return self.conn
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Builds the reverse index from all entries, for databases written before
+    # the index existed.
+    #
+    def __rebuildIndex( self ):
+        rows = list()
+        for path, entry in self.conn.execute( "SELECT path, entry FROM deps" ):
+            for header in cPickle.loads( str(entry) )[INC_FILELIST]:
+                rows.append( (header, path) )
+
+        self.conn.execute( "DELETE FROM incs" )
+        self.conn.executemany( "INSERT INTO incs (header, path) VALUES (?, ?)", rows )
+        self.conn.execute( "INSERT OR REPLACE INTO meta (key, value) VALUES ('indexed', '1')" )
+        self.conn.commit()
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def __load( self, path ):
+        if path in self.entries:
+            return True
+        if path in self.missing:
+            return False
+
+        row = self.__connect().execute( "SELECT entry FROM deps WHERE path = ?", (path,) ).fetchone()
+        if row == None:
+            self.missing.add( path )
+            return False
+
+        self.entries[path] = cPickle.loads( str(row[0]) )
+        return True
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def __contains__( self, path ):
+        return self.__load( path )
+
+    def has_key( self, path ):
+        return self.__load( path )
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def __getitem__( self, path ):
+        if not self.__load( path ):
+            raise KeyError( path )
+        return self.entries[path]
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def __setitem__( self, path, entry ):
+        if path in self.dirty:
+            self.__unindexDirty( path )
+
+        self.entries[path] = entry
+        self.missing.discard( path )
+        self.dirty.add( path )
+
+        for header in entry[INC_FILELIST]:
+            self.dirtyIncs.setdefault( header, set() ).add( path )
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def __unindexDirty( self, path ):
+        for header in self.entries[path][INC_FILELIST]:
+            includers = self.dirtyIncs.get( header )
+            if includers != None:
+                includers.discard( path )
+                if len(includers) == 0:
+                    del self.dirtyIncs[header]
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def get( self, path, default = None ):
+        if self.__load( path ):
+            return self.entries[path]
+        return default
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Returns all paths in the store. This reads the whole key column, avoid
+    # it in performance critical code.
+    #
+    def keys( self ):
+        paths = set( self.entries.keys() )
+        for row in self.__connect().execute( "SELECT path FROM deps" ):
+            paths.add( row[0] )
+        return list( paths )
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def __iter__( self ):
+        return iter( self.keys() )
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Returns the set of paths whose include list contains 'header', as
+    # written in the include directive. Entries modified this session are
+    # taken from an in-memory index since their index rows are only written
+    # on commit().
+    #
+    def findIncluders( self, header ):
+        paths = set()
+        for row in self.__connect().execute( "SELECT path FROM incs WHERE header = ?", (header,) ):
+            if row[0] not in self.dirty:
+                paths.add( row[0] )
+
+        paths.update( self.dirtyIncs.get(header, ()) )
+
+        return paths
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Records that the files of the code module at 'path' (its normalized
+    # root path) have been scanned.
+    #
+    def addModule( self, name, path ):
+        if self.getModules().get( path ) != name:
+            self.modules[path] = name
+            self.dirtyMods[path] = name
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Returns the code modules recorded by addModule(), as a dictionary
+    # mapping root paths to module names. The dictionary must not be modified.
+    #
+    def getModules( self ):
+        if self.modules == None:
+            self.modules = dict( self.__connect().execute("SELECT path, name FROM modules") )
+            self.modules.update( self.dirtyMods )
+        return self.modules
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Writes modified entries to disk, and removes entries of deleted files
+    # if that hasn't been done for a while.
+    #
+    def commit( self ):
+        conn = self.__connect()
+
+        if len(self.dirtyMods) != 0:
+            conn.executemany( "INSERT OR REPLACE INTO modules (path, name) VALUES (?, ?)", self.dirtyMods.items() )
+            conn.commit()
+            self.dirtyMods = dict()
+
+        if len(self.dirty) != 0:
+            rows = [ (path, buffer(cPickle.dumps(self.entries[path], cPickle.HIGHEST_PROTOCOL))) for path in self.dirty ]
+            conn.executemany( "INSERT OR REPLACE INTO deps (path, entry) VALUES (?, ?)", rows )
+
+            incRows = list()
+            for path in self.dirty:
+                for header in self.entries[path][INC_FILELIST]:
+                    incRows.append( (header, path) )
+            conn.executemany( "DELETE FROM incs WHERE path = ?", [ (path,) for path in self.dirty ] )
+            conn.executemany( "INSERT INTO incs (header, path) VALUES (?, ?)", incRows )
+
+            conn.commit()
+            infoMessage("Dependency database: wrote %d entries"%(len(rows)), 3)
+            self.dirty = set()
+            self.dirtyIncs = dict()
+
+        row = conn.execute( "SELECT value FROM meta WHERE key = 'compacted'" ).fetchone()
+        lastCompacted = 0.0
+        if row != None:
+            lastCompacted = float( row[0] )
+
+        if time.time() - lastCompacted > COMPACT_INTERVAL:
+            self.compact()
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def compact( self ):
+        conn = self.__connect()
+
+        stale = list()
+        for row in conn.execute( "SELECT path FROM deps" ):
+            if not os.path.exists( row[0] ):
+                stale.append( (row[0],) )
+
+        staleMods = [ (path,) for path, name in self.getModules().items() if not os.path.isdir( path ) ]
+        if len(staleMods) != 0:
+            conn.executemany( "DELETE FROM modules WHERE path = ?", staleMods )
+            for (path,) in staleMods:
+                self.dirtyMods.pop( path, None )
+                del self.modules[path]
+
+        if len(stale) != 0:
+            conn.executemany( "DELETE FROM deps WHERE path = ?", stale )
+            conn.executemany( "DELETE FROM incs WHERE path = ?", stale )
+            for (path,) in stale:
+                if path in self.dirty:
+                    self.__unindexDirty( path )
+                    self.dirty.discard( path )
+                self.entries.pop( path, None )
+                self.missing.add( path )
+
+        conn.execute( "INSERT OR REPLACE INTO meta (key, value) VALUES ('compacted', ?)", (str(time.time()),) )
+        conn.commit()
+
+        if len(stale) != 0:
+            conn.execute( "VACUUM" )
+            infoMessage("Dependency database: removed %d stale entries"%(len(stale)), 2)
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def close( self ):
+        if self.conn != None:
+            self.conn.close()
+            self.conn = None
@@ -10,6 +10,7 @@ from ctx_common import *
 import ctx_cmod
 
 import ctx_cparser
+from ctx_depdb import CTXDependencyDB, isDependencyDBSupported
 
 #------------------------------------------------------------------------------
 def getModulePrivHeaderDir( modulePath ):
@@ -81,14 +82,20 @@ def getFileContents( inputFilePath ):
     f.close()
     return contents
 
-inputFileContents = ""
 stack       = 0
 maxStack    = 0
 tabs        = ""
 
+#------------------------------------------------------------------------------
+# Returns (size, mtime in ns, inode) of a file. Any change to the file is
+# expected to change at least one of them.
+#------------------------------------------------------------------------------
+def getStatInfo( inputFilePath ):
+    st = os.stat( inputFilePath )
+    return ( st.st_size, int(st.st_mtime * 1000000000), st.st_ino )
+
 #------------------------------------------------------------------------------
 def generateChecksum( inputFilePath, checksumMethod ):
-    global inputFileContents
 
     ctxAssert ( os.path.exists ( inputFilePath ), "inputFilePath: " + inputFilePath )
 
@@ -96,18 +103,74 @@ def generateChecksum( inputFilePath, checksumMethod ):
     method      = checksumMethod.upper()
 
     if method == 'MD5':#.........................
-        if len(inputFileContents) == 0:
-            inputFileContents = getFileContents(inputFilePath)
-
-        checksum = getMD5( inputFileContents )
+        checksum = getMD5( getFileContents(inputFilePath) )
 
     elif method == 'MTIME':#......................
         modTime = os.stat( inputFilePath )[ST_MTIME]
         checksum = getMD5( str(modTime) )
 
+    elif method == 'HYBRID':#.....................
+        # Content checksum, see CTXDepMgr for how the stat info avoids it.
+        checksum = getMD5( getFileContents(inputFilePath) )
+
     ctxAssert( checksum != None )
     return checksum
 
+#------------------------------------------------------------------------------
+# Tells if the dependency entry of a file is known to be up to date without
+# reading the file.
+#------------------------------------------------------------------------------
+def isEntryCurrent( inputFilePath, checksumMethod, entry ):
+    if entry == None:
+        return False
+
+    if checksumMethod == 'HYBRID':
+        return len(entry) > STATINFO and entry[STATINFO] == getStatInfo( inputFilePath )
+
+    if checksumMethod == 'MTIME':
+        return entry[CHECKSUM] == generateChecksum( inputFilePath, checksumMethod )
+
+    return False
+
+#------------------------------------------------------------------------------
+# Returns the up to date dependency entry of a file, given its current entry
+# (None if it has none). The include list is only parsed if the checksum has
+# changed, and the file is read at most once. For HYBRID the stat info is
+# taken before the file is read: if the file changes while it is read, the
+# stored stat info is older than the file and the next scan reads it again.
+#------------------------------------------------------------------------------
+def scanFile( inputFilePath, checksumMethod, entry ):
+    inputFileContents = None
+
+    if checksumMethod == 'HYBRID':
+        statInfo = getStatInfo( inputFilePath )
+
+    if checksumMethod in ['MD5', 'HYBRID']:
+        inputFileContents = getFileContents( inputFilePath )
+        checksum = getMD5( inputFileContents )
+    else:
+        checksum = generateChecksum( inputFilePath, checksumMethod )
+
+    if entry != None and entry[CHECKSUM] == checksum:
+        incFileList = entry[INC_FILELIST]
+        sysIncFileList = entry[SYSINC_FILELIST]
+    else:
+        if inputFileContents == None:
+            inputFileContents = getFileContents( inputFilePath )
+        incFileList, sysIncFileList = ctx_cparser.parseIncludes(inputFileContents)
+
+    if checksumMethod == 'HYBRID':
+        return (incFileList, checksum, sysIncFileList, statInfo)
+
+    return (incFileList, checksum, sysIncFileList)
+
+#------------------------------------------------------------------------------
+# Entry point of the dependency scan worker processes.
+#------------------------------------------------------------------------------
+def scanFileJob( args ):
+    inputFilePath, checksumMethod, entry = args
+    return scanFile( inputFilePath, checksumMethod, entry )
+
 
 #
 # Appends the absolute path to a given source file.
@@ -268,7 +331,7 @@ def findAllCodeModulPaths( searchPaths ):
 
         if len(codeModulePaths) == 0:
             try:
-                pathCandidates = os.listdir( path )
+                pathCandidates = listDirCached( path )
             except OSError, (errno,  errmsg):
                 userErrorExit("Could not list directory '%s': %s"%(path,  errmsg))
             for cand in pathCandidates:
@@ -290,7 +353,7 @@ def finAllCodeModules( searchPaths ):
 
     modules = list ()
     for path in searchPaths:
-        pathCandidates = os.listdir( path )
+        pathCandidates = listDirCached( path )
         for candidate in pathCandidates:
             candPath = os.path.join( path, candidate )
             if isContexoCodeModule( candPath ) == True:
@@ -301,6 +364,12 @@ def finAllCodeModules( searchPaths ):
 # These are explicit indexes for accessing the tuple indexes in dependencies.
 INC_FILELIST        = 0
 CHECKSUM            = 1
+SYSINC_FILELIST     = 2 # <system> includes, not followed by the scan.
+STATINFO            = 3 # Only present in entries made with the HYBRID method.
+
+# Layout version of the entries, part of the name of the dependency store so
+# that stores written with another layout are not used.
+ENTRY_FORMAT        = 2
 
 #------------------------------------------------------------------------------
 class CTXDepMgr: # The dependency manager class.
@@ -309,7 +378,7 @@ class CTXDepMgr: # The dependency manager class.
         self.tolerateMissingHeaders = tolerateMissingHeaders
         self.msgSender                = 'CTXDepMgr'
         self.depRoots                 = list()
-        self.supportedChecksumMethods = ['MTIME', 'MD5']
+        self.supportedChecksumMethods = ['MTIME', 'MD5', 'HYBRID']
         self.checksumMethod           = self.supportedChecksumMethods[0]
 
         self.cmods                    = dict() # Dictionary mapping mod name to raw mod.
@@ -323,8 +392,14 @@ class CTXDepMgr: # The dependency manager class.
         self.processed                = set () # Set containing processed files in this session.
         self.dependencies             = dict() # { src_file : (set( dep_headers ), md5)} (all files)
         self.moduleDependencies       = dict() # { module : set( dep_headers ) } (for a module)
+        self.includers                = None   # { header : set( src_file ) }, built on demand without the database
+        self.closures                 = dict() # { src_file : frozenset( src_file and all files it includes ) }
+        self.closureDirs              = dict() # { src_file : frozenset( directories of its closure ) }
+        self.requiredDirs             = dict() # { src_file : frozenset( include dirs needed by its own includes ) }
+        self.viewSystemIncludes       = dict() # { src_file : True if one of its <system> includes is found in the search paths }
 
         self.useDiskCaching           = True
+        self.jobCount                 = 1 # Worker processes for the dependency scan.
 
         self.needUpdate               = True
         self.codeModulePaths          = codeModulePaths
@@ -335,6 +410,18 @@ class CTXDepMgr: # The dependency manager class.
         self.filelist = dict()
         self.analysedpaths = set()
 
+        self.resolvedModulePaths      = dict() # { module name : module path }
+
+    # The include closures are cheap to rebuild and can be large, leave them
+    # out when the manager is pickled for export.
+    def __getstate__( self ):
+        state = self.__dict__.copy()
+        state['closures'] = dict()
+        state['closureDirs'] = dict()
+        state['requiredDirs'] = dict()
+        state['viewSystemIncludes'] = dict()
+        return state
+
     def _CTXDepMgr__updateDependencies ( self, inputFileList, pathList):
 
         inputFilePath       = str()
@@ -363,22 +450,12 @@ class CTXDepMgr: # The dependency manager class.
             #
 
             assert(os.path.isabs(inputFile) or not inputFile.endswith('.c') )
-            if inputFilePath not in self.processed:
-                checksum = generateChecksum( inputFilePath, self.checksumMethod )
-
-                if inputFilePath in self.dependencies and \
-                    self.dependencies[inputFilePath][CHECKSUM] == checksum:
-                    incFileList = self.dependencies[inputFilePath][INC_FILELIST]
-                else:
-                    inputFileContents = getFileContents( inputFilePath )
-                    incFileList = ctx_cparser.parseIncludes(inputFileContents)[0]
-
-
-                    self.dependencies[inputFilePath] = (incFileList, checksum)
+            if inputFilePath in self.processed:
+                # Its includes have already been followed in this session.
+                continue
 
-                self.processed.add ( inputFilePath )
-
-            inputFileContents = getFileContents( inputFilePath )
+            incFileList = self.__scanFile( inputFilePath )
+            self.processed.add ( inputFilePath )
 
             #
             # We now have a list of the files on which our input file depend on,
@@ -389,12 +466,92 @@ class CTXDepMgr: # The dependency manager class.
 
 
     # - - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - -
-    def updateModuleDependencies( self, cmod ):
+    # Updates the dependency entry of a file if the file has changed, and
+    # returns its include list.
+    #
+    # With the HYBRID method the content checksum is trusted as long as the
+    # size, modification time and inode of the file are those recorded in the
+    # entry, so unchanged files are never read.
+    #
+    def _CTXDepMgr__scanFile( self, inputFilePath ):
+        entry = self.dependencies.get( inputFilePath )
+
+        if isEntryCurrent( inputFilePath, self.checksumMethod, entry ):
+            return entry[INC_FILELIST]
+
+        newEntry = scanFile( inputFilePath, self.checksumMethod, entry )
+        if newEntry != entry:
+            self.__setEntry( inputFilePath, newEntry )
+
+        return newEntry[INC_FILELIST]
+
+    # - - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - -
+    # Parallel variant of __updateDependencies. The include graph is walked
+    # breadth first. For each level the files are resolved with locate() in
+    # the order they were found, and those that have to be read are scanned
+    # by the worker pool. Results are merged in that same order, so the
+    # outcome doesn't depend on which worker finishes first. The pool is only
+    # started once a level has enough files to scan, which a scan of an
+    # unchanged view never has. Returns the pool, or None.
+    #
+    def _CTXDepMgr__updateDependenciesParallel( self, inputFileList, pathList ):
+        import multiprocessing
+
+        pool     = None
+        frontier = list( inputFileList )
+        while len(frontier) != 0:
+
+            levelFiles  = list()
+            scanArgs    = list()
+
+            for inputFile in frontier:
+                inputFilePath = self.locate(inputFile,  pathList)
+                if inputFilePath == None:
+                    dependings = self.findFilesDependingOn(inputFile)
+                    assert(dependings)
+                    if ( self.tolerateMissingHeaders):
+                        warningMessage("Dependency manager cannot locate input file: %s (from %s)"%(inputFile, ",".join(dependings) ))
+                    else:
+                        userErrorExit("Dependency manager cannot locate input file: %s (from %s)"%(inputFile, ",".join(dependings) ))
+                    continue
+
+                if inputFilePath in self.processed:
+                    continue
+
+                self.processed.add( inputFilePath )
+                levelFiles.append( inputFilePath )
+
+                entry = self.dependencies.get( inputFilePath )
+                if not isEntryCurrent( inputFilePath, self.checksumMethod, entry ):
+                    scanArgs.append( (inputFilePath, self.checksumMethod, entry) )
+
+            if len(scanArgs) > self.jobCount:
+                if pool == None:
+                    pool = multiprocessing.Pool( self.jobCount )
+                chunkSize = max( 1, len(scanArgs) / (self.jobCount * 4) )
+                newEntries = pool.map( scanFileJob, scanArgs, chunkSize )
+            else:
+                newEntries = map( scanFileJob, scanArgs )
+
+            for args, newEntry in zip( scanArgs, newEntries ):
+                if newEntry != args[2]:
+                    self.__setEntry( args[0], newEntry )
+
+            frontier = list()
+            for inputFilePath in levelFiles:
+                frontier.extend( self.dependencies[inputFilePath][INC_FILELIST] )
+
+        return pool
+
+    # - - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - -
+    #
+    # Adds the search paths a module needs to the dependency search paths, and
+    # returns the files of the module to start the dependency search from.
+    #
+    def getModuleInputFiles( self, cmod ):
         from ctx_cmod import isContexoCodeModule
         from ctx_cmod import CTXCodeModule
 
-        self.moduleDependencies[cmod.getName()] = set()
-
         #
         # Add private header dir of the current module to path list.
         # Also add external dependency paths if any.
@@ -433,19 +590,75 @@ class CTXDepMgr: # The dependency manager class.
             inputFileList.extend ( cmod.getTestSourceAbsolutePaths() )#getTestSourceFilenames() )
             #pathList += assureList ( cmod.getTestDir () )
 
-        self.__updateDependencies ( inputFileList, list(paths) )
+        return inputFileList
+
+    # - - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - -
+    def setModuleDependencies( self, cmod, inputFileList ):
+        self.moduleDependencies[cmod.getName()] = set()
 
         #copy dependencies for module's sourcefiles from the global dependency dictionary
         for inputFile in inputFileList:
             self.moduleDependencies[cmod.getName()].update ( self.dependencies[self.locate(inputFile)][0] )
 
+    # - - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - -
+    def updateModuleDependencies( self, cmod ):
+        inputFileList = self.getModuleInputFiles( cmod )
+
+        self.__updateDependencies ( inputFileList, list(self.depPaths) )
+        self.__addScannedModule( cmod )
+
+        self.setModuleDependencies( cmod, inputFileList )
+
+    # - - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - -
+    # Stores the dependency entry of a file and keeps the reverse include
+    # index in step with it.
+    #
+    def _CTXDepMgr__setEntry( self, inputFilePath, entry ):
+        oldEntry = self.dependencies.get( inputFilePath )
+
+        # A closure only depends on include lists, a file whose checksum
+        # changed but includes the same files leaves the closures valid. A
+        # file without an entry is not part of any closure yet.
+        if oldEntry != None and oldEntry[INC_FILELIST] != entry[INC_FILELIST]:
+            self.closures.clear()
+            self.closureDirs.clear()
+            self.requiredDirs.clear()
+        self.viewSystemIncludes.pop( inputFilePath, None )
+
+        if self.includers != None:
+            if oldEntry != None:
+                for header in oldEntry[INC_FILELIST]:
+                    self.includers[header].discard( inputFilePath )
+            for header in entry[INC_FILELIST]:
+                self.includers.setdefault( header, set() ).add( inputFilePath )
+
+        self.dependencies[inputFilePath] = entry
+
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Returns the files including 'header' (as written in the include
+    # directive). The dependency database keeps a reverse index on disk,
+    # without it the index is built from the loaded entries on first use.
+    #
     def findFilesDependingOn(self,  header):
-        ret = list()
-        for file in self.dependencies.keys():
-            if header in self.dependencies[file][0]:
-                ret.append(file)
-        return ret
+        if isinstance( self.dependencies, CTXDependencyDB ):
+            return sorted( self.dependencies.findIncluders( header ) )
+
+        if self.includers == None:
+            self.includers = dict()
+            for file, entry in self.dependencies.iteritems():
+                for inc in entry[INC_FILELIST]:
+                    self.includers.setdefault( inc, set() ).add( file )
+
+        return sorted( self.includers.get( header, set() ) )
+
+    # - - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - -
+    # Adds the names in the given directories to the file index of locate().
+    #
+    def _CTXDepMgr__indexSearchPaths( self, pathList ):
+        for path in set(pathList) - self.analysedpaths:
+            self.analysedpaths.add(path)
+            for file in listDirCached(path):
+                self.filelist.setdefault( file, set() ).add( os.path.join(path,  file))
 
     # the pathList is only used once. Then is is cached in a dictionary.
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -458,12 +671,8 @@ class CTXDepMgr: # The dependency manager class.
         #t0 = time()
             #alist = reduce(operator.add, map( retpaths, pathList),[])
 
-        def addPathToDict(path):
-            self.analysedpaths.add(path)
-            for file in os.listdir(path):
-                self.filelist.setdefault( file, set() ).add( os.path.join(path,  file))
         if pathList:
-            map(addPathToDict,  set(pathList) - self.analysedpaths)
+            self.__indexSearchPaths( pathList )
 
            #for full_path in alist:
             #    self.filelist.setdefault( os.path.basename(full_path), [] ).append(full_path)
@@ -491,17 +700,47 @@ class CTXDepMgr: # The dependency manager class.
         #
         self.dependencies = self.loadDependencies()
         self.processed = set()
+        self.includers = None
+        self.closures = dict()
+        self.closureDirs = dict()
+        self.requiredDirs = dict()
+        self.viewSystemIncludes = dict()
 
         #
         # Go through all provided code modules and update the main dependency
         # dictionary.
         #
-        for cmod in self.cmods.itervalues():
-            self.updateModuleDependencies( cmod )
+        if self.jobCount == 1 or len(self.cmods) == 0:
+            for cmod in self.cmods.itervalues():
+                self.updateModuleDependencies( cmod )
+        else:
+            self.updateDependenciesParallel()
 
         self.storeDependencies()
         self.needUpdate = False
 
+    # - - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - -
+    # Scans the files of all modules in one go, with files read and parsed by
+    # a pool of 'jobCount' worker processes.
+    #
+    def updateDependenciesParallel( self ):
+        cmods = [ self.cmods[name] for name in sorted( self.cmods.keys() ) ]
+
+        moduleInputs = list()
+        allInputs    = list()
+        for cmod in cmods:
+            inputFileList = self.getModuleInputFiles( cmod )
+            moduleInputs.append( inputFileList )
+            allInputs.extend( inputFileList )
+
+        pool = self.__updateDependenciesParallel( allInputs, list(self.depPaths) )
+        if pool != None:
+            pool.close()
+            pool.join()
+
+        for cmod, inputFileList in zip( cmods, moduleInputs ):
+            self.setModuleDependencies( cmod, inputFileList )
+
     # - - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - -
 
     def makeDependenciesPickleFilename( self ):
@@ -510,15 +749,29 @@ class CTXDepMgr: # The dependency manager class.
         for path in self.depRoots:
             pickleFilenameMD5.update( path )
 
-        pickleFilename = "%s.ctx"%pickleFilenameMD5.hexdigest()
+        pickleFilename = "%s_%d.ctx"%( pickleFilenameMD5.hexdigest(), ENTRY_FORMAT )
         return pickleFilename
 
     # - - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - -
-    def loadDependencies( self ):
-        dependencies = dict ()
+    def makeDependenciesDBFilename( self ):
+        return os.path.splitext( self.makeDependenciesPickleFilename() )[0] + ".db"
 
+    # - - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - -
+    # Uses the dependency database when sqlite is available, otherwise the
+    # whole dependency dictionary is unpickled.
+    #
+    def loadDependencies( self ):
         storageLocation = getUserTempDir()
 
+        if isDependencyDBSupported():
+            p = os.path.join( storageLocation, self.makeDependenciesDBFilename() )
+            if isinstance( self.dependencies, CTXDependencyDB ) and self.dependencies.dbPath == p:
+                # Keep the entries already read in this session.
+                return self.dependencies
+            return CTXDependencyDB( p )
+
+        dependencies = dict ()
+
         p = os.path.join( storageLocation, self.makeDependenciesPickleFilename() )
         if os.path.exists( p ):
             f = file( p, "rb" )
@@ -529,6 +782,10 @@ class CTXDepMgr: # The dependency manager class.
 
     # - - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - -
     def storeDependencies( self ):
+        if isinstance( self.dependencies, CTXDependencyDB ):
+            self.dependencies.commit()
+            return
+
         storageLocation = getUserTempDir()
 
         if os.path.exists( storageLocation ):
@@ -570,6 +827,10 @@ class CTXDepMgr: # The dependency manager class.
     def disableDiskCaching( self ):
         self.useDiskCache = False
 
+    # - - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - -
+    def setJobCount( self, jobCount ):
+        self.jobCount = jobCount
+
     # - - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - -
     def setChecksumMethod( self, method ):
         if method not in self.supportedChecksumMethods:
@@ -600,20 +861,175 @@ class CTXDepMgr: # The dependency manager class.
 
     def _CTXDepMgr__getDependentIncludes ( self, includeFiles, pathList):
         processedFiles = set()
-        def enclosedRecursion(includeFiles):
-            for incFile in includeFiles:
-                if incFile not in self.dependencies:
-                    self.__updateDependencies ( [incFile], pathList  )
-                    ctxAssert ( incFile in self.dependencies, "incFile= " + incFile )
-                if incFile not in processedFiles:
-                    depIncludes = set ( self.dependencies[incFile][0] )
-                    fullpathIncludes = [ s for s in map( self.locate,  depIncludes) if s != None ]
-                    processedFiles.add ( incFile )
-                    enclosedRecursion ( fullpathIncludes )
-
-        enclosedRecursion(includeFiles)
+        for incFile in includeFiles:
+            processedFiles.update( self.__getIncludeClosure( incFile, pathList ) )
         return processedFiles
 
+    # - - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - -
+    # Returns the resolved include list of a file, scanning the file first if
+    # it has no dependency entry yet.
+    #
+    def _CTXDepMgr__getResolvedIncludes( self, incFile, pathList ):
+        if incFile not in self.dependencies:
+            self.__updateDependencies ( [incFile], pathList  )
+            ctxAssert ( incFile in self.dependencies, "incFile= " + incFile )
+        depIncludes = set ( self.dependencies[incFile][INC_FILELIST] )
+        return [ s for s in map( self.locate,  depIncludes) if s != None ]
+
+    # - - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - -
+    # Returns the set of 'incFile' and all files it includes, directly or
+    # indirectly. Closures are memoized per file, so headers shared by the
+    # sources of a module are only walked once per session. The include graph
+    # may have cycles, all files of a strongly connected component (found with
+    # Tarjan's algorithm) share the same closure.
+    #
+    def _CTXDepMgr__getIncludeClosure( self, incFile, pathList ):
+        if incFile in self.closures:
+            return self.closures[incFile]
+
+        # Closures found by this walk, and those it reuses. They are only
+        # published at the end, scanning a file on the way may clear the
+        # cache.
+        done        = dict()
+        index       = dict()   # { file : visiting order }
+        lowlink     = dict()
+        successors  = dict()
+        stack       = list()
+        onStack     = set()
+
+        def visit( node ):
+            index[node] = lowlink[node] = len(index)
+            stack.append( node )
+            onStack.add( node )
+            successors[node] = self.__getResolvedIncludes( node, pathList )
+            work.append( (node, iter(successors[node])) )
+
+        work = list()
+        visit( incFile )
+        while len(work) != 0:
+            node, succIter = work[-1]
+
+            descended = False
+            for succ in succIter:
+                if succ in done:
+                    continue
+                if succ in self.closures:
+                    done[succ] = self.closures[succ]
+                    continue
+                if succ not in index:
+                    visit( succ )
+                    descended = True
+                    break
+                if succ in onStack:
+                    lowlink[node] = min( lowlink[node], index[succ] )
+
+            if descended:
+                continue
+
+            work.pop()
+            if len(work) != 0:
+                parent = work[-1][0]
+                lowlink[parent] = min( lowlink[parent], lowlink[node] )
+
+            if lowlink[node] == index[node]:
+                component = set()
+                while True:
+                    member = stack.pop()
+                    onStack.discard( member )
+                    component.add( member )
+                    if member == node:
+                        break
+
+                closure = set( component )
+                for member in component:
+                    for succ in successors[member]:
+                        if succ not in component:
+                            closure.update( done[succ] )
+
+                closure = frozenset( closure )
+                for member in component:
+                    done[member] = closure
+
+        self.closures.update( done )
+        return done[incFile]
+
+    # - - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - -
+    # Returns the directories of all files in the closure of 'incFile'.
+    #
+    def _CTXDepMgr__getIncludeClosureDirs( self, incFile, pathList ):
+        if incFile not in self.closureDirs:
+            closure = self.__getIncludeClosure( incFile, pathList )
+            self.closureDirs[incFile] = frozenset( map(os.path.dirname, closure) )
+        return self.closureDirs[incFile]
+
+    # - - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - -
+    # Returns the include directories needed by the include directives of
+    # 'incFile' itself. Quoted includes are searched in the directory of the
+    # including file first, so a header included from its own directory
+    # needs no include path.
+    #
+    def _CTXDepMgr__getRequiredIncludeDirs( self, incFile, pathList ):
+        if incFile not in self.requiredDirs:
+            incDir = os.path.dirname( incFile )
+            dirs = set()
+            for name in set( self.dependencies[incFile][INC_FILELIST] ):
+                path = self.locate( name )
+                if path == None or os.path.isabs( name ):
+                    continue
+                # An include like "sub/file.h" needs the parent of 'sub'.
+                pathDir = os.path.dirname( path )
+                nameDir = os.path.dirname( os.path.normpath(name) )
+                if len(nameDir) != 0 and pathDir.endswith( os.sep + nameDir ):
+                    pathDir = pathDir[ 0:-len(nameDir)-1 ]
+                if pathDir != incDir:
+                    dirs.add( pathDir )
+            self.requiredDirs[incFile] = frozenset( dirs )
+        return self.requiredDirs[incFile]
+
+    # - - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - -
+    # Tells if one of the <system> includes of 'incFile', recorded in its
+    # entry but not followed by the scan, is found in the search paths. Names
+    # are looked up in the file index of locate(), a name with a directory
+    # part costs a stat per search path containing that directory.
+    #
+    def _CTXDepMgr__hasViewSystemIncludes( self, incFile, pathList ):
+        if incFile not in self.viewSystemIncludes:
+            self.__indexSearchPaths( pathList )
+            found = False
+            for name in self.dependencies[incFile][SYSINC_FILELIST]:
+                parts = os.path.normpath( name ).split( os.sep )
+                for candidate in self.filelist.get( parts[0], () ):
+                    if len(parts) == 1 or os.path.isfile( os.path.join(candidate, *parts[1:]) ):
+                        found = True
+                        break
+                if found:
+                    break
+            self.viewSystemIncludes[incFile] = found
+        return self.viewSystemIncludes[incFile]
+
+    # - - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - -
+    # Returns the smallest set of include directories the compiler needs to
+    # find every file 'filename' includes, directly or indirectly. Only quoted
+    # includes are followed: if a file of the closure has a <system> include
+    # found in the search paths, the needed directories can't be told and
+    # None is returned.
+    #
+    def getMinimalIncludePaths( self, filename ):
+        pathList = list(self.depPaths)
+
+        ret = set()
+        for f in self.__getIncludeClosure( filename, pathList ):
+            if self.__hasViewSystemIncludes( f, pathList ):
+                return None
+            ret.update( self.__getRequiredIncludeDirs( f, pathList ) )
+        return ret
+
+    # - - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - -
+    # Returns the directories searched for included files.
+    #
+    def getDependSearchPaths( self ):
+        return self.depPaths
+
     # - - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - -
     def hasModule( self, moduleName ):
         return self.cmods.has_key(moduleName)
@@ -628,8 +1044,10 @@ class CTXDepMgr: # The dependency manager class.
         if extraPaths != None:
             pathList.extend ( extraPaths )
 
-        #get the includes that 'filenames' depend on i.e. ( the includes files in the filenames list include )
-        depIncludes = self.__getDependentIncludes ( filenames, pathList )
+        #get the directories of the includes that 'filenames' depend on i.e. ( the includes files in the filenames list include )
+        ret = set()
+        for f in filenames:
+            ret.update( self.__getIncludeClosureDirs( f, pathList ) )
 
 #        includePaths = set ()
 #        for f in depIncludes:
@@ -643,7 +1061,6 @@ class CTXDepMgr: # The dependency manager class.
 
             #includePaths.add ( os.path.dirname (incPath) )
 
-        ret = set ( map(os.path.dirname,  depIncludes) )
         #infoMessage("pathList: %s"%", ".join(pathList), 6 )
         #infoMessage("getIncludePaths: %s"%", ".join(ret), 6 )
         #import pdb
@@ -698,6 +1115,26 @@ class CTXDepMgr: # The dependency manager class.
 
         return includeFiles
 
+    # - - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - -
+    # Returns the files included directly by 'sourceFile' as a list of
+    # (name as written, absolute path), in order of appearance. Unresolved
+    # includes are left out.
+    #
+    def getDirectIncludes( self, sourceFile ):
+
+        if self.needUpdate:
+            self.updateDependencyHash()
+
+        pathList = list(self.depPaths)
+        self.__getIncludeClosure( sourceFile, pathList )
+
+        includes = list()
+        for name in self.dependencies[sourceFile][INC_FILELIST]:
+            path = self.locate( name )
+            if path != None:
+                includes.append( (name, path) )
+        return includes
+
     # - - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - -
     def getDependenciesChecksum( self, inputFile ):
 
@@ -767,29 +1204,58 @@ class CTXDepMgr: # The dependency manager class.
     # Returns a closed set with all modules depending on given module.
     #
     # - - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - -
+    # Modules are looked up in the reverse include index as of their last
+    # scan: a module depends on the given one if one of its files includes one
+    # of the public headers of the given module. Only the modules the
+    # dependency database has no record of are scanned here, so the cost
+    # grows with the number of dependent modules rather than with the view.
+    # Without the database every module is scanned.
+    #
     def getDependentModules( self, module ):
         from ctx_cmod import CTXRawCodeModule, isContexoCodeModule
 
-        modules = list ()
-
         if not self.cmods.has_key(module):
             cmod = CTXRawCodeModule( module )
             self.updateModuleDependencies( cmod )
 
-        modulePubFiles = set(self.cmods[module].getPubHeaderFilenames())
+        scanned = dict()
+        if isinstance( self.dependencies, CTXDependencyDB ):
+            scanned = self.dependencies.getModules()
+
+        # { module root path : module name } of the modules in the view
+        candidates = dict()
+        for path in self.codeModulePaths:
+            for candName in listDirCached( path ):
+                candPath = os.path.normcase( os.path.abspath(os.path.join(path, candName)) )
+                if candPath in scanned:
+                    candidates[candPath] = candName
+                elif isContexoCodeModule( candPath ):
+                    cmod = CTXRawCodeModule( candPath )
+                    self.__updateDependencies( self.getModuleInputFiles( cmod ), list(self.depPaths) )
+                    self.__addScannedModule( cmod )
+                    candidates[candPath] = candName
 
-        candidates = finAllCodeModules( self.codeModulePaths )
-        for candidate in candidates:
-            if not self.moduleDependencies.has_key( candidate[0] ):
-                if isContexoCodeModule( candidate[1] ):
-                    cmod = CTXRawCodeModule( candidate[1] )
-                    self.updateModuleDependencies( cmod )
+        self.storeDependencies()
 
-            dependentFiles = self.moduleDependencies[candidate[0]]
-            if not modulePubFiles.isdisjoint (dependentFiles):
-                modules.append( candidate[0] )
+        # Files are located in the module root or one of its subdirectories.
+        modules = set()
+        for header in self.cmods[module].getPubHeaderFilenames():
+            for file in self.findFilesDependingOn( header ):
+                fileDir = os.path.normcase( os.path.abspath(os.path.dirname(file)) )
+                candName = candidates.get( fileDir, candidates.get(os.path.dirname(fileDir)) )
+                if candName != None:
+                    modules.add( candName )
 
-        return modules
+        return sorted( modules )
+
+    # - - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - -
+    # Records a module whose files have been scanned in the dependency
+    # database, see getDependentModules().
+    #
+    def _CTXDepMgr__addScannedModule( self, cmod ):
+        if isinstance( self.dependencies, CTXDependencyDB ):
+            rootPath = os.path.normcase( os.path.abspath(cmod.getRootPath()) )
+            self.dependencies.addModule( cmod.getName(), rootPath )
 
     # - - - - - - - - - - - - - - - - - - -  - - - - - - - - - - - - - - - - -
     def getCodeModulePaths( self ):
@@ -825,6 +1291,9 @@ class CTXDepMgr: # The dependency manager class.
     def resolveCodeModulePath( self, mod ):
         import ctx_cmod
 
+        if mod in self.resolvedModulePaths:
+            return self.resolvedModulePaths[mod]
+
         modPath = mod
 
         #if not os.path.exists( modPath ):
@@ -843,6 +1312,7 @@ class CTXDepMgr: # The dependency manager class.
 
         ctx_cmod.assertValidContexoCodeModule( modPath, self.msgSender )
 
+        self.resolvedModulePaths[mod] = modPath
         return modPath
 
 
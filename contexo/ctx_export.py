@@ -10,12 +10,57 @@
 #
 ###############################################################################
 
-from ctx_common import userErrorExit, infoMessage, getUserCfgDir, setInfoMessageVerboseLevel
+from ctx_common import userErrorExit, infoMessage, getUserCfgDir, setInfoMessageVerboseLevel, listSubdirsCached
 import ctx_cfg
 import os
+import sys
+import copy
+import struct
+import cPickle
+import cStringIO
 
+# Header of the original format, a single pickle of the whole package.
 export_header = "$EXPORT_PACKAGE$"
 
+# Header of the framed format, see CTXExportData.dispatch().
+export_header_v2 = "$EXPORT_PACKAGE_V2$"
+
+# Frame length prefix, 32 bit unsigned big endian.
+FRAME_LENGTH_FORMAT = '>I'
+FRAME_LENGTH_SIZE   = struct.calcsize( FRAME_LENGTH_FORMAT )
+
+# Items are dispatched in this order, any other items follow sorted by name.
+# Small items go first so the receiver can start working before the build
+# session and dependency manager have arrived.
+DISPATCH_ORDER = [ 'ENV', 'TESTS', 'PATHS', 'RSPEC', 'COMPONENTS', 'ALL_MODULES',
+                   'MODULE_TABLE', 'MODULES', 'SESSION', 'DEPMGR' ]
+
+# Items sent as None by a slim dispatch. The bundled export plugins read the
+# module information from MODULE_TABLE and ALL_MODULES instead.
+SLIM_OMITTED_ITEMS = [ 'DEPMGR' ]
+
+#------------------------------------------------------------------------------
+# Preprocessor define set when compiling the sources of a module.
+#------------------------------------------------------------------------------
+def makeModuleTag( moduleName ):
+    return 'COMPILING_MOD_' + moduleName.upper()
+
+#------------------------------------------------------------------------------
+# The framed format is binary, keep the C runtime from translating newlines
+# in the standard streams on Windows.
+#------------------------------------------------------------------------------
+def setBinaryMode( stream ):
+    if sys.platform == 'win32':
+        import msvcrt
+        msvcrt.setmode( stream.fileno(), os.O_BINARY )
+
+#------------------------------------------------------------------------------
+def readExact( stream, size ):
+    data = stream.read( size )
+    if len(data) != size:
+        userErrorExit("Unable to receive export package. The package is truncated.\nThis is commonly the consequence of a terminal error raised by Contexo.")
+    return data
+
 #CONTEXO_CFG_FILE    = 'contexo.cfg'
 #cfgFile = ctx_cfg.CFGFile (os.path.join( getUserCfgDir(), CONTEXO_CFG_FILE ))
 #setInfoMessageVerboseLevel( int(cfgFile.getVerboseLevel()) )
@@ -48,6 +93,11 @@ class CTXExportData:
         for section in REPO_PATH_SECTIONS:
             self.export_data['PATHS'][section.upper()] = view.getItemPaths(section)
 
+        self.export_data['ALL_MODULES']   = self.__listAllModules( self.export_data['PATHS']['MODULES'] )
+        self.export_data['MODULE_TABLE']  = self.__makeModuleTable( self.export_data['MODULES'],
+                                                                    dependency_manager,
+                                                                    self.export_data['ALL_MODULES'] )
+
         # TODO: RSpecFile can't be pickled for some reason. When it has been solved,
         # remove this code and simply pass the RSpecFile object to the client plugin.
         # Note that existing plugins then have to be updated.
@@ -65,86 +115,263 @@ class CTXExportData:
             self.export_data['RSPEC'] = recurse_level( view_rspec, self.export_data['RSPEC'] )
     
         #print self.export_data['RSPEC']
+
+    #--------------------------------------------------------------------------
+    # Returns a list with one dictionary per code module found in the module
+    # paths of the view, with the items
+    #
+    # MODNAME   Name of the module
+    # ROOT      Root directory of the module
+    # TAG       Preprocessor define set when compiling the module
+    #
+    #--------------------------------------------------------------------------
+    def __listAllModules( self, modulePaths ):
+        import ctx_cmod
+
+        allModules = list()
+        for modulePath in modulePaths:
+            if not os.path.isdir( modulePath ):
+                continue
+            for name in sorted( listSubdirsCached(modulePath) ):
+                root = os.path.join( modulePath, name )
+                if ctx_cmod.isContexoCodeModule( root ):
+                    allModules.append( { 'MODNAME': name, 'ROOT': root, 'TAG': makeModuleTag(name) } )
+
+        return allModules
+
+    #--------------------------------------------------------------------------
+    # Returns a dictionary mapping the name of each exported module to a
+    # dictionary with the items
+    #
+    # MODNAME       Name of the module
+    # ROOT          Root directory of the module
+    # SOURCES       Absolute paths of the sources
+    # PRIVHDRS      Absolute paths of the private headers
+    # PUBHDRS       Absolute paths of the public headers
+    # PRIVHDRDIR    Directory of the private headers
+    # TESTSOURCES   Absolute paths of the test sources
+    # TESTHDRS      Absolute paths of the test headers
+    # TESTDIR       Directory of the tests
+    # INCPATHS      Include paths needed by the sources and headers
+    # DEPENDS       Names of the other modules whose headers are included
+    # TAG           Preprocessor define set when compiling the module
+    #
+    # The table only holds strings and lists, so plugins can use it without
+    # scanning the view or querying the dependency manager.
+    #--------------------------------------------------------------------------
+    def __makeModuleTable( self, modules, depmgr, allModules ):
+        rootToName = dict()
+        for mod in allModules:
+            rootToName[os.path.normcase(os.path.normpath(mod['ROOT']))] = mod['MODNAME']
+
+        if isinstance( modules, dict ):
+            modules = modules.values()
+
+        moduleTable = dict()
+        for mod in modules:
+            name = mod.getName()
+            incPaths = list( depmgr.getModuleIncludePaths(name) )
+            incPaths.sort()
+
+            depends = set()
+            for incPath in incPaths:
+                depName = rootToName.get( os.path.normcase(os.path.normpath(incPath)) )
+                if depName != None and depName != name:
+                    depends.add( depName )
+            depends = list( depends )
+            depends.sort()
+
+            moduleTable[name] = { 'MODNAME':      name,
+                                  'ROOT':         mod.getRootPath(),
+                                  'SOURCES':      mod.getSourceAbsolutePaths(),
+                                  'PRIVHDRS':     mod.getPrivHeaderAbsolutePaths(),
+                                  'PUBHDRS':      mod.getPubHeaderAbsolutePaths(),
+                                  'PRIVHDRDIR':   mod.getPrivHeaderDir(),
+                                  'TESTSOURCES':  mod.getTestSourceAbsolutePaths(),
+                                  'TESTHDRS':     mod.getTestHeaderAbsolutePaths(),
+                                  'TESTDIR':      mod.getTestDir(),
+                                  'INCPATHS':     incPaths,
+                                  'DEPENDS':      depends,
+                                  'TAG':          makeModuleTag(name) }
+
+        return moduleTable
+
+    #--------------------------------------------------------------------------
+    # Returns the module table built by setExportData(), see
+    # __makeModuleTable().
+    #--------------------------------------------------------------------------
+    def getModuleTable( self ):
+        return self.export_data['MODULE_TABLE']
+
+    #--------------------------------------------------------------------------
+    # Returns the list of all modules in the view, see __listAllModules().
+    #--------------------------------------------------------------------------
+    def getAllModules( self ):
+        return self.export_data['ALL_MODULES']
+
     #------------------------------------------------------------------------------
-    # Sends the export_package as a pickle-dump to stdout. The package is directly
-    # preceeded by a header with the following format:
+    # Sends the export package to 'stream' (stdout by default). The package is
+    # preceeded by the header
+    #
+    # $EXPORT_PACKAGE_V2$
+    #
+    # followed by one frame per export data item and an empty end frame. Each
+    # frame is a 32 bit big endian length followed by a binary pickle of the
+    # tuple (item name, item value). All frames are written by the same
+    # pickler, so objects shared between items are sent once and remain
+    # shared on the receiving side. The frames must therefore be unpickled in
+    # order.
     #
-    # $EXPORT_PACKAGE:##$
+    # A slim dispatch leaves out the dependency manager, both the DEPMGR item
+    # and the one referenced by the build session, which make up most of the
+    # package. Handlers relying on them get None.
     #
-    # Where ## is an alphanumeric number specifying the size in characters of the
-    # exported chunk.
     # This function is intended to be used by the main system when sending export
-    # data to an export handler. The inverse of this method is receive().
+    # data to an export handler. The inverse of this method is receiveItems().
     #
     #------------------------------------------------------------------------------
-    def dispatch( self ):
-        import pickle
-        import sys
-        
-        export_dump = pickle.dumps( self.export_data )
-        package = '%s%d$'%(export_header, len(export_dump))
-        
+    def dispatch( self, stream = None, slim = False ):
+        if stream == None:
+            stream = sys.stdout
+            setBinaryMode( stream )
+
         infoMessage("Dispatching package to 'stdout'", 2)
-        
-        sys.stdout.write( package )
-        sys.stdout.write( export_dump )
-    
+
+        stream.write( export_header_v2 )
+
+        frame = cStringIO.StringIO()
+        pickler = cPickle.Pickler( frame, cPickle.HIGHEST_PROTOCOL )
+        for item in self.getDispatchOrder():
+            value = self.export_data[item]
+            if slim and item in SLIM_OMITTED_ITEMS:
+                value = None
+            elif slim and item == 'SESSION' and value != None:
+                value = copy.copy( value )
+                value.setDependencyManager( None )
+            pickler.dump( (item, value) )
+            stream.write( struct.pack(FRAME_LENGTH_FORMAT, frame.tell()) )
+            stream.write( frame.getvalue() )
+            frame.seek( 0 )
+            frame.truncate()
+
+        stream.write( struct.pack(FRAME_LENGTH_FORMAT, 0) )
+        stream.flush()
+
     #--------------------------------------------------------------------------
-    # Processes all data from stdin. Prints anything not recognized as part of 
+    def getDispatchOrder( self ):
+        order = [ item for item in DISPATCH_ORDER if item in self.export_data ]
+        rest = [ item for item in self.export_data.keys() if item not in DISPATCH_ORDER ]
+        rest.sort()
+        return order + rest
+
+    #--------------------------------------------------------------------------
+    # Processes all data from stdin. Prints anything not recognized as part of
     # the export data as normal text to stdout.
-    # The export buffer is unpickled and then replaces all existing export data
-    # items.
+    # All existing export data items are replaced by the received ones.
     #
     # This function is intended to be used by the receiving export handler.
     #
     #--------------------------------------------------------------------------
-    def receive( self ):
-        import pickle
-        import sys
-   
-        data_buffer = str(sys.stdin.read())
-    
+    def receive( self, stream = None ):
+        for item, value in self.receiveItems( stream ):
+            pass
+
+    #--------------------------------------------------------------------------
+    # Generator reading the export package from 'stream' (stdin by default),
+    # yielding (item name, item value) as soon as each item has been received.
+    # Received items are also added to the export data, which is truncated
+    # first. Text preceeding and following the package is printed to stdout.
+    #
+    # Packages in the original single pickle format are accepted as well,
+    # their items are yielded once the whole package has been read.
+    #
+    #--------------------------------------------------------------------------
+    def receiveItems( self, stream = None ):
+        if stream == None:
+            stream = sys.stdin
+            setBinaryMode( stream )
+
+        self.export_data = dict()
+
         #
-        # Locate package header
+        # Locate package header, the header is never split by a newline.
         #
-        
-        i = data_buffer.rfind( export_header )
-        
-        if i == -1:
-            print data_buffer #Most likely errors from main system
+
+        line = stream.readline()
+        while len(line):
+            i = line.find( export_header_v2 )
+            if i != -1:
+                sys.stdout.write( line[0:i] )
+                break
+
+            i = line.find( export_header )
+            if i != -1:
+                for item in self.__receiveLegacy( line[i:] + stream.read() ):
+                    yield item
+                return
+
+            sys.stdout.write( line )
+            line = stream.readline()
+
+        if len(line) == 0:
             infoMessage("\n********** Export handler entry point **********\n\n", 2)
             userErrorExit("Unable to receive export package. Export header not found.\nThis is commonly the consequence of a terminal error raised by Contexo.")
-            
+
+        infoMessage("\n********** Export handler entry point **********\n\n", 2)
+
         #
-        # Extract package size
+        # Unpickle frames in order, carrying the memo from one to the next
         #
-        
-        i += len(export_header)
-        size_s = ""
-        header_len = len(export_header)
-        while data_buffer[i] != '$':
-            size_s += data_buffer[i]
-            header_len += 1
-            i += 1
-            
-        header_len += 1
-        package_start = i+1
-        package_size  = int(size_s)
-        package_end   = package_start + package_size
-        
+
+        pending = cStringIO.StringIO( line[i + len(export_header_v2):] )
+        memo = dict()
+        while True:
+            length = struct.unpack( FRAME_LENGTH_FORMAT, self.__read(pending, stream, FRAME_LENGTH_SIZE) )[0]
+            if length == 0:
+                break
+
+            unpickler = cPickle.Unpickler( cStringIO.StringIO(self.__read(pending, stream, length)) )
+            unpickler.memo = memo
+            item, value = unpickler.load()
+            memo = unpickler.memo
+
+            self.export_data[item] = value
+            yield (item, value)
+
         #
-        # Extract package chunk, and print everything else as regular text
+        # Print everything following the package as regular text
         #
-        
-        package_dump = data_buffer[ package_start : package_end ]
-        print data_buffer[ 0 : package_start - header_len ]
+
+        sys.stdout.write( pending.read() )
+        sys.stdout.write( stream.read() )
+
+    #--------------------------------------------------------------------------
+    # Reads 'size' bytes, starting with what was read past the header.
+    #--------------------------------------------------------------------------
+    def __read( self, pending, stream, size ):
+        data = pending.read( size )
+        if len(data) < size:
+            data += readExact( stream, size - len(data) )
+        return data
+
+    #--------------------------------------------------------------------------
+    # Unpacks a package in the original format: the header, the size of the
+    # pickle in characters, a '$' and the pickle itself.
+    #--------------------------------------------------------------------------
+    def __receiveLegacy( self, data_buffer ):
+        import pickle
+
+        i = len(export_header)
+        j = data_buffer.find( '$', i )
+        if j == -1:
+            userErrorExit("Unable to receive export package. Malformed export header.")
+
+        package_start = j + 1
+        package_end   = package_start + int( data_buffer[i:j] )
         print data_buffer[ package_end : -1 ]
 
         infoMessage("\n********** Export handler entry point **********\n\n", 2)
-        
-        #
-        #  Unpickle
-        #        
-        
-        self.export_data = pickle.loads( package_dump )
-        
+
+        self.export_data = pickle.loads( data_buffer[ package_start : package_end ] )
+        for item, value in self.export_data.items():
+            yield (item, value)
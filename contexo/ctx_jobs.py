@@ -0,0 +1,116 @@
+###############################################################################
+#                                                                             #
+#   ctx_jobs.py                                                               #
+#   Component of Contexo Core - (c) Scalado AB 2010                           #
+#                                                                             #
+#   License GPL v2. See LICENSE.txt.                                          #
+#   ------------                                                              #
+#                                                                             #
+#   Bounded pool of worker threads used to run external tools (compilers,     #
+#   archivers) concurrently. Each worker blocks on its own child process,     #
+#   so at most 'jobCount' tool processes are alive at any time.               #
+#                                                                             #
+###############################################################################
+
+import threading
+import Queue
+
+#------------------------------------------------------------------------------
+# \class {CTXJob}
+#
+# A unit of work for CTXJobPool. 'func' is called with 'args' in a worker
+# thread. The return value ends up in 'result', and any exception raised
+# (including the SystemExit raised by userErrorExit) ends up in 'error'.
+# 'tag' is left untouched for the caller to identify the job.
+#------------------------------------------------------------------------------
+class CTXJob:
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def __init__( self, func, args = (), tag = None ):
+        self.func   = func
+        self.args   = args
+        self.tag    = tag
+        self.result = None
+        self.error  = None
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def run( self ):
+        try:
+            self.result = self.func( *self.args )
+        except BaseException, e:
+            self.error = e
+
+#------------------------------------------------------------------------------
+# \class {CTXJobPool}
+#
+# Jobs are submitted with submit() and collected, in order of completion,
+# with waitForJob(). With a job count of 1 jobs are run immediately in the
+# calling thread, which keeps the sequential build free of threads.
+#------------------------------------------------------------------------------
+class CTXJobPool:
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def __init__( self, jobCount ):
+        self.jobCount    = max( 1, int(jobCount) )
+        self.workers     = list()
+        self.workQueue   = Queue.Queue()
+        self.doneQueue   = Queue.Queue()
+        self.pending     = 0
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def __worker( self ):
+        while True:
+            job = self.workQueue.get()
+            if job == None:
+                return
+            job.run()
+            self.doneQueue.put( job )
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def __startWorkers( self ):
+        while len(self.workers) < self.jobCount:
+            worker = threading.Thread( target = self.__worker )
+            worker.setDaemon( True )
+            worker.start()
+            self.workers.append( worker )
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def submit( self, job ):
+        self.pending += 1
+        if self.jobCount == 1:
+            job.run()
+            self.doneQueue.put( job )
+        else:
+            self.__startWorkers()
+            self.workQueue.put( job )
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def pendingJobs( self ):
+        return self.pending
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Blocks until a submitted job has finished and returns it. Returns None
+    # if no jobs are pending, or if 'block' is False and no job has finished
+    # yet.
+    #
+    def waitForJob( self, block = True ):
+        if self.pending == 0:
+            return None
+
+        # Poll with a timeout, a blocking get() can't be interrupted by Ctrl-C.
+        while True:
+            try:
+                job = self.doneQueue.get( block, 0.5 )
+                break
+            except Queue.Empty:
+                if not block:
+                    return None
+
+        self.pending -= 1
+        return job
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def shutdown( self ):
+        for worker in self.workers:
+            self.workQueue.put( None )
+        for worker in self.workers:
+            worker.join()
+        self.workers = list()
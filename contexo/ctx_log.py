@@ -69,6 +69,14 @@ xml_errors_end          = "</errors>\n\n"
 xml_messages_begin      = "<messages>\n"
 xml_message             = "<msg>%s</msg>\n"
 xml_messages_end        = "</messages>\n\n"
+
+xml_commands_begin      = "<commands>\n"
+xml_command             = "<cmd ret=\"%d\" wall=\"%.3f\" cpu=\"%s\">\n  <line>%s</line>\n  <output>%s</output>\n</cmd>\n"
+xml_commands_end        = "</commands>\n\n"
+
+xml_executables_begin   = "<executables>\n"
+xml_executable          = "  <exe name=\"%s\" linked=\"%s\">%s</exe>\n"
+xml_executables_end     = "</executables>\n\n"
 #------------------------------------------------------------------------------
 
 
@@ -82,7 +90,9 @@ class CTXLog:
                     'bc': dict({'compiler': str(), 'cflags': str(), 'prep': list(), 'commandline': str() }),\
             'components': list(),\
                 'errors': list(),\
-              'messages': list() })
+              'messages': list(),\
+              'commands': list(),\
+           'executables': list() })
 
         self.curComp    = 0
         self.curLib     = 0
@@ -179,6 +189,13 @@ class CTXLog:
     #::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
     def addMessage( self, msg ):
         self.log['messages'].append( self.__newMessage(msg) )
+    #::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def addCommand( self, commandline, returncode, wallTime, cpuTime, output ):
+        self.log['commands'].append( dict({ 'commandline': commandline, 'returncode': returncode,\
+                                            'wallTime': wallTime, 'cpuTime': cpuTime, 'output': output }) )
+    #::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def addExecutable( self, name, linked, reason ):
+        self.log['executables'].append( dict({ 'name': name, 'linked': linked, 'reason': reason }) )
 
 
     #::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
@@ -188,6 +205,31 @@ class CTXLog:
             xmlbuf += xml_message       %(msg)
         return xmlbuf
 
+    #::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Commandlines and tool output are escaped, compiler messages are full
+    # of '<' and '&'.
+    def __getCommandsAsXML( self, cmdList ):
+        from xml.sax.saxutils import escape
+        xmlbuf = str()
+        for cmd in cmdList:
+            cpuTime = str()
+            if cmd['cpuTime'] != None:
+                cpuTime = "%.3f"%(cmd['cpuTime'])
+            xmlbuf += xml_command       %( cmd['returncode'], cmd['wallTime'], cpuTime,
+                                           escape(cmd['commandline']), escape(cmd['output']) )
+        return xmlbuf
+
+    #::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def __getExecutablesAsXML( self, exeList ):
+        from xml.sax.saxutils import escape
+        xmlbuf = str()
+        for exe in exeList:
+            linked = "no"
+            if exe['linked']:
+                linked = "yes"
+            xmlbuf += xml_executable    %( escape(exe['name']), linked, escape(exe['reason']) )
+        return xmlbuf
+
     #::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
     def __getErrorsAsXML( self, errList ):
         xmlbuf = str()
@@ -292,6 +334,14 @@ class CTXLog:
         xmlbuf += self.__getMessagesAsXML( log['messages'] )
         xmlbuf += xml_messages_end
 
+        xmlbuf += xml_commands_begin
+        xmlbuf += self.__getCommandsAsXML( log['commands'] )
+        xmlbuf += xml_commands_end
+
+        xmlbuf += xml_executables_begin
+        xmlbuf += self.__getExecutablesAsXML( log['executables'] )
+        xmlbuf += xml_executables_end
+
         xmlbuf += self.__getComponentsAsXML( log['components'] )
 
         xmlbuf += xml_log_end
@@ -415,6 +465,18 @@ def ctxlogAddMessage( msg ):
     if logEnabled:
         ctxlog.addMessage( msg )
 #::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+def ctxlogAddCommand( commandline, returncode, wallTime, cpuTime, output ):
+    global logEnabled
+    global ctxlog
+    if logEnabled:
+        ctxlog.addCommand( commandline, returncode, wallTime, cpuTime, output )
+#::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+def ctxlogAddExecutable( name, linked, reason ):
+    global logEnabled
+    global ctxlog
+    if logEnabled:
+        ctxlog.addExecutable( name, linked, reason )
+#::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
 def ctxlogWriteToFile( filepath, appendToExisting = True ):
     global ctxlog
     if ctxlog != None:
@@ -2,7 +2,9 @@
 
 import os.path
 import ntpath
+import cStringIO
 from xmltools import XMLGenerator
+from ctx_common import writeFileIfChanged
 #import pywintypes
 import uuid
 
@@ -42,12 +44,58 @@ def relntpath(path, start):
 
 
 #codeModules = listof dictionaries: { MODNAME: string, SOURCES: list(paths), PRIVHDRS: list(paths), PUBHDRS: list(paths), PRIVHDRDIR: string, TESTSOURCES:list }
+# Writes the project unless an identical one exists, returns the project GUID.
 def make_libvcproj8( projectName, cflags, prepDefs, codeModules, outLib,
                     debug, do_tests,  incPaths, vcprojPath, platform = 'Win32',
                     fileTitle = None, configType = 'lib',
                      additionalDependencies = None,
                      additionalLibraryDirectories = None):
 
+    vcprojFilePath, contents, GUID = render_libvcproj8( projectName, cflags, prepDefs, codeModules, outLib,
+                                                        debug, do_tests, incPaths, vcprojPath, platform,
+                                                        fileTitle, configType,
+                                                        additionalDependencies,
+                                                        additionalLibraryDirectories )
+    writeFileIfChanged( vcprojFilePath, contents )
+    return GUID
+
+
+# Takes a list of argument tuples for make_libvcproj8, renders the projects in
+# a pool of 'jobCount' processes and writes those that changed.
+# Returns ( list of GUIDs in argument order, number written, number unchanged )
+def make_libvcproj8_list( projectArgsList, jobCount = 1 ):
+    import multiprocessing
+
+    if jobCount > 1 and len(projectArgsList) > 1:
+        pool = multiprocessing.Pool( min(jobCount, len(projectArgsList)) )
+        rendered = pool.map( render_libvcproj8_job, projectArgsList )
+        pool.close()
+        pool.join()
+    else:
+        rendered = map( render_libvcproj8_job, projectArgsList )
+
+    GUIDs = list()
+    written = 0
+    for vcprojFilePath, contents, GUID in rendered:
+        if writeFileIfChanged( vcprojFilePath, contents ):
+            written += 1
+        GUIDs.append( GUID )
+
+    return ( GUIDs, written, len(rendered) - written )
+
+
+# Pool entry point, must be a module level function to be picklable.
+def render_libvcproj8_job( projectArgs ):
+    return render_libvcproj8( *projectArgs )
+
+
+# Returns ( project file path, project file contents, project GUID ), see make_libvcproj8
+def render_libvcproj8( projectName, cflags, prepDefs, codeModules, outLib,
+                      debug, do_tests,  incPaths, vcprojPath, platform = 'Win32',
+                      fileTitle = None, configType = 'lib',
+                      additionalDependencies = None,
+                      additionalLibraryDirectories = None):
+
 
     import os.path
     vcprojFilePath = str()
@@ -56,7 +104,7 @@ def make_libvcproj8( projectName, cflags, prepDefs, codeModules, outLib,
         fileTitle = projectName
 
     vcprojFilePath  = os.path.join( vcprojPath, fileTitle + ".vcproj" )
-    vcprojFile      = open( vcprojFilePath, 'w')
+    vcprojFile      = cStringIO.StringIO()
     project         = XMLGenerator( vcprojFile )
 
     #GUID            = str(pywintypes.CreateGuid())
@@ -273,12 +321,14 @@ def make_libvcproj8( projectName, cflags, prepDefs, codeModules, outLib,
 
     project.endElement ('VisualStudioProject')
 
+    contents = vcprojFile.getvalue()
     vcprojFile.close ()
 
-    return GUID
+    return ( vcprojFilePath, contents, GUID )
 
 
 # name:string, path:string, projects:list( dict{ PROJNAME:string PROJGUID:string, DEBUG:True/False } ), exeproject: dict{ PROJNAME:string PROJGUID:string, DEBUG:True/False }
+# Returns True if the solution file was written, False if it was up to date.
 def make_solution8( name, path, projects, exeproject = None, platform = 'Win32' ):
 
     if not os.path.exists( path ):
@@ -291,7 +341,7 @@ def make_solution8( name, path, projects, exeproject = None, platform = 'Win32'
 
 
     filePath = os.path.join( path, name )
-    slnFile = open( filePath, "w" )
+    slnFile = cStringIO.StringIO()
 
     slnFile.write( "Microsoft Visual Studio Solution File, Format Version 9.00\n# Visual Studio 2005" )
 
@@ -370,12 +420,11 @@ EndGlobal"""
 
     slnFile.write( globalEnd )
 
-
-
-
-
+    contents = slnFile.getvalue()
     slnFile.close()
 
+    return writeFileIfChanged( filePath, contents )
+
 
 
 
@@ -645,9 +694,7 @@ def update_vcproj8(filename,parameters):
             for t in tools:
                 t.set(p['KEY'],p['VALUE'])
 
-    f = open( filename, 'w')
-    f.write(ET.tostring(root))
-    f.close()
+    return writeFileIfChanged( filename, ET.tostring(root) )
 
 #return:dict{ FILENAME:string, PROJNAME:string, GUID:string }
 def get_info_vcproj8(filename):
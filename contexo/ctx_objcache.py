@@ -0,0 +1,204 @@
+###############################################################################
+#                                                                             #
+#   ctx_objcache.py                                                           #
+#   Component of Contexo Core - (c) Scalado AB 2010                           #
+#                                                                             #
+#   License GPL v2. See LICENSE.txt.                                          #
+#   ------------                                                              #
+#                                                                             #
+#   Persistent object file cache shared by all views and build directories    #
+#   of a user. Objects are stored under a key derived from the object         #
+#   checksum, so any build producing the same checksum can reuse them.        #
+#                                                                             #
+###############################################################################
+
+import os
+import shutil
+import hashlib
+import cPickle
+from ctx_common import *
+
+STATS_FILENAME      = 'stats.dat'
+DEFAULT_SIZE_MB     = 2048
+
+#------------------------------------------------------------------------------
+# \class {CTXObjectCache}
+#
+# Entries are plain files named by their key, spread over 256 subdirectories.
+# The modification time of an entry is refreshed on every hit and is used as
+# the LRU order when the cache is trimmed to its size limit.
+#------------------------------------------------------------------------------
+class CTXObjectCache:
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def __init__( self, cacheDir = None, maxSizeMB = DEFAULT_SIZE_MB ):
+        if cacheDir == None:
+            cacheDir = os.path.join( getUserCfgDir(), 'objcache' )
+
+        self.cacheDir   = os.path.abspath( os.path.expanduser(cacheDir) )
+        self.maxSize    = int(maxSizeMB) * 1024 * 1024
+        self.hits       = 0
+        self.misses     = 0
+        self.stored     = 0
+
+        if not os.path.isdir( self.cacheDir ):
+            os.makedirs( self.cacheDir )
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # The object checksum covers the sources, headers and build parameters.
+    # The compiler commandline mask and tools are added so that objects built
+    # by different CDEFs are never mixed up.
+    #
+    def makeKey( self, objChecksum, objFilename, cdef ):
+        md = hashlib.md5()
+        md.update( objChecksum )
+        md.update( objFilename )
+        for key in ['CCCOM', 'CXXCOM', 'CC', 'CXX']:
+            md.update( str(cdef.get(key, '')) )
+        return md.hexdigest()
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def makeEntryPath( self, key ):
+        return os.path.join( self.cacheDir, key[0:2], key )
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Places the cached object for 'key' at 'targetPath'. Returns False if
+    # the cache has no such object.
+    #
+    def fetch( self, key, targetPath ):
+        entryPath = self.makeEntryPath( key )
+        if not os.path.isfile( entryPath ):
+            self.misses += 1
+            return False
+
+        if os.path.exists( targetPath ):
+            os.remove( targetPath )
+
+        try:
+            os.link( entryPath, targetPath )
+        except (AttributeError, OSError):
+            # No hard links on this platform, or cache on another volume.
+            shutil.copyfile( entryPath, targetPath )
+
+        try:
+            os.utime( entryPath, None )
+        except OSError:
+            pass
+
+        self.hits += 1
+        return True
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Adds a freshly built object to the cache. The object is copied to a
+    # temporary name first and renamed into place, so concurrent builds never
+    # see a partially written entry.
+    #
+    def store( self, key, objectPath ):
+        entryPath = self.makeEntryPath( key )
+        entryDir  = os.path.dirname( entryPath )
+
+        try:
+            if not os.path.isdir( entryDir ):
+                os.makedirs( entryDir )
+
+            tmpPath = "%s.%d.tmp"%( entryPath, os.getpid() )
+            shutil.copyfile( objectPath, tmpPath )
+            if os.path.exists( entryPath ):
+                os.remove( entryPath )
+            os.rename( tmpPath, entryPath )
+        except (IOError, OSError), e:
+            warningMessage("Failed to store '%s' in object cache: %s"%(os.path.basename(objectPath), e))
+            return
+
+        self.stored += 1
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Returns a list of (mtime, size, path) for all entries.
+    #
+    def listEntries( self ):
+        entries = list()
+        for subdir in os.listdir( self.cacheDir ):
+            subdirPath = os.path.join( self.cacheDir, subdir )
+            if not os.path.isdir( subdirPath ):
+                continue
+            for name in os.listdir( subdirPath ):
+                entryPath = os.path.join( subdirPath, name )
+                try:
+                    st = os.stat( entryPath )
+                except OSError:
+                    continue
+                entries.append( (st.st_mtime, st.st_size, entryPath) )
+        return entries
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Evicts the least recently used entries until the cache fits in
+    # 'maxSize' bytes (the configured limit by default). Returns the number
+    # of removed entries and the number of bytes freed.
+    #
+    def prune( self, maxSize = None ):
+        if maxSize == None:
+            maxSize = self.maxSize
+
+        entries = self.listEntries()
+        entries.sort()
+
+        totalSize = 0
+        for mtime, size, path in entries:
+            totalSize += size
+
+        removed = 0
+        freed   = 0
+        for mtime, size, path in entries:
+            if totalSize - freed <= maxSize:
+                break
+            try:
+                os.remove( path )
+            except OSError:
+                continue
+            removed += 1
+            freed   += size
+
+        return (removed, freed)
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def loadStats( self ):
+        stats = { 'hits': 0, 'misses': 0, 'stored': 0 }
+        statsPath = os.path.join( self.cacheDir, STATS_FILENAME )
+        if os.path.exists( statsPath ):
+            try:
+                f = open( statsPath, 'rb' )
+                stats.update( cPickle.load(f) )
+                f.close()
+            except (IOError, EOFError, cPickle.UnpicklingError):
+                pass
+        return stats
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    # Adds the counters of this session to the persistent statistics and
+    # trims the cache to its size limit.
+    #
+    def close( self ):
+        stats = self.loadStats()
+        stats['hits']   += self.hits
+        stats['misses'] += self.misses
+        stats['stored'] += self.stored
+
+        statsPath = os.path.join( self.cacheDir, STATS_FILENAME )
+        f = open( statsPath, 'wb' )
+        cPickle.dump( stats, f, cPickle.HIGHEST_PROTOCOL )
+        f.close()
+
+        infoMessage("Object cache: %d hit(s), %d miss(es), %d stored"%(self.hits, self.misses, self.stored), 1)
+
+        self.hits   = 0
+        self.misses = 0
+        self.stored = 0
+
+        removed, freed = self.prune()
+        if removed != 0:
+            infoMessage("Object cache: evicted %d object(s), %d bytes"%(removed, freed), 2)
+
+    #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+    def resetStats( self ):
+        statsPath = os.path.join( self.cacheDir, STATS_FILENAME )
+        if os.path.exists( statsPath ):
+            os.remove( statsPath )
@@ -191,8 +191,17 @@ class CTXRepository:
     # of paths (including item names) where the queried item exists, and the
     # second element is a list of paths (excluding item names) where this
     # method searched for the queried item.
+    # Directory contents are taken from 'location_index' (a CTXLocationIndex)
+    # if given.
     #--------------------------------------------------------------------------
-    def locateItem( self, item, path_section ):
+    def locateItem( self, item, path_section, location_index = None ):
+
+        def listItems( path ):
+            if location_index != None:
+                return location_index.getNames( path )
+            if not os.path.isdir( path ):
+                return None
+            return os.listdir( path )
 
         local_paths = self.getFullPaths( path_section )
         remote_paths = list()
@@ -201,10 +210,11 @@ class CTXRepository:
 
         for path in local_paths:
             tried_locations.append( path )
-            if not os.path.isdir(path):
+            names = listItems( path )
+            if names == None:
                 tried_locations[-1] += " (path not found)"
             else:
-                if item in os.listdir(path):
+                if item in names:
                     candidate_locations.append( os.path.join(path, item) )
 
         # As a secondary measure, if this is a non version controlled
@@ -216,9 +226,10 @@ class CTXRepository:
                 remote_paths.append( os.path.join(self.getHref(), relpath) )
 
             for path in remote_paths:
-                if os.path.isdir( path ):
+                names = listItems( path )
+                if names != None:
                     tried_locations.append( path )
-                    if item in os.listdir(path):
+                    if item in names:
                         candidate_locations.append( os.path.join(path, item) )
                 else:
                     warningMessage("Repository path '%s' doesn't exist"%(path))
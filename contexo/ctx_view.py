@@ -15,7 +15,13 @@ from ctx_rspec import RSpecFile, RSpecFileLocator
 from ctx_repo_svn import *
 from ctx_common import userErrorExit
 from ctx_common import warningMessage, assureList
+from ctx_common import getUserTempDir, getDirListing
 from os import sep
+import stat
+import time
+import atexit
+import cPickle
+import hashlib
 
 SYSGLOBAL_PATH_SECTIONS = ['modules',
                            'cdef',
@@ -34,6 +40,123 @@ AP_FLAGS = dict( {AP_PREFER_REMOTE_ACCESS: 'default behaviour',
 
 default_access_policy = AP_PREFER_REMOTE_ACCESS
 
+LOCATION_INDEX_VERSION  = 2
+
+# Directory modification times have a coarse resolution on some file systems
+# (1 s on ext3, HFS+ and many NFS servers, 2 s on FAT), so an entry added in
+# the same tick as a listing leaves the modification time unchanged. Listings
+# of directories modified this close to the time the index is saved are not
+# kept for later runs.
+LOCATION_INDEX_MTIME_SLACK = 2.0
+
+location_indexes = dict() # { index path: CTXLocationIndex }, saved at exit
+
+#------------------------------------------------------------------------------
+# Returns the location index of a view, stored in the user temp directory.
+# All views using the same index share it, and all indexes are saved by a
+# single exit handler.
+#------------------------------------------------------------------------------
+def getLocationIndex( view_path ):
+    m = hashlib.md5()
+    m.update( os.path.normcase(os.path.abspath(view_path)) )
+    index_path = os.path.join( getUserTempDir(), "ctxindex_%s.dat"%(m.hexdigest()) )
+
+    index = location_indexes.get( index_path )
+    if index == None:
+        if len(location_indexes) == 0:
+            atexit.register( saveLocationIndexes )
+        index = CTXLocationIndex( index_path )
+        location_indexes[index_path] = index
+    return index
+
+#------------------------------------------------------------------------------
+def saveLocationIndexes():
+    for index in location_indexes.values():
+        index.save()
+
+#------------------------------------------------------------------------------
+# Persistent index of the contents of the directories items are located in.
+# A directory is checked once per process: it is only listed again (through
+# the directory listing cache of ctx_common) when its modification time
+# differs from the one recorded in the index, and later lookups are
+# dictionary hits. The index is written back when the process exits, if it
+# was changed.
+#------------------------------------------------------------------------------
+class CTXLocationIndex:
+    def __init__( self, index_path ):
+        self.index_path = index_path
+        self.dirs = dict() # { dir_path: (mtime, frozenset(names)) }, as saved
+        self.names = dict() # { dir_path: frozenset(names) or None }, checked by this process
+        self.dirty = False
+
+        if os.path.isfile( self.index_path ):
+            try:
+                f = open( self.index_path, 'rb' )
+                data = cPickle.load( f )
+                f.close()
+                if data.get('version') == LOCATION_INDEX_VERSION:
+                    self.dirs = data['dirs']
+            except (IOError, EOFError, AttributeError, cPickle.UnpicklingError):
+                infoMessage("Ignoring unreadable location index '%s'"%(self.index_path), 2)
+
+    #--------------------------------------------------------------------------
+    # Returns the set of names in a directory, or None if the path is not a
+    # directory.
+    #--------------------------------------------------------------------------
+    def getNames( self, dir_path ):
+        if dir_path in self.names:
+            return self.names[dir_path]
+
+        entry = self.dirs.get( dir_path )
+        try:
+            st = os.stat( dir_path )
+            if not stat.S_ISDIR( st.st_mode ):
+                st = None
+            elif entry == None or entry[0] != st.st_mtime:
+                listing = getDirListing( dir_path )
+                entry = ( listing[0], frozenset(listing[1]) )
+                self.dirs[dir_path] = entry
+                self.dirty = True
+        except OSError:
+            st = None
+
+        names = None
+        if st == None:
+            if self.dirs.pop( dir_path, None ) != None:
+                self.dirty = True
+        else:
+            names = entry[1]
+
+        self.names[dir_path] = names
+        return names
+
+    #--------------------------------------------------------------------------
+    def save( self ):
+        if not self.dirty:
+            return
+
+        # Drop the listings that may have missed an entry added in the same
+        # modification time tick, they are listed again by the next run.
+        now = time.time()
+        dirs = dict()
+        for dir_path, entry in self.dirs.iteritems():
+            if abs( now - entry[0] ) > LOCATION_INDEX_MTIME_SLACK:
+                dirs[dir_path] = entry
+
+        tmp_path = "%s.%d.tmp"%( self.index_path, os.getpid() )
+        try:
+            f = open( tmp_path, 'wb' )
+            cPickle.dump( {'version': LOCATION_INDEX_VERSION, 'dirs': dirs}, f, cPickle.HIGHEST_PROTOCOL )
+            f.close()
+            if os.path.exists( self.index_path ):
+                os.remove( self.index_path )
+            os.rename( tmp_path, self.index_path )
+        except (IOError, OSError), e:
+            infoMessage("Failed to write location index '%s': %s"%(self.index_path, e), 2)
+            return
+
+        self.dirty = False
+
 #------------------------------------------------------------------------------
 class CTXView:
     def __init__(self, view_path, access_policy=AP_PREFER_REMOTE_ACCESS, updating=False, validate=True ):
@@ -43,6 +166,7 @@ class CTXView:
         self.access_policy = access_policy
         self.updating = updating # True when the view is being updated instead of used for building
         self.msgSender = "CTXView"
+        self.location_index = getLocationIndex( self.localPath )
 
         infoMessage("Using view: %s "%(self.getRoot()), 2)
 
@@ -233,7 +357,7 @@ class CTXView:
             # Always prioritize locating items from the RSpec repositories
             if path_section in REPO_PATH_SECTIONS and self.getRSpec() != None:
                 for repo in self.getRSpec().getRepositories():
-                    repo_candidates, repo_tried = repo.locateItem( item, path_section )
+                    repo_candidates, repo_tried = repo.locateItem( item, path_section, self.location_index )
                     candidate_locations.extend( repo_candidates )
                     tried_locations.extend( repo_tried )
 
@@ -258,8 +382,9 @@ class CTXView:
             if path_section in SYSGLOBAL_PATH_SECTIONS:
                 for path in self.getGlobalPaths(path_section):
                     tried_locations.append( path )
-                    if os.path.isdir(path):
-                        if item in os.listdir(path):
+                    names = self.location_index.getNames( path )
+                    if names != None:
+                        if item in names:
                             candidate_locations.append( os.path.join(path, item) )
                     else:
                         tried_locations[-1] = tried_locations[-1] + " (path not found)"
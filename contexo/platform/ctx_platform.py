@@ -13,14 +13,114 @@
 ###############################################################################
 
 import os
+import re
+import sys
+import time
+import errno
+import shlex
+import threading
+import subprocess
 from contexo.ctx_common import infoMessage
 
-def executeCommandline( commandline ):
-    if os.name == 'nt':
-        infoMessage("Executing: %s"%commandline, 5)
+# Commandlines containing any of these are run through the shell, all other
+# commandlines start the tool directly.
+if os.name == 'nt':
+    shellMetaChars = re.compile( r'[&|<>^%]' )
+else:
+    shellMetaChars = re.compile( r'[|&;<>()$`*?\[\]{}~#\n]|^\s*\w+=' )
+
+# Serializes the output of commands running in different threads.
+outputLock = threading.Lock()
+
+#------------------------------------------------------------------------------
+# Outcome of a command run by runCommandline(). 'output' holds stdout and
+# stderr merged in the order the tool wrote them. 'cpuTime' is the user and
+# system time of the process, or None where the platform can't tell.
+#------------------------------------------------------------------------------
+class CTXCommandResult:
+    def __init__( self, commandline ):
+        self.commandline = commandline
+        self.returncode  = None
+        self.output      = str()
+        self.wallTime    = 0.0
+        self.cpuTime     = None
+
+#------------------------------------------------------------------------------
+def waitForProcess( proc, result ):
+    if not hasattr( os, 'wait4' ):
+        result.returncode = proc.wait()
+        return
+
+    while True:
+        try:
+            pid, status, rusage = os.wait4( proc.pid, 0 )
+            break
+        except OSError, e:
+            if e.errno != errno.EINTR:
+                raise
+
+    if os.WIFSIGNALED( status ):
+        result.returncode = -os.WTERMSIG( status )
+    else:
+        result.returncode = os.WEXITSTATUS( status )
+    result.cpuTime = rusage.ru_utime + rusage.ru_stime
+
+    # Already reaped, keep Popen from waiting for it again.
+    proc.returncode = result.returncode
+
+#------------------------------------------------------------------------------
+# Runs a commandline and returns a CTXCommandResult. The output of the
+# command is printed in one piece once it has finished, so commands run from
+# several threads never mix their output, and is added to the build log
+# along with the timing. Safe to call from worker threads.
+#------------------------------------------------------------------------------
+def runCommandline( commandline, cwd = None ):
+    infoMessage("Executing: %s"%commandline, 5)
+
+    result   = CTXCommandResult( commandline )
+    useShell = shellMetaChars.search( commandline ) != None
+    args     = commandline
+    if not useShell and os.name != 'nt':
+        try:
+            args = shlex.split( commandline )
+        except ValueError:
+            useShell = True
+
+    # Commandlines run concurrently from worker threads. Without close_fds a
+    # child inherits the output pipes of the processes started alongside it,
+    # and their readers don't see end of file before it exits. Python 2 can't
+    # combine close_fds with redirection on Windows.
+    t0 = time.time()
+    try:
+        proc = subprocess.Popen( args, shell = useShell, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, close_fds = (os.name != 'nt'), cwd = cwd )
+    except OSError, e:
+        # Report a missing tool the way the shell would have.
+        result.returncode = 127
+        result.output     = "%s: %s\n"%( commandline.split(' ')[0], e.strerror )
     else:
-        infoMessage("Executing: %s"%commandline, 5)
-    return os.system( commandline )
+        result.output = proc.stdout.read()
+        proc.stdout.close()
+        waitForProcess( proc, result )
+    result.wallTime = time.time() - t0
+
+    if len(result.output) != 0:
+        outputLock.acquire()
+        try:
+            sys.stdout.write( result.output )
+            sys.stdout.flush()
+        finally:
+            outputLock.release()
+
+    from contexo import ctx_log
+    ctx_log.ctxlogAddCommand( commandline, result.returncode, result.wallTime, result.cpuTime, result.output )
+
+    return result
+
+#------------------------------------------------------------------------------
+# Runs a commandline and returns its exit code.
+#------------------------------------------------------------------------------
+def executeCommandline( commandline, cwd = None ):
+    return runCommandline( commandline, cwd ).returncode
 
 def shortenPathIfPossible( longPath ):
     shortPath = longPath
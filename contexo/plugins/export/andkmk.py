@@ -2,7 +2,7 @@
 import sys
 from argparse import ArgumentParser, RawDescriptionHelpFormatter
 import contexo.ctx_export as ctx_export
-from contexo.ctx_common import infoMessage, userErrorExit, warningMessage
+from contexo.ctx_common import infoMessage, userErrorExit, warningMessage, writeFileIfChanged
 import os
 import re
 import contexo.ctx_bc
@@ -12,41 +12,148 @@ import contexo.ctx_cmod
 msgSender = 'Android MK Export'
 
 
-def computeLinkOrder(modules, depMgr):
-    """Returns a list containing modules sorted by contexo dependencies.
-    Note that this is not a very good way to determine link order, and
-    it will probably be faulty.
+def computeLinkOrder(modules):
+    """Returns a list containing modules sorted by contexo dependencies,
+    each module before the modules it depends on. A module depends on
+    another if any of its code modules includes headers of the other.
+    Modules in a dependency cycle are reported and placed together, after
+    all modules depending on the cycle and before all modules the cycle
+    depends on. The modules of a cycle are listed twice, so that a single
+    pass linker resolves the references between them.
+
+    >>> def lib(name, deps):
+    ...     return {'LIBNAME': name, 'MODULELIST': [{'MODNAME': name, 'DEPENDS': deps}]}
+    >>> modules = [lib('core', []), lib('base', ['core']), lib('A', ['B']),
+    ...            lib('B', ['A', 'base']), lib('top', ['A'])]
+    >>> [module['LIBNAME'] for module in computeLinkOrder(modules)]
+    ['top', 'A', 'B', 'A', 'B', 'base', 'core']
     """
     ctxMod2Lib = {}
     for module in modules:
         for ctxMod in module['MODULELIST']:
             ctxMod2Lib[ctxMod["MODNAME"]] = module['LIBNAME']
+
+    # depMap[lib] is the set of libraries lib depends on.
     depMap = {}
     for module in modules:
-        depMap[module['LIBNAME']] = []
-        addedPaths = {} # Not to add the same path several times
+        depMap[module['LIBNAME']] = set()
+    for module in modules:
+        libDeps = depMap[module['LIBNAME']]
         for ctxMod in module['MODULELIST']:
-            for path in depMgr.getModuleIncludePaths(ctxMod['MODNAME']):
-                if True:#contexo.ctx_cmod.isContexoCodeModule(path):
-                    modName = os.path.split(path)[1]
-                    if not addedPaths.has_key(modName) and ctxMod2Lib.has_key(modName) and not (ctxMod2Lib[modName] == module['LIBNAME']):
-                        addedPaths[modName] = True
-                        if not ctxMod2Lib[modName] in depMap[module['LIBNAME']]:
-                            depMap[module['LIBNAME']].append(ctxMod2Lib[modName])
-
-    def cmpByDeps(amod1, amod2):
-        mod1depsOn2 = amod2['LIBNAME'] in depMap[amod1['LIBNAME']]
-        mod2depsOn1 = amod1['LIBNAME'] in depMap[amod2['LIBNAME']]
-        if mod1depsOn2 and mod2depsOn1:
-            return 0
-        elif mod1depsOn2 :
-            return 1
-        else:
-            return -1
-    sortedMods = [mod for mod in modules]
-    sortedMods.sort(cmp=cmpByDeps)
-    sortedMods.reverse()
-    return sortedMods
+            for modName in ctxMod['DEPENDS']:
+                depLib = ctxMod2Lib.get(modName)
+                if depLib != None and depLib != module['LIBNAME']:
+                    libDeps.add(depLib)
+
+    # Collapse each dependency cycle into one node. componentOf[lib] is the
+    # index of the component of lib in components, whose members are kept
+    # in their original order.
+    order = dict([(module['LIBNAME'], i) for i, module in enumerate(modules)])
+    components = findComponents(depMap.keys(), depMap)
+    componentOf = {}
+    for i, component in enumerate(components):
+        component.sort(key=lambda lib: order[lib])
+        for lib in component:
+            componentOf[lib] = i
+
+    # componentDeps[i] is the set of components component i depends on,
+    # dependants[i] the number of components depending on component i.
+    componentDeps = [set() for component in components]
+    dependants = [0] * len(components)
+    for lib, libDeps in depMap.iteritems():
+        for depLib in libDeps:
+            i, j = componentOf[lib], componentOf[depLib]
+            if i != j and j not in componentDeps[i]:
+                componentDeps[i].add(j)
+                dependants[j] += 1
+
+    # Kahn's algorithm on the collapsed graph, starting from the components
+    # nothing depends on. Ties are broken by the original order of their
+    # first member to keep the result stable.
+    first = lambda i: order[components[i][0]]
+    ready = [i for i in range(len(components)) if dependants[i] == 0]
+    ready.sort(key=first, reverse=True)
+    sortedLibs = []
+    while len(ready) > 0:
+        i = ready.pop()
+        component = components[i]
+        if len(component) > 1:
+            cycle = findCycle(component[0], set(component), depMap)
+            warningMessage("Circular library dependency: %s" % (" -> ".join(cycle + [cycle[0]])))
+            sortedLibs.extend(component)
+        sortedLibs.extend(component)
+        released = []
+        for j in componentDeps[i]:
+            dependants[j] -= 1
+            if dependants[j] == 0:
+                released.append(j)
+        ready.extend(released)
+        ready.sort(key=first, reverse=True)
+
+    libModules = dict([(module['LIBNAME'], module) for module in modules])
+    return [libModules[lib] for lib in sortedLibs]
+
+def findComponents(libs, depMap):
+    """Returns the strongly connected components among libs, as lists of
+    library names, using Tarjan's algorithm.
+    """
+    libs = set(libs)
+    index = {}
+    lowLink = {}
+    stack = []
+    onStack = set()
+    components = []
+    counter = [0]
+
+    def strongConnect(lib):
+        # Recursion depth is bounded by the number of libraries.
+        index[lib] = lowLink[lib] = counter[0]
+        counter[0] += 1
+        stack.append(lib)
+        onStack.add(lib)
+        for depLib in depMap[lib]:
+            if depLib not in libs:
+                continue
+            if depLib not in index:
+                strongConnect(depLib)
+                lowLink[lib] = min(lowLink[lib], lowLink[depLib])
+            elif depLib in onStack:
+                lowLink[lib] = min(lowLink[lib], index[depLib])
+        if lowLink[lib] == index[lib]:
+            component = []
+            while True:
+                member = stack.pop()
+                onStack.discard(member)
+                component.append(member)
+                if member == lib:
+                    break
+            components.append(component)
+
+    for lib in sorted(libs):
+        if lib not in index:
+            strongConnect(lib)
+    return components
+
+def findCycle(start, component, depMap):
+    """Returns a path from start back to itself within component."""
+    path = [start]
+    visited = set([start])
+    parents = {}
+    queue = [start]
+    while len(queue) > 0:
+        lib = queue.pop(0)
+        for depLib in sorted(depMap[lib]):
+            if depLib == start:
+                path = [lib]
+                while path[-1] != start:
+                    path.append(parents[path[-1]])
+                path.reverse()
+                return path
+            if depLib in component and depLib not in visited:
+                visited.add(depLib)
+                parents[depLib] = lib
+                queue.append(depLib)
+    return path
 
 absPathSub = ["", ""]
 relPathSub = ["", ""]
@@ -118,7 +225,7 @@ def computeRelPath(fromPath, toPath):
     newComps.extend(toComps[i:])
     return "/".join(newComps)
 
-def moduleMk(module, build_params, modules, incPaths, depMgr, lclDstDir, args, useMkDir=True, localPath=None, useObjOutPath=False):
+def moduleMk(module, build_params, modules, incPaths, modIncPaths, lclDstDir, args, useMkDir=True, localPath=None, useObjOutPath=False):
     """Returns a string containing Android.mk data for module.
     Several calls to this function can be combined into the same
     makefile.
@@ -174,10 +281,10 @@ def moduleMk(module, build_params, modules, incPaths, depMgr, lclDstDir, args, u
             lclIncPaths.append(_incPath(os.path.join(ctxMod['ROOT'], "inc")))
         for incPath in incPaths:
             lclIncPaths.append(_incPath(incPath))
-    if depMgr <> None:
+    if modIncPaths:
         addedPaths = {} # Not to add the same path several times
         for ctxMod in module['MODULELIST']:
-            for path in depMgr.getModuleIncludePaths(ctxMod['MODNAME']):
+            for path in ctxMod['INCPATHS']:
                 _lclPath = _incPath(path)
                 if not addedPaths.has_key(_lclPath):
                     lclIncPaths.append(_lclPath)
@@ -208,7 +315,7 @@ def moduleMk(module, build_params, modules, incPaths, depMgr, lclDstDir, args, u
 
     if module.has_key('SHAREDOBJECT') and module['SHAREDOBJECT']:
         if staticLibs == None:
-            depMods = computeLinkOrder(modules, depMgr)
+            depMods = computeLinkOrder(modules)
             depMods = [depMod["LIBNAME"] for depMod in depMods]
         else:
             depMods = staticLibs
@@ -231,36 +338,6 @@ def moduleMk(module, build_params, modules, incPaths, depMgr, lclDstDir, args, u
 
     return "".join(outData)
 
-#------------------------------------------------------------------------------
-def create_module_mapping_from_module_list( ctx_module_list ):
-
-    code_module_map = list()
-
-    for mod in ctx_module_list:
-        srcFiles = list()
-        privHdrs = list()
-        pubHdrs  = list()
-
-        rawMod = mod #ctx_cmod.CTXRawCodeModule( mod )
-
-        srcNames = rawMod.getSourceFilenames()
-        for srcName in srcNames:
-            srcFiles.append( os.path.join( rawMod.getSourceDir(), srcName ) )
-
-        privHdrNames = rawMod.getPrivHeaderFilenames()
-        for privHdrName in privHdrNames:
-            privHdrs.append( os.path.join( rawMod.getPrivHeaderDir(), privHdrName ) )
-
-        pubHdrNames = rawMod.getPubHeaderFilenames()
-        for pubHdrName in pubHdrNames:
-            pubHdrs.append( os.path.join( rawMod.getPubHeaderDir(), pubHdrName ) )
-
-
-        modDict = { 'MODNAME': rawMod.getName(), 'SOURCES': srcFiles, 'PRIVHDRS': privHdrs, 'PUBHDRS': pubHdrs, 'PRIVHDRDIR': rawMod.getPrivHeaderDir(), 'ROOT' : rawMod.getRootPath() }
-        code_module_map.append( modDict )
-
-    return code_module_map
-
 #------------------------------------------------------------------------------
 def allComponentModules( component_list ):
 
@@ -272,11 +349,12 @@ def allComponentModules( component_list ):
     return modules
 
 #------------------------------------------------------------------------------
-def cmd_parse( args ):
+def cmd_parse( args, package = None ):
     import string
-    infoMessage("Receiving export data from Contexo...", 1)
-    package = ctx_export.CTXExportData()
-    package.receive() # Reads pickled export data from stdin
+    if package == None:
+        infoMessage("Receiving export data from Contexo...", 1)
+        package = ctx_export.CTXExportData()
+        package.receive() # Reads pickled export data from stdin
 
     infoMessage("Received export data:", 4)
     for item in package.export_data.keys():
@@ -288,27 +366,6 @@ def cmd_parse( args ):
 
     #TODO? debugmode = bool( not args.release )
 
-    #
-    # Add module paths/repositories as include directories
-    #
-
-    modTags     = list()
-    incPaths    = list()
-    depRoots    = package.export_data['PATHS']['MODULES']
-    depMgr      = package.export_data['DEPMGR']
-    for depRoot in depRoots:
-        incPathCandidates = os.listdir( depRoot )
-        for cand in incPathCandidates:
-            path = os.path.join(depRoot, cand)
-            if contexo.ctx_cmod.isContexoCodeModule( path ):
-                rawMod = contexo.ctx_cmod.CTXRawCodeModule(path)
-                incPaths.append( path )
-
-                # Only include private headers for projects containing the specified module
-                #incPaths.append( os.path.join(rawMod.getRootPath(), rawMod.getPrivHeaderDir()) )
-
-                modTags.append( 'COMPILING_MOD_' + string.upper( rawMod.getName() ) )
-
     #
     # Determine if we're exporting components or modules, and do some related
     # sanity checks
@@ -324,7 +381,7 @@ def cmd_parse( args ):
         userErrorExit( "No components specified. Currently no support for module-export.")
 
     # Regardless if we export components or modules, all modules are located in export_data['MODULES']
-    module_map = create_module_mapping_from_module_list( package.export_data['MODULES'].values() )
+    module_map = package.getModuleTable().values()
 
     allSources = [] # Used to find a common path.
     allCtxMods = {}
@@ -442,6 +499,18 @@ def cmd_parse( args ):
     sharedRelPath = "shared"
 
     mkFileVerbosity = 1
+    mkFileCounts = {"written" : 0, "unchanged" : 0}
+
+    # Makefiles are only written if their contents changed, so ndk-build
+    # doesn't rebuild libraries whose makefiles were merely regenerated.
+    def writeMk(fileName, data):
+        if writeFileIfChanged(fileName, data, "wt"):
+            mkFileCounts["written"] += 1
+            infoMessage("Created %s" % (fileName), mkFileVerbosity)
+        else:
+            mkFileCounts["unchanged"] += 1
+            infoMessage("Unchanged %s" % (fileName), mkFileVerbosity + 1)
+
     if not omits["static"] and len(staticLibs) > 0:
         if not allInOne:
             for staticLib in staticLibs:
@@ -451,24 +520,18 @@ def cmd_parse( args ):
                 if not os.path.exists(lclOutDir):
                     os.makedirs(lclOutDir)
                 mkFileName = os.path.join(lclOutDir, "Android.mk")
-                file = open(mkFileName, "wt")
-                file.write(moduleMk(staticLib, build_params, staticLibs, None, depMgr, lclDstDir, args, localPath=localPath))
-                file.close()
-                infoMessage("Created %s" % (mkFileName), mkFileVerbosity)
+                writeMk(mkFileName, moduleMk(staticLib, build_params, staticLibs, None, True, lclDstDir, args, localPath=localPath))
         else:
             lclDstDir = getDstPath(libPath, staticRelPath)
             lclOutDir = getOutPath(libPath, staticRelPath)
             if not os.path.exists(lclOutDir):
                 os.makedirs(lclOutDir)
             mkFileName = os.path.join(lclOutDir, "Android.mk")
-            file = open(mkFileName, "wt")
-            i = 0
+            mkData = []
             for staticLib in staticLibs:
-                file.write(moduleMk(staticLib, build_params, staticLibs, None, depMgr, lclDstDir, args, localPath=localPath))
-                file.write("#" * 60 + "\n")
-                i += 1
-            file.close()
-            infoMessage("Created %s" % (mkFileName), mkFileVerbosity)
+                mkData.append(moduleMk(staticLib, build_params, staticLibs, None, True, lclDstDir, args, localPath=localPath))
+                mkData.append("#" * 60 + "\n")
+            writeMk(mkFileName, "".join(mkData))
 
     if sharedObjLib <> None and not omits["shared"]:
         lclDstDir = getDstPath(libPath, sharedRelPath)
@@ -476,44 +539,49 @@ def cmd_parse( args ):
         if not os.path.exists(lclOutDir):
             os.makedirs(lclOutDir)
         mkFileName = os.path.join(lclOutDir, "Android.mk")
-        file = open(mkFileName, "wt")
-        file.write(moduleMk(sharedObjLib, build_params, staticLibs, None, depMgr, lclDstDir, args, localPath=localPath))
-        file.close()
+        writeMk(mkFileName, moduleMk(sharedObjLib, build_params, staticLibs, None, True, lclDstDir, args, localPath=localPath))
         if args.static_libs == None and len(staticLibs) > 0:
-            warningMessage("Computed link order is very likely not accurate.")
+            warningMessage("Link order computed from the include dependencies of the libraries, use --static-libs if it is not accurate.")
             warningMessage("See %s." % (mkFileName))
-        infoMessage("Created %s" % (mkFileName), mkFileVerbosity)
 
     if not omits["top"]:
         if not os.path.isdir(getOutPath(libPath)):
             os.makedirs(getOutPath(libPath))
         topMkFileName = getOutPath(libPath, "Android.mk")
-        file = open(topMkFileName, "wt")
-        file.write("include $(call all-subdir-makefiles)")
-        file.close()
+        writeMk(topMkFileName, "include $(call all-subdir-makefiles)")
 
     if not omits["app"]:
         if not os.path.isdir(applicationDir):
             os.makedirs(applicationDir)
         appMkFileName = os.path.join(applicationDir, "Application.mk")
-        file = open(appMkFileName, "wt")
+        appMkData = []
         libNames = [staticLib['LIBNAME'] for staticLib in staticLibs]
         if sharedObjLib <> None:
             libNames.append(sharedObjLib['LIBNAME'])
-        file.write("APP_MODULES      := %s\n" % (" ".join(libNames)))
+        appMkData.append("APP_MODULES      := %s\n" % (" ".join(libNames)))
         if args.project <> None:
-            file.write("APP_PROJECT_PATH := %s" % (absPath(getDstPath())))
+            appMkData.append("APP_PROJECT_PATH := %s" % (absPath(getDstPath())))
         else:
-            file.write("APP_PROJECT_PATH := $(call my-dir)/project\n")
+            appMkData.append("APP_PROJECT_PATH := $(call my-dir)/project\n")
         if bc_file.dbgmode:
-            file.write("APP_OPTIM      := debug\n")
-        file.close()
+            appMkData.append("APP_OPTIM      := debug\n")
+        writeMk(appMkFileName, "".join(appMkData))
     #
     # The End
     #
+    infoMessage("Makefiles: %d written, %d unchanged" % (mkFileCounts["written"], mkFileCounts["unchanged"]), 1)
     infoMessage("Export done.", 1)
 
 
+#------------------------------------------------------------------------------
+# In-process entry point, called by 'ctx export --plugin' with the export data
+# of the running Contexo and the plugin arguments. The export data is shared
+# with any other plugins of the same export and must not be modified.
+#------------------------------------------------------------------------------
+def export( package, argv ):
+    args = parser.parse_args( argv )
+    args.func( args, package )
+
 ##### ENTRY POINT #############################################################
 
 # Create Parser
@@ -609,5 +677,7 @@ parser.add_argument('-o', '--output',
  the makefiles will be generated at their true
  locations.""")
  
-args = parser.parse_args()
-args.func(args)
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    args.func(args)
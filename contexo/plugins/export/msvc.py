@@ -15,33 +15,6 @@ msgSender = 'MSVC Export'
 
 default_projname = "MSVC_EXPORT"
 
-contexo_config_path = os.path.join( ctx_common.getUserCfgDir(), ctx_sysinfo.CTX_CONFIG_FILENAME )
-infoMessage("Using config file '%s'"%contexo_config_path,  1)
-cfgFile = ctx_cfg.CFGFile( contexo_config_path)
-ctx_common.setInfoMessageVerboseLevel( int(cfgFile.getVerboseLevel()) )
-
-#------------------------------------------------------------------------------
-def create_module_mapping_from_module_list( ctx_module_list ):
-
-    code_module_map = list()
-    print 'mapping'
-    for mod in ctx_module_list:
-        srcFiles = list()
-        privHdrs = list()
-        pubHdrs  = list()
-
-        rawMod = mod #ctx_cmod.CTXRawCodeModule( mod )
-
-        srcs = rawMod.getSourceAbsolutePaths()
-        privHdrs= rawMod.getPrivHeaderAbsolutePaths()
-        pubHdrs = rawMod.getPubHeaderAbsolutePaths()
-        testSrcs = rawMod.getTestSourceAbsolutePaths()
-        testHdrs = rawMod.getTestHeaderAbsolutePaths()
-        modDict = { 'MODNAME': rawMod.getName(), 'SOURCES': srcs, 'PRIVHDRS': privHdrs, 'PUBHDRS': pubHdrs, 'PRIVHDRDIR': rawMod.getPrivHeaderDir(),  'TESTSOURCES':testSrcs , 'TESTHDRS':testHdrs,  'TESTDIR':rawMod.getTestDir()}
-        code_module_map.append( modDict )
-
-    return code_module_map
-
 #------------------------------------------------------------------------------
 def allComponentModules( component_list ):
 
@@ -53,11 +26,12 @@ def allComponentModules( component_list ):
     return modules
 
 #------------------------------------------------------------------------------
-def cmd_parse( args ):
+def cmd_parse( args, package = None ):
     import string
-    infoMessage("Receiving export data from Contexo...", 1)
-    package = ctx_export.CTXExportData()
-    package.receive() # Reads pickled export data from stdin
+    if package == None:
+        infoMessage("Receiving export data from Contexo...", 1)
+        package = ctx_export.CTXExportData()
+        package.receive() # Reads pickled export data from stdin
 
     infoMessage("Received export data:", 4)
     for item in package.export_data.keys():
@@ -77,19 +51,13 @@ def cmd_parse( args ):
 
     modTags     = list()
     incPaths    = list()
-    depRoots    = package.export_data['PATHS']['MODULES']
-    for depRoot in depRoots:
-        incPathCandidates = os.listdir( depRoot )
-        for cand in incPathCandidates:
-            path = os.path.join(depRoot, cand)
-            if contexo.ctx_cmod.isContexoCodeModule( path ):
-                rawMod = contexo.ctx_cmod.CTXRawCodeModule(path)
-                incPaths.append( path )
+    for mod in package.getAllModules():
+        incPaths.append( mod['ROOT'] )
 
-                # Only include private headers for projects containing the specified module
-                #incPaths.append( os.path.join(rawMod.getRootPath(), rawMod.getPrivHeaderDir()) )
+        # Only include private headers for projects containing the specified module
+        #incPaths.append( os.path.join(mod['ROOT'], contexo.ctx_cmod.inc_dirname) )
 
-                modTags.append( 'COMPILING_MOD_' + string.upper( rawMod.getName() ) )
+        modTags.append( mod['TAG'] )
 
     #
     # Collect additional include paths and additional library paths
@@ -177,7 +145,7 @@ def cmd_parse( args ):
     vcprojList = list() # list of dict['PROJNAME':string, 'LIBNAME':string, 'MODULELIST':listof( see doc of make_libvcproj7 ) ]
 
     # Regardless if we export components or modules, all modules are located in export_data['MODULES']
-    module_map = create_module_mapping_from_module_list( package.export_data['MODULES'].values() )
+    module_map = package.getModuleTable().values()
 
     if comp_export and args.mirror_components:
         for comp in package.export_data['COMPONENTS']:
@@ -196,21 +164,28 @@ def cmd_parse( args ):
     if not os.path.exists( args.output ):
         os.makedirs( args.output )
 
-    guidDict = dict()
+    projectArgsList = list()
     for proj in vcprojList:
-        guidDict[proj['PROJNAME']] = contexo.ctx_msvc.make_libvcproj8( proj['PROJNAME'],
-                                                                       build_params.cflags,
-                                                                       build_params.prepDefines + modTags,
-                                                                       proj['MODULELIST'],
-                                                                       proj['LIBNAME'] + '.lib',
-                                                                       debugmode, tests,
-                                                                       incPaths,
-                                                                       args.output,
-                                                                       args.platform,
-                                                                       proj['PROJNAME'],
-                                                                       args.configuration_type,
-                                                                       libNames,
-                                                                       libPaths )
+        projectArgsList.append( ( proj['PROJNAME'],
+                                  build_params.cflags,
+                                  build_params.prepDefines + modTags,
+                                  proj['MODULELIST'],
+                                  proj['LIBNAME'] + '.lib',
+                                  debugmode, tests,
+                                  incPaths,
+                                  args.output,
+                                  args.platform,
+                                  proj['PROJNAME'],
+                                  args.configuration_type,
+                                  libNames,
+                                  libPaths ) )
+
+    # Only projects whose contents changed are written
+    GUIDs, written, unchanged = contexo.ctx_msvc.make_libvcproj8_list( projectArgsList, args.jobs )
+
+    guidDict = dict()
+    for proj, GUID in zip( vcprojList, GUIDs ):
+        guidDict[proj['PROJNAME']] = GUID
 
     #
     # Handle external project if specified
@@ -232,7 +207,10 @@ def cmd_parse( args ):
                                  "KEY":"AdditionalLibraryDirectories",
                                "VALUE":";".join(libPaths) }))
 
-        contexo.ctx_msvc.update_vcproj8(external_vcproj['FILENAME'],attrs)
+        if contexo.ctx_msvc.update_vcproj8(external_vcproj['FILENAME'],attrs):
+            written += 1
+        else:
+            unchanged += 1
 
     #
     # Create solution if specified
@@ -244,15 +222,28 @@ def cmd_parse( args ):
         for proj in vcprojList:
             slnProjects.append( { 'PROJNAME': proj['PROJNAME'], 'PROJGUID': guidDict[proj['PROJNAME']], 'DEBUG': debugmode } )
 
-        contexo.ctx_msvc.make_solution8( args.solution, args.output, slnProjects, external_vcproj, args.platform )
+        if contexo.ctx_msvc.make_solution8( args.solution, args.output, slnProjects, external_vcproj, args.platform ):
+            written += 1
+        else:
+            unchanged += 1
 
 
     #
     # The End
     #
+    infoMessage("Project files: %d written, %d unchanged"%(written, unchanged), 1)
     infoMessage("Export done.", 1)
 
 
+#------------------------------------------------------------------------------
+# In-process entry point, called by 'ctx export --plugin' with the export data
+# of the running Contexo and the plugin arguments. The export data is shared
+# with any other plugins of the same export and must not be modified.
+#------------------------------------------------------------------------------
+def export( package, argv ):
+    args = parser.parse_args( argv )
+    args.func( args, package )
+
 ##### ENTRY POINT #############################################################
 
 # Create Parser
@@ -319,6 +310,10 @@ parser.add_argument('-pl', '--platform', default='Win32',
 parser.add_argument('-o', '--output', default=os.getcwd(),
  help="The output directory for the export.")
 
+parser.add_argument('-j', '--jobs', type=int, default=1,
+ help="""Number of processes rendering projects in parallel when the export
+ generates several projects (see --mirror-components). Defaults to 1.""")
+
 parser.add_argument('-ct', '--configuration-type', default='lib',
  help="""Type of project, whether the project generates a lib or an exe. Default value is 'lib'.
 Accepted values 'exe' or 'lib'.
@@ -327,5 +322,11 @@ Accepted values 'exe' or 'lib'.
 #parser.add_argument('-ld','--libdir', default="", help=standard_description['--libdir'])
 #parser.add_argument('-l', '--lib', help="if the build operation results in a single library, this option sets its name")
 
-args = parser.parse_args()
-args.func(args)
+if __name__ == '__main__':
+    contexo_config_path = os.path.join( ctx_common.getUserCfgDir(), ctx_sysinfo.CTX_CONFIG_FILENAME )
+    infoMessage("Using config file '%s'"%contexo_config_path,  1)
+    cfgFile = ctx_cfg.CFGFile( contexo_config_path)
+    ctx_common.setInfoMessageVerboseLevel( int(cfgFile.getVerboseLevel()) )
+
+    args = parser.parse_args()
+    args.func(args)
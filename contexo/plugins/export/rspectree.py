@@ -24,14 +24,15 @@ footer = """
 """
         
 #------------------------------------------------------------------------------
-def cmd_parse( args ):
+def cmd_parse( args, package = None ):
 
     if sys.platform != 'win32':
         userErrorExit("The RSpec Tree plugin is currently only supported on Windows")
 
-    infoMessage("Receiving export data from Contexo...", 1)
-    package = CTXExportData()
-    package.receive() # Reads pickled export data from stdin
+    if package == None:
+        infoMessage("Receiving export data from Contexo...", 1)
+        package = CTXExportData()
+        package.receive() # Reads pickled export data from stdin
     
     infoMessage("Received export data:", 4)
     for item in package.export_data.keys():
@@ -73,6 +74,15 @@ def cmd_parse( args ):
     
     print "Done"
     
+#------------------------------------------------------------------------------
+# In-process entry point, called by 'ctx export --plugin' with the export data
+# of the running Contexo and the plugin arguments. The export data is shared
+# with any other plugins of the same export and must not be modified.
+#------------------------------------------------------------------------------
+def export( package, argv ):
+    args = parser.parse_args( argv )
+    args.func( args, package )
+
 ##### ENTRY POINT #############################################################
 
 # Create Parser
@@ -88,5 +98,6 @@ parser.add_argument('-o', '--output', default=os.getcwd(),
 parser.add_argument('-nd', '--no-display', action='store_true', 
  help="""If specified, the rendered JPEG image will not be automatically displayed""")
 
-args = parser.parse_args()
-args.func(args)
+if __name__ == '__main__':
+    args = parser.parse_args()
+    args.func(args)
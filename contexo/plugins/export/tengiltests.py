@@ -14,33 +14,6 @@ msgSender = 'MSVC Export'
 
 default_projname = "MSVC_EXPORT"
 
-contexo_config_path = os.path.join( ctx_common.getUserCfgDir(), ctx_sysinfo.CTX_CONFIG_FILENAME )
-infoMessage("Using config file '%s'"%contexo_config_path,  1)
-cfgFile = ctx_cfg.CFGFile( contexo_config_path)
-ctx_common.setInfoMessageVerboseLevel( int(cfgFile.getVerboseLevel()) )
-
-#------------------------------------------------------------------------------
-def create_module_mapping_from_module_list( ctx_module_list ):
-
-    code_module_map = list()
-
-    for mod in ctx_module_list:
-        srcFiles = list()
-        privHdrs = list()
-        pubHdrs  = list()
-
-        rawMod = mod #ctx_cmod.CTXRawCodeModule( mod )
-
-        srcs = rawMod.getSourceAbsolutePaths()
-        privHdrs= rawMod.getPrivHeaderAbsolutePaths()
-        pubHdrs = rawMod.getPubHeaderAbsolutePaths()
-        testSrcs = rawMod.getTestSourceAbsolutePaths()
-
-        modDict = { 'MODNAME': rawMod.getName(), 'SOURCES': srcs, 'PRIVHDRS': privHdrs, 'PUBHDRS': pubHdrs, 'PRIVHDRDIR': rawMod.getPrivHeaderDir(),  'TESTSOURCES':testSrcs ,  'TESTDIR':rawMod.getTestDir()}
-        code_module_map.append( modDict )
-
-    return code_module_map
-
 #------------------------------------------------------------------------------
 def allComponentModules( component_list ):
 
@@ -52,11 +25,12 @@ def allComponentModules( component_list ):
     return modules
 
 #------------------------------------------------------------------------------
-def cmd_parse( args ):
+def cmd_parse( args, package = None ):
     import string
-    infoMessage("Receiving export data from Contexo...", 1)
-    package = ctx_export.CTXExportData()
-    package.receive() # Reads pickled export data from stdin
+    if package == None:
+        infoMessage("Receiving export data from Contexo...", 1)
+        package = ctx_export.CTXExportData()
+        package.receive() # Reads pickled export data from stdin
 
     infoMessage("Received export data:", 4)
     for item in package.export_data.keys():
@@ -69,7 +43,7 @@ def cmd_parse( args ):
 
     #tests = package.export_data['TESTS']
 
-    module_dicts = create_module_mapping_from_module_list( package.export_data['MODULES'].values() )
+    module_dicts = package.getModuleTable().values()
 
     def getFileContents(inputFilePath):
         f = open( inputFilePath, 'rb' )
@@ -117,6 +91,15 @@ def cmd_parse( args ):
     infoMessage("Export done.", 1)
 
 
+#------------------------------------------------------------------------------
+# In-process entry point, called by 'ctx export --plugin' with the export data
+# of the running Contexo and the plugin arguments. The export data is shared
+# with any other plugins of the same export and must not be modified.
+#------------------------------------------------------------------------------
+def export( package, argv ):
+    args = parser.parse_args( argv )
+    args.func( args, package )
+
 ##### ENTRY POINT #############################################################
 
 # Create Parser
@@ -139,5 +122,11 @@ parser.add_argument('-o', '--output', default=os.getcwd(),
 #parser.add_argument('-ld','--libdir', default="", help=standard_description['--libdir'])
 #parser.add_argument('-l', '--lib', help="if the build operation results in a single library, this option sets its name")
 
-args = parser.parse_args()
-args.func(args)
+if __name__ == '__main__':
+    contexo_config_path = os.path.join( ctx_common.getUserCfgDir(), ctx_sysinfo.CTX_CONFIG_FILENAME )
+    infoMessage("Using config file '%s'"%contexo_config_path,  1)
+    cfgFile = ctx_cfg.CFGFile( contexo_config_path)
+    ctx_common.setInfoMessageVerboseLevel( int(cfgFile.getVerboseLevel()) )
+
+    args = parser.parse_args()
+    args.func(args)